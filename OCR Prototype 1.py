@@ -1,15 +1,32 @@
 import cv2 # type: ignore
-import pytesseract # type: ignore
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog, ttk
 from PIL import Image, ImageTk # type: ignore
-import numpy as np # type: ignore
-import json
 import os
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+from nik_engine import (NikExtractor, NikSettings, PreprocessCache, ExtractionCancelled,
+                        DENOISE_MODES)
+from digit_classifier import train_from_folder
+from dataset_store import DatasetStore
+from nik_ensemble import get_ensemble_pool, shutdown_ensemble_pool
+from corrections import get_correction_store
+from image_loader import ImagePyramid, open_image, extract_loaded
+
+# Full-resolution preview waits until slider/method input has been quiet this long
+PREVIEW_DEBOUNCE_MS = 250
+
+# Zoom per mouse wheel notch, and the closest zoom in screen px per full-resolution px
+ZOOM_STEP = 1.25
+MAX_PIXEL_ZOOM = 8.0
+# Rendered canvas tiles kept for panning and zooming back
+TILE_CACHE_SIZE = 192
+# Canvas is re-fitted once resizing has paused this long
+RESIZE_DEBOUNCE_MS = 100
 
 class NumberOCRApp:
     def __init__(self, root):
@@ -19,11 +36,24 @@ class NumberOCRApp:
         
         # Variables
         self.image_path = None
+        # Decoded at reduced resolution (image_loader), full resolution on demand
+        self.loaded_image = None
         self.original_image = None
+        # Canvas px per image px = fit_scale * zoom_level; pan shifts the image
+        # from its centered position, in canvas px
         self.scale_factor = 1.0
+        self.fit_scale = 1.0
         self.zoom_level = 1.0
         self.pan_x = 0
         self.pan_y = 0
+        self.image_offset_x = 0
+        self.image_offset_y = 0
+        # Display levels of the image and the PhotoImage tiles rendered from them
+        self.pyramid = None
+        self.tile_cache = OrderedDict()
+        self.visible_tiles = []
+        self.pan_start = None
+        self.resize_after_id = None
         
         # Selection variables
         self.selection_mode = False
@@ -31,6 +61,10 @@ class NumberOCRApp:
         self.start_y = None
         self.rect_id = None
         self.selection_coords = None
+        # Strip the last extraction read for the selection and its
+        # (bbox, image_key) in the preprocess cache; None for a fresh selection
+        self.ocr_roi = None
+        self.ocr_roi_key = None
         
         # Color picker variables
         self.color_picker_mode = False
@@ -41,12 +75,35 @@ class NumberOCRApp:
         # Preprocessing method
         self.preprocess_method = tk.StringVar(value="adaptive")
         
+        # Color matching: per-channel BGR box or perceptual LAB distance
+        self.use_lab_color = tk.BooleanVar(value=False)
+        
+        # Denoise filter applied before upscaling, "auto" = method default
+        self.denoise_mode = tk.StringVar(value="auto")
+        
         # OCR method
         self.ocr_method = tk.StringVar(value="tesseract")
         
         # Auto-detection settings
         self.auto_detect = tk.BooleanVar(value=True)
         
+        # Headless pipeline, the UI only feeds it settings and shows results
+        # "Auto" runs every preprocessing method in worker processes
+        self.extractor = NikExtractor(pool=get_ensemble_pool())
+        
+        # Preview, extract and dataset save share preprocessed ROIs per image
+        self.preprocess_cache = PreprocessCache(maxsize=32)
+        self.image_id = 0
+        
+        # Heavy OpenCV/OCR work runs here, results come back through root.after
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.current_task = None
+        # Training has its own worker, previews and extractions never cancel it
+        self.training_executor = ThreadPoolExecutor(max_workers=1)
+        self.training_future = None
+        self.preview_after_id = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
         # Training data
         self.training_folder = "number_training_data"
         self.dataset_folder = "number_dataset"
@@ -62,191 +119,6 @@ class NumberOCRApp:
         # Create UI
         self.create_widgets()
     
-    def auto_detect_nik_region(self, image):
-        """Automatically detect NIK region in Indonesian ID card"""
-        # Make a copy to work with
-        img = image.copy()
-        h, w = img.shape[:2]
-        
-        # Fixed NIK locations based on Indonesian ID card structure
-        roi_top = int(h * 0.15)
-        roi_bottom = int(h * 0.25)
-        roi_left = int(w * 0.2)
-        roi_right = int(w * 0.75)
-        
-        # Extract potential NIK region
-        roi = img[roi_top:roi_bottom, roi_left:roi_right]
-        
-        if roi.size == 0:
-            return None
-        
-        # Auto-detect text color from the region
-        self.auto_detect_text_color(roi)
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-        
-        # Apply preprocessing to enhance text
-        processed = self.enhance_nik_region(gray)
-        
-        # Find contours
-        contours, _ = cv2.findContours(processed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # Filter contours by size and aspect ratio
-        potential_nik_contours = []
-        for contour in contours:
-            x, y, cw, ch = cv2.boundingRect(contour)
-            area = cv2.contourArea(contour)
-            
-            # Look for contours that could contain NIK digits
-            if (area > 100 and ch > 15 and cw > 100 and 
-                ch/cw < 1.0 and ch/cw > 0.1):
-                potential_nik_contours.append((x, y, cw, ch))
-        
-        if not potential_nik_contours:
-            # Try alternative approach - look for text blocks
-            return self.find_nik_by_text_structure(roi, roi_left, roi_top)
-        
-        # Sort by position and size
-        potential_nik_contours.sort(key=lambda c: (c[1], c[0]))
-        
-        # Take the largest contour in the top area as potential NIK
-        if potential_nik_contours:
-            x, y, cw, ch = potential_nik_contours[0]
-            
-            # Expand the region slightly
-            padding_x = 10
-            padding_y = 5
-            x = max(0, x - padding_x)
-            y = max(0, y - padding_y)
-            cw = min(roi.shape[1] - x, cw + 2 * padding_x)
-            ch = min(roi.shape[0] - y, ch + 2 * padding_y)
-            
-            # Convert back to original image coordinates
-            abs_x = roi_left + x
-            abs_y = roi_top + y
-            
-            return (abs_x, abs_y, abs_x + cw, abs_y + ch)
-        
-        return None
-    
-    def auto_detect_text_color(self, roi):
-        """Automatically detect text color from region and set tolerance"""
-        if roi.size == 0:
-            return
-        
-        # Convert to different color spaces for better analysis
-        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-        lab = cv2.cvtColor(roi, cv2.COLOR_BGR2LAB)
-        
-        # Calculate standard deviation to determine color variation
-        std_bgr = np.std(roi, axis=(0, 1))
-        avg_std = np.mean(std_bgr)
-        
-        # Auto-adjust tolerance based on color variation
-        # More variation = higher tolerance
-        self.color_tolerance = int(20 + avg_std * 0.5)
-        self.color_tolerance = min(80, max(20, self.color_tolerance))
-        
-        # Update tolerance slider
-        if hasattr(self, 'tolerance_slider'):
-            self.tolerance_slider.set(self.color_tolerance)
-            self.tolerance_label.config(text=str(self.color_tolerance))
-        
-        # Find dominant dark colors (likely text)
-        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        # Get pixels that are likely text (dark areas in binary image)
-        text_mask = binary == 0
-        if np.sum(text_mask) > 0:
-            # Get average color of text regions
-            text_pixels = roi[text_mask]
-            if len(text_pixels) > 0:
-                avg_color = np.median(text_pixels, axis=0)
-                self.target_color = tuple(map(int, avg_color))
-                
-                # Update color display
-                color_rgb = (self.target_color[2], self.target_color[1], self.target_color[0])
-                hex_color = '#{:02x}{:02x}{:02x}'.format(*color_rgb)
-                
-                if hasattr(self, 'color_display'):
-                    self.color_display.config(bg=hex_color)
-                    self.color_label.config(text=f"RGB{color_rgb}")
-                
-                self.preprocess_method.set("color")
-                self.status_label.config(text=f"✓ Auto-detected text color: RGB{color_rgb}, Tolerance: {self.color_tolerance}")
-    
-    def find_nik_by_text_structure(self, roi, roi_left, roi_top):
-        """Find NIK by analyzing text structure and patterns"""
-        # Use OCR to find text that matches NIK pattern
-        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-        enhanced = self.enhance_nik_region(gray)
-        
-        # Try multiple OCR configurations
-        configs = [
-            r'--oem 3 --psm 6',
-            r'--oem 3 --psm 7',
-            r'--oem 3 --psm 8'
-        ]
-        
-        for config in configs:
-            try:
-                text = pytesseract.image_to_string(enhanced, config=config)
-                lines = text.split('\n')
-                
-                for i, line in enumerate(lines):
-                    # Look for 16-digit pattern
-                    digits_only = re.sub(r'[^0-9]', '', line)
-                    if len(digits_only) == 16:
-                        # Found potential NIK, try to locate its position
-                        coords = self.locate_text_position(enhanced, line.strip())
-                        if coords:
-                            x, y, w, h = coords
-                            abs_x = roi_left + x
-                            abs_y = roi_top + y
-                            return (abs_x, abs_y, abs_x + w, abs_y + h)
-            except:
-                continue
-        
-        return None
-    
-    def locate_text_position(self, image, text):
-        """Locate the position of specific text in image"""
-        try:
-            data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
-            
-            for i, detected_text in enumerate(data['text']):
-                if text in detected_text.strip() and len(detected_text.strip()) > 10:
-                    x = data['left'][i]
-                    y = data['top'][i]
-                    w = data['width'][i]
-                    h = data['height'][i]
-                    return (x, y, w, h)
-        except:
-            pass
-        
-        return None
-    
-    def enhance_nik_region(self, gray_image):
-        """Enhance NIK region for better detection"""
-        # Apply bilateral filter to reduce noise while keeping edges sharp
-        denoised = cv2.bilateralFilter(gray_image, 9, 75, 75)
-        
-        # Apply CLAHE for contrast enhancement
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(denoised)
-        
-        # Apply adaptive threshold
-        binary = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                      cv2.THRESH_BINARY, 11, 2)
-        
-        # Apply morphological operations to clean up
-        kernel = np.ones((2, 2), np.uint8)
-        cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-        
-        return cleaned
-
     def create_dataset_structure(self):
         """Create folder structure for digit dataset"""
         if not os.path.exists(self.dataset_folder):
@@ -255,41 +127,21 @@ class NumberOCRApp:
         if not os.path.exists(self.training_folder):
             os.makedirs(self.training_folder)
         
-        for digit in range(10):
-            digit_folder = os.path.join(self.dataset_folder, str(digit))
-            if not os.path.exists(digit_folder):
-                os.makedirs(digit_folder)
+        # Creates the 0-9 folders and keeps the manifest/counts
+        self.dataset_store = DatasetStore(self.dataset_folder)
+        if self.dataset_store.total == 0:
+            # Index digits saved before the manifest existed
+            self.dataset_store.import_legacy()
     
     def load_corrections(self):
-        """Load saved corrections"""
-        correction_file = os.path.join(self.training_folder if hasattr(self, 'training_folder') else ".", "corrections.json")
-        if os.path.exists(correction_file):
-            try:
-                with open(correction_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
-    
-    def save_corrections(self):
-        """Save corrections"""
-        if not os.path.exists(self.training_folder):
-            os.makedirs(self.training_folder)
-        
-        correction_file = os.path.join(self.training_folder, "corrections.json")
-        try:
-            with open(correction_file, 'w') as f:
-                json.dump(self.corrections, f, indent=2)
-        except Exception as e:
-            print(f"Error saving corrections: {e}")
+        """Open the correction store, importing corrections.json the first time"""
+        self.corrections_db = os.path.join(self.training_folder, "corrections.db")
+        legacy_file = os.path.join(self.training_folder, "corrections.json")
+        return get_correction_store(self.corrections_db, legacy_file)
     
     def count_dataset_images(self):
         """Count dataset images"""
-        count = 0
-        if os.path.exists(self.dataset_folder):
-            for root, dirs, files in os.walk(self.dataset_folder):
-                count += len([f for f in files if f.endswith(('.png', '.jpg', '.jpeg'))])
-        return count
+        return self.dataset_store.total
         
     def create_widgets(self):
         control_frame = tk.Frame(self.root, bg="#2C3E50", pady=12)
@@ -345,6 +197,7 @@ class NumberOCRApp:
         
         ocr_methods = [
             ("Tesseract", "tesseract"),
+            ("Digit Model", "classifier"),
         ]
         
         for text, value in ocr_methods:
@@ -361,7 +214,8 @@ class NumberOCRApp:
             ("Adaptive", "adaptive"),
             ("Color", "color"),
             ("Edge", "edge"),
-            ("Contrast", "contrast")
+            ("Contrast", "contrast"),
+            ("Auto", "auto")
         ]
         
         for text, value in methods:
@@ -369,6 +223,14 @@ class NumberOCRApp:
                           value=value, bg="#ECF0F1", font=("Arial", 9),
                           command=self.on_method_change).pack(side=tk.LEFT, padx=5)
         
+        tk.Label(settings_frame, text="Denoise:", 
+                font=("Arial", 10, "bold"), bg="#ECF0F1").pack(side=tk.LEFT, padx=(20, 5))
+        
+        denoise_box = ttk.Combobox(settings_frame, textvariable=self.denoise_mode,
+                                   values=("auto",) + DENOISE_MODES, width=9, state="readonly")
+        denoise_box.pack(side=tk.LEFT, padx=5)
+        denoise_box.bind("<<ComboboxSelected>>", lambda e: self.schedule_preview())
+        
         # Auto-detect checkbox
         auto_frame = tk.Frame(settings_frame, bg="#ECF0F1")
         auto_frame.pack(side=tk.LEFT, padx=20)
@@ -409,10 +271,19 @@ class NumberOCRApp:
                                        font=("Arial", 10, "bold"), bg="#ECF0F1", width=3)
         self.tolerance_label.pack(side=tk.LEFT, padx=5)
         
+        tk.Checkbutton(settings_frame, text="LAB ΔE", variable=self.use_lab_color,
+                      command=self.schedule_preview,
+                      bg="#ECF0F1", font=("Arial", 9)).pack(side=tk.LEFT, padx=5)
+        
         self.status_label = tk.Label(settings_frame, text="Ready", 
                                      font=("Arial", 10), bg="#ECF0F1", fg="#2C3E50")
         self.status_label.pack(side=tk.RIGHT, padx=20)
         
+        # Where the last extraction spent its time (slowest stages)
+        self.trace_label = tk.Label(settings_frame, text="", 
+                                    font=("Arial", 8), bg="#ECF0F1", fg="#7F8C8D")
+        self.trace_label.pack(side=tk.RIGHT, padx=5)
+        
         main_frame = tk.Frame(self.root)
         main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
@@ -427,6 +298,17 @@ class NumberOCRApp:
         self.canvas.bind("<ButtonRelease-1>", self.on_mouse_up)
         self.canvas.bind("<Motion>", self.on_mouse_move)
         
+        # Wheel zooms at the cursor, right/middle drag pans, double right-click fits
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+        for button in (2, 3):
+            self.canvas.bind(f"<ButtonPress-{button}>", self.on_pan_start)
+            self.canvas.bind(f"<B{button}-Motion>", self.on_pan_drag)
+            self.canvas.bind(f"<ButtonRelease-{button}>", self.on_pan_end)
+        self.canvas.bind("<Double-Button-3>", self.reset_view)
+        self.canvas.bind("<Configure>", self.on_canvas_resize)
+        
         right_frame = tk.Frame(main_frame, width=400)
         right_frame.pack(side=tk.RIGHT, fill=tk.BOTH)
         right_frame.pack_propagate(False)
@@ -515,10 +397,64 @@ class NumberOCRApp:
                  bg="#9B59B6", fg="white", font=("Arial", 9, "bold"),
                  padx=15, pady=8, cursor="hand2").pack(fill=tk.X, pady=2)
         
+        tk.Button(action_frame, text="🧠 Train Digit Model", command=self.train_digit_model,
+                 bg="#34495E", fg="white", font=("Arial", 9, "bold"),
+                 padx=15, pady=8, cursor="hand2").pack(fill=tk.X, pady=2)
+        
         self.confidence_label = tk.Label(results_frame, text="", 
                                         font=("Arial", 9), bg="#ECF0F1", fg="#7F8C8D")
         self.confidence_label.pack(pady=(10, 0))
     
+    def run_task(self, func, on_done):
+        """Run func(cancel) on the worker pool and hand the result to on_done on the Tk thread.
+        
+        Starting a task supersedes the one in flight: its cancel event is set
+        and its result, if it still arrives, is dropped.
+        """
+        self.cancel_task()
+        
+        cancel = threading.Event()
+        future = self.executor.submit(func, cancel)
+        self.current_task = (future, cancel)
+        self.root.after(20, self.poll_task, future, cancel, on_done)
+    
+    def poll_task(self, future, cancel, on_done):
+        """Deliver a finished task on the Tk thread"""
+        if not future.done():
+            self.root.after(20, self.poll_task, future, cancel, on_done)
+            return
+        
+        if cancel.is_set():
+            return
+        self.current_task = None
+        
+        try:
+            result = future.result()
+        except ExtractionCancelled:
+            return
+        except Exception as e:
+            self.status_label.config(text="❌ Extraction failed")
+            messagebox.showerror("Error", f"Extraction failed: {str(e)}")
+            import traceback
+            traceback.print_exception(type(e), e, e.__traceback__)
+            return
+        
+        on_done(result)
+    
+    def cancel_task(self):
+        """Cancel the task in flight, if any"""
+        if self.current_task is not None:
+            self.current_task[1].set()
+            self.current_task = None
+    
+    def on_close(self):
+        """Cancel pending work and close the window"""
+        self.cancel_task()
+        self.executor.shutdown(wait=False)
+        self.training_executor.shutdown(wait=False)
+        shutdown_ensemble_pool()
+        self.root.destroy()
+    
     def auto_detect_and_extract(self):
         """Automatically detect NIK region and extract numbers"""
         if self.original_image is None:
@@ -526,32 +462,71 @@ class NumberOCRApp:
             return
         
         self.status_label.config(text="🕵️ Auto-detecting NIK region...")
-        self.root.update()
+        self.cancel_scheduled_preview()
         
-        # Auto-detect NIK region
-        nik_region = self.auto_detect_nik_region(self.original_image)
+        loaded = self.loaded_image
+        settings = self.current_settings()
+        image_key = self.image_id
         
-        if nik_region:
-            x1, y1, x2, y2 = nik_region
-            self.selection_coords = nik_region
-            
-            # Draw selection rectangle on canvas
-            self.draw_selection_rectangle(x1, y1, x2, y2)
-            
-            # Update preview
-            roi = self.original_image[y1:y2, x1:x2]
-            self.update_preview(roi)
-            
-            self.status_label.config(text="✓ NIK region auto-detected - Extracting numbers...")
-            self.root.update()
-            
-            # Extract numbers
-            self.extract_numbers()
+        def task(cancel):
+            return extract_loaded(self.extractor, loaded, settings=settings,
+                                  cache=self.preprocess_cache, image_key=image_key, cancel=cancel)
+        
+        self.run_task(task, self.on_auto_detect_done)
+    
+    def on_auto_detect_done(self, result):
+        """Show auto-detection result"""
+        if result.bbox:
+            self.show_result(result)
         else:
             self.status_label.config(text="❌ Could not auto-detect NIK region. Please select manually.")
             messagebox.showwarning("Auto-detection Failed", 
                                  "Could not automatically detect NIK region. Please use manual selection.")
     
+    def show_result(self, result):
+        """Apply an engine result to the UI"""
+        self.selection_coords = result.bbox
+        x1, y1, x2, y2 = result.bbox
+        self.draw_selection_rectangle(x1, y1, x2, y2)
+        # Preview, segmentation and dataset crops use what OCR read, which is
+        # the rectified card crop when the card was straightened
+        if result.roi is not None:
+            self.ocr_roi, self.ocr_roi_key = result.roi, result.roi_key
+        
+        if result.color_detected:
+            self.set_target_color(result.target_color, result.tolerance)
+            # "color", or still "auto" when the ensemble was selected
+            self.preprocess_method.set(result.method)
+        
+        roi, _, _ = self.current_roi()
+        self.last_processed_image = roi.copy()
+        self.update_preview()
+        method_name = "Digit Model" if result.ocr_engine == "classifier" else "Tesseract"
+        if result.correction:
+            method_name += f" + {result.correction} correction"
+        self.display_result(result.raw, method_name)
+        if result.digit_count == 16 and not result.valid:
+            self.status_label.config(
+                text=f"⚠️ 16 digits read but not a valid NIK: {result.problems[0]} ({method_name})")
+        # Corrections are learned against what OCR actually read
+        self.last_raw_result = result.ocr_raw
+        if result.trace:
+            total = result.timings.get("total", 0.0) * 1000
+            self.trace_label.config(text=f"⏱ {total:.0f}ms: {result.trace.summary()}")
+    
+    def set_target_color(self, target_color, tolerance=None):
+        """Update the target color (BGR) and its swatch"""
+        self.target_color = tuple(target_color)
+        if tolerance is not None:
+            self.color_tolerance = tolerance
+            self.tolerance_slider.set(tolerance)
+            self.tolerance_label.config(text=str(tolerance))
+        
+        color_rgb = (self.target_color[2], self.target_color[1], self.target_color[0])
+        hex_color = '#{:02x}{:02x}{:02x}'.format(*color_rgb)
+        self.color_display.config(bg=hex_color)
+        self.color_label.config(text=f"RGB{color_rgb}")
+    
     def draw_selection_rectangle(self, x1, y1, x2, y2):
         """Draw selection rectangle on canvas"""
         # Convert to canvas coordinates
@@ -572,10 +547,35 @@ class NumberOCRApp:
 
     def on_method_change(self):
         """Handle preprocessing method change"""
+        self.schedule_preview()
+    
+    def schedule_preview(self):
+        """Show a low-resolution preview now and the full one once input settles"""
+        if not self.selection_coords or self.original_image is None:
+            return
+        
+        roi, _, _ = self.current_roi()
+        if roi.size == 0:
+            return
+        
+        # Any full-resolution work in flight is for stale settings now
+        self.cancel_task()
+        self.show_processed(self.extractor.preview(roi, self.current_settings()))
+        
+        self.cancel_scheduled_preview()
+        self.preview_after_id = self.root.after(PREVIEW_DEBOUNCE_MS, self.on_preview_settled)
+    
+    def cancel_scheduled_preview(self):
+        """Drop a pending debounced preview"""
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+            self.preview_after_id = None
+    
+    def on_preview_settled(self):
+        """Input settled, compute the full-resolution preview"""
+        self.preview_after_id = None
         if self.selection_coords and self.original_image is not None:
-            x1, y1, x2, y2 = self.selection_coords
-            roi = self.original_image[y1:y2, x1:x2]
-            self.update_preview(roi)
+            self.update_preview()
     
     def manual_color_input(self):
         """Manual color input dialog"""
@@ -637,9 +637,7 @@ class NumberOCRApp:
                 self.status_label.config(text=f"✓ Color set: RGB({r},{g},{b})")
                 
                 if self.selection_coords:
-                    x1, y1, x2, y2 = self.selection_coords
-                    roi = self.original_image[y1:y2, x1:x2]
-                    self.update_preview(roi)
+                    self.update_preview()
                 
                 dialog.destroy()
             except Exception as e:
@@ -652,11 +650,7 @@ class NumberOCRApp:
         """Handle tolerance change"""
         self.color_tolerance = int(value)
         self.tolerance_label.config(text=str(int(value)))
-        
-        if self.selection_coords and self.original_image is not None:
-            x1, y1, x2, y2 = self.selection_coords
-            roi = self.original_image[y1:y2, x1:x2]
-            self.update_preview(roi)
+        self.schedule_preview()
     
     def toggle_color_picker(self):
         """Toggle color picker mode"""
@@ -740,12 +734,8 @@ class NumberOCRApp:
         y = max(0, min(y, h-1))
         
         color_bgr = self.original_image[y, x]
-        self.target_color = tuple(map(int, color_bgr))
-        
+        self.set_target_color(tuple(map(int, color_bgr)))
         color_rgb = (self.target_color[2], self.target_color[1], self.target_color[0])
-        hex_color = '#{:02x}{:02x}{:02x}'.format(*color_rgb)
-        self.color_display.config(bg=hex_color)
-        self.color_label.config(text=f"RGB{color_rgb}")
         
         self.preprocess_method.set("color")
         
@@ -758,9 +748,7 @@ class NumberOCRApp:
             self.zoom_window = None
         
         if self.selection_coords:
-            x1, y1, x2, y2 = self.selection_coords
-            roi = self.original_image[y1:y2, x1:x2]
-            self.update_preview(roi)
+            self.update_preview()
     
     def load_image(self):
         """Load image"""
@@ -771,12 +759,21 @@ class NumberOCRApp:
         
         if file_path:
             self.image_path = file_path
-            self.original_image = cv2.imread(file_path)
+            self.loaded_image = open_image(file_path)
+            self.original_image = self.loaded_image.image if self.loaded_image else None
+            self.pyramid = None
+            self.tile_cache.clear()
+            self.image_id += 1
+            self.preprocess_cache.clear()
             
             if self.original_image is None:
                 messagebox.showerror("Error", "Failed to load image!")
                 return
             
+            self.pyramid = ImagePyramid(self.loaded_image)
+            self.zoom_level = 1.0
+            self.pan_x = self.pan_y = 0
+            
             self.clear_selection()
             self.display_image()
             
@@ -784,40 +781,175 @@ class NumberOCRApp:
             if self.auto_detect.get():
                 self.auto_detect_and_extract()
             else:
-                self.status_label.config(text="✓ Image loaded - Select the NIK number area")
+                w, h = self.loaded_image.full_size
+                reduced = f", decoded at 1/{self.loaded_image.reduction}" if self.loaded_image.reduction > 1 else ""
+                self.status_label.config(text=f"✓ Image loaded ({w}x{h}{reduced}) - Select the NIK number area")
+    
+    def canvas_size(self):
+        """Current canvas size, with a default before the window is mapped"""
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        if canvas_width <= 1 or canvas_height <= 1:
+            return 1000, 600
+        return canvas_width, canvas_height
     
     def display_image(self):
-        """Display image on canvas"""
+        """Fit the image to the canvas and draw it at the current zoom and pan"""
         if self.original_image is None:
             return
         
-        image_rgb = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB)
-        
         self.canvas.update()
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
-        
-        if canvas_width <= 1 or canvas_height <= 1:
-            canvas_width = 1000
-            canvas_height = 600
-        
-        h, w = image_rgb.shape[:2]
-        self.scale_factor = min(canvas_width/w, canvas_height/h, 1.0)
-        new_w, new_h = int(w * self.scale_factor), int(h * self.scale_factor)
+        canvas_width, canvas_height = self.canvas_size()
+        h, w = self.original_image.shape[:2]
+        self.fit_scale = min(canvas_width/w, canvas_height/h, 1.0)
+        self.render_view()
+    
+    def render_view(self):
+        """Draw the tiles of the best pyramid level that cover the visible canvas"""
+        if self.pyramid is None:
+            return
         
-        resized = cv2.resize(image_rgb, (new_w, new_h), interpolation=cv2.INTER_AREA)
-        pil_image = Image.fromarray(resized)
-        self.photo = ImageTk.PhotoImage(pil_image)
+        canvas_width, canvas_height = self.canvas_size()
+        self.scale_factor = self.fit_scale * self.zoom_level
+        self.clamp_pan(canvas_width, canvas_height)
+        ox, oy = self.image_offset_x, self.image_offset_y
+        
+        level = self.pyramid.level_for(self.scale_factor)
+        # Canvas px per level px, at most 1 except past full resolution
+        k = self.scale_factor / self.pyramid.level_scale(level)
+        visible = self.pyramid.tiles(level, -ox / k, -oy / k,
+                                     (canvas_width - ox) / k, (canvas_height - oy) / k)
+        
+        self.canvas.delete("tile")
+        self.visible_tiles = []
+        for tx, ty in visible:
+            photo, (left, top) = self.render_tile(level, tx, ty, k)
+            if photo is None:
+                continue
+            self.visible_tiles.append(photo)
+            self.canvas.create_image(ox + left, oy + top, image=photo, anchor=tk.NW, tags="tile")
+        self.canvas.tag_lower("tile")
         
-        self.canvas.delete("all")
-        self.canvas.create_image(canvas_width//2, canvas_height//2, 
-                                image=self.photo, anchor=tk.CENTER)
+        if self.selection_coords:
+            self.draw_selection_rectangle(*self.selection_coords)
+    
+    def render_tile(self, level, tx, ty, k):
+        """PhotoImage of one pyramid tile at k canvas px per level px and its offset"""
+        key = (level, tx, ty, round(k, 6))
+        cached = self.tile_cache.get(key)
+        if cached is not None:
+            self.tile_cache.move_to_end(key)
+            return cached
+        
+        pixels, (x, y) = self.pyramid.tile(level, tx, ty)
+        th, tw = pixels.shape[:2]
+        # Edges are rounded from the image origin so neighbouring tiles meet exactly
+        left, top = int(round(x * k)), int(round(y * k))
+        width = int(round((x + tw) * k)) - left
+        height = int(round((y + th) * k)) - top
+        photo = None
+        if width > 0 and height > 0:
+            interp = cv2.INTER_AREA if k < 1.0 else cv2.INTER_LINEAR
+            resized = cv2.resize(pixels, (width, height), interpolation=interp)
+            photo = ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)))
+        
+        self.tile_cache[key] = (photo, (left, top))
+        while len(self.tile_cache) > TILE_CACHE_SIZE:
+            self.tile_cache.popitem(last=False)
+        return photo, (left, top)
+    
+    def clamp_pan(self, canvas_width, canvas_height):
+        """Center an image smaller than the canvas, otherwise keep it covering the canvas"""
+        h, w = self.original_image.shape[:2]
+        offsets = []
+        for pan, shown, size in ((self.pan_x, w * self.scale_factor, canvas_width),
+                                 (self.pan_y, h * self.scale_factor, canvas_height)):
+            center = (size - shown) / 2.0
+            if shown <= size:
+                offset = center
+            else:
+                offset = min(0.0, max(size - shown, center + pan))
+            offsets.append((int(round(offset)), offset - center))
+        (self.image_offset_x, self.pan_x), (self.image_offset_y, self.pan_y) = offsets
+    
+    def zoom_at(self, x, y, factor):
+        """Zoom by factor, keeping the image point under canvas (x, y) in place"""
+        max_zoom = MAX_PIXEL_ZOOM * self.loaded_image.reduction / self.fit_scale
+        zoom = min(max(self.zoom_level * factor, 1.0), max(1.0, max_zoom))
+        if zoom == self.zoom_level:
+            return
         
-        self.image_offset_x = (canvas_width - new_w) // 2
-        self.image_offset_y = (canvas_height - new_h) // 2
+        image_x = (x - self.image_offset_x) / self.scale_factor
+        image_y = (y - self.image_offset_y) / self.scale_factor
+        canvas_width, canvas_height = self.canvas_size()
+        h, w = self.original_image.shape[:2]
+        scale = self.fit_scale * zoom
+        self.zoom_level = zoom
+        self.pan_x = x - image_x * scale - (canvas_width - w * scale) / 2.0
+        self.pan_y = y - image_y * scale - (canvas_height - h * scale) / 2.0
+        self.render_view()
+        self.status_label.config(text=f"🔍 Zoom {self.zoom_level * self.fit_scale * 100:.0f}% "
+                                      f"(double right-click to fit)")
+    
+    def on_mouse_wheel(self, event):
+        """Zoom in/out at the cursor"""
+        if self.pyramid is None:
+            return
+        zoom_in = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.zoom_at(event.x, event.y, ZOOM_STEP if zoom_in else 1.0 / ZOOM_STEP)
+    
+    def on_pan_start(self, event):
+        """Start dragging the view"""
+        if self.pyramid is None:
+            return
+        self.pan_start = (event.x, event.y, self.pan_x, self.pan_y)
+        self.canvas.config(cursor="fleur")
     
-    def update_preview(self, roi):
+    def on_pan_drag(self, event):
+        """Move the view with the mouse"""
+        if self.pan_start is None:
+            return
+        x, y, pan_x, pan_y = self.pan_start
+        self.pan_x = pan_x + event.x - x
+        self.pan_y = pan_y + event.y - y
+        self.render_view()
+    
+    def on_pan_end(self, event):
+        """Stop dragging the view"""
+        self.pan_start = None
+        self.canvas.config(cursor="crosshair" if self.color_picker_mode else "cross")
+    
+    def reset_view(self, event=None):
+        """Fit the whole image again"""
+        self.zoom_level = 1.0
+        self.pan_x = self.pan_y = 0
+        self.render_view()
+    
+    def on_canvas_resize(self, event):
+        """Re-fit the image once the canvas stops resizing"""
+        if self.resize_after_id is not None:
+            self.root.after_cancel(self.resize_after_id)
+        self.resize_after_id = self.root.after(RESIZE_DEBOUNCE_MS, self.on_resize_settled)
+    
+    def on_resize_settled(self):
+        self.resize_after_id = None
+        self.display_image()
+    
+    def current_roi(self):
+        """``(roi, bbox, image_key)`` of the selection, as cached by the preprocess cache.
+        
+        After an extraction this is the strip OCR read; for a fresh manual
+        selection it is the slice of the working image.
+        """
+        if self.ocr_roi is not None:
+            bbox, image_key = self.ocr_roi_key
+            return self.ocr_roi, bbox, image_key
+        x1, y1, x2, y2 = self.selection_coords
+        return self.original_image[y1:y2, x1:x2], self.selection_coords, self.image_id
+    
+    def update_preview(self):
         """Update preview canvases"""
+        roi, bbox, image_key = self.current_roi()
         if roi is None or roi.size == 0:
             return
         
@@ -839,7 +971,14 @@ class NumberOCRApp:
             self.preview_canvas.delete("all")
             self.preview_canvas.create_image(180, 60, image=self.preview_photo, anchor=tk.CENTER)
         
-        processed = self.preprocess_for_numbers(roi)
+        settings = self.current_settings()
+        self.run_task(lambda cancel: self.preprocess_entry(roi, bbox, settings, image_key),
+                      lambda entry: self.show_processed(entry.processed))
+    
+    def show_processed(self, processed):
+        """Draw the preprocessed ROI on the processed preview canvas"""
+        max_width = 360
+        max_height = 120
         h_proc, w_proc = processed.shape[:2]
         
         scale = min(max_width / w_proc, max_height / h_proc, 3.0)
@@ -917,10 +1056,10 @@ class NumberOCRApp:
         
         if x2 - x1 > 10 and y2 - y1 > 5:
             self.selection_coords = (x1, y1, x2, y2)
+            self.ocr_roi = self.ocr_roi_key = None
             self.status_label.config(text=f"✓ Selected: {x2-x1}x{y2-y1}px")
             
-            roi = self.original_image[y1:y2, x1:x2]
-            self.update_preview(roi)
+            self.update_preview()
         else:
             self.status_label.config(text="❌ Selection too small")
             if self.rect_id:
@@ -930,7 +1069,10 @@ class NumberOCRApp:
     
     def clear_selection(self):
         """Clear selection"""
+        self.cancel_task()
+        self.cancel_scheduled_preview()
         self.selection_coords = None
+        self.ocr_roi = self.ocr_roi_key = None
         self.selection_mode = False
         self.color_picker_mode = False
         if self.rect_id:
@@ -949,75 +1091,32 @@ class NumberOCRApp:
         for entry in self.digit_entries:
             entry.delete(0, tk.END)
     
-    def preprocess_for_numbers(self, image):
-        """Advanced preprocessing for NIK number recognition"""
-        method = self.preprocess_method.get()
-        
-        if len(image.shape) == 3:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = image.copy()
-        
-        scale = 5.0
-        height, width = gray.shape
-        gray = cv2.resize(gray, (int(width * scale), int(height * scale)), 
-                         interpolation=cv2.INTER_CUBIC)
-        
-        if method == "color" and self.target_color is not None:
-            scaled_img = cv2.resize(image, (int(image.shape[1] * scale), int(image.shape[0] * scale)), 
-                                   interpolation=cv2.INTER_CUBIC)
-            
-            lower = np.array([max(0, self.target_color[i] - self.color_tolerance) for i in range(3)])
-            upper = np.array([min(255, self.target_color[i] + self.color_tolerance) for i in range(3)])
-            
-            mask = cv2.inRange(scaled_img, lower, upper)
-            result = np.ones_like(mask) * 255
-            result[mask > 0] = 0
-            
-            kernel = np.ones((2,2), np.uint8)
-            result = cv2.morphologyEx(result, cv2.MORPH_CLOSE, kernel, iterations=1)
-            result = cv2.morphologyEx(result, cv2.MORPH_OPEN, kernel, iterations=1)
-            
-            return result
-        
-        elif method == "edge":
-            denoised = cv2.fastNlMeansDenoising(gray, None, h=10, templateWindowSize=7, searchWindowSize=21)
-            edges = cv2.Canny(denoised, 50, 150)
-            kernel = np.ones((3,3), np.uint8)
-            dilated = cv2.dilate(edges, kernel, iterations=2)
-            filled = cv2.morphologyEx(dilated, cv2.MORPH_CLOSE, kernel, iterations=2)
-            return filled
-        
-        elif method == "contrast":
-            denoised = cv2.fastNlMeansDenoising(gray, None, h=15, templateWindowSize=7, searchWindowSize=21)
-            clahe = cv2.createCLAHE(clipLimit=4.0, tileGridSize=(4,4))
-            enhanced = clahe.apply(denoised)
-            kernel_sharpen = np.array([[-1,-1,-1], [-1, 9,-1], [-1,-1,-1]])
-            sharpened = cv2.filter2D(enhanced, -1, kernel_sharpen)
-            _, binary = cv2.threshold(sharpened, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            kernel = np.ones((2,2), np.uint8)
-            cleaned = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, iterations=1)
-            return cleaned
-        
-        else:
-            denoised = cv2.fastNlMeansDenoising(gray, None, h=12, templateWindowSize=7, searchWindowSize=21)
-            bilateral = cv2.bilateralFilter(denoised, 9, 75, 75)
-            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-            enhanced = clahe.apply(bilateral)
-            
-            binary1 = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                           cv2.THRESH_BINARY, blockSize=15, C=10)
-            binary2 = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                           cv2.THRESH_BINARY, blockSize=25, C=15)
-            binary = cv2.bitwise_and(binary1, binary2)
-            
-            kernel_small = np.ones((2,2), np.uint8)
-            kernel_medium = np.ones((3,3), np.uint8)
-            opened = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel_small, iterations=1)
-            closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, kernel_medium, iterations=1)
-            cleaned = cv2.medianBlur(closed, 3)
-            
-            return cleaned
+    def current_settings(self):
+        """Snapshot the Tk settings into engine settings"""
+        return NikSettings(method=self.preprocess_method.get(),
+                           target_color=self.target_color,
+                           tolerance=self.color_tolerance,
+                           color_space="lab" if self.use_lab_color.get() else "bgr",
+                           denoise=None if self.denoise_mode.get() == "auto" else self.denoise_mode.get(),
+                           ocr_engine=self.ocr_method.get(),
+                           model_path=os.path.join(self.model_folder, "digit_knn.npz"),
+                           corrections_path=self.corrections_db)
+    
+    def preprocess_for_numbers(self, image, bbox=None):
+        """Preprocess ROI with the current settings, cached when bbox is known"""
+        return self.preprocess_entry(image, bbox).processed
+    
+    def preprocess_entry(self, image, bbox=None, settings=None, image_key=None):
+        """Cache entry for the ROI at bbox.
+        
+        Worker threads must pass settings and image_key snapshot on the Tk thread.
+        """
+        settings = settings or self.current_settings()
+        if image_key is None:
+            image_key = self.image_id
+        return self.extractor.preprocess_cached(image, bbox, settings,
+                                                self.preprocess_cache,
+                                                image_key if bbox else None)
     
     def extract_numbers(self):
         """Extract NIK numbers using selected OCR method"""
@@ -1044,31 +1143,20 @@ class NumberOCRApp:
     
     def extract_numbers_tesseract(self):
         """Extract using Tesseract OCR"""
-        x1, y1, x2, y2 = self.selection_coords
-        roi = self.original_image[y1:y2, x1:x2]
-        
-        self.last_processed_image = roi.copy()
-        self.update_preview(roi)
-        
-        processed = self.preprocess_for_numbers(roi)
+        self.status_label.config(text="⏳ Extracting NIK...")
+        self.cancel_scheduled_preview()
         
-        configs = [
-            r'--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789',
-            r'--oem 3 --psm 8 -c tessedit_char_whitelist=0123456789',
-            r'--oem 3 --psm 13 -c tessedit_char_whitelist=0123456789',
-        ]
+        loaded = self.loaded_image
+        bbox = self.selection_coords
+        settings = self.current_settings()
+        image_key = self.image_id
         
-        best_result = ""
-        for config in configs:
-            try:
-                text = pytesseract.image_to_string(processed, config=config)
-                numbers_only = re.sub(r'[^0-9]', '', text)
-                if len(numbers_only) > len(best_result):
-                    best_result = numbers_only
-            except:
-                continue
+        def task(cancel):
+            return extract_loaded(self.extractor, loaded, bbox=bbox, settings=settings,
+                                  cache=self.preprocess_cache, image_key=image_key,
+                                  cancel=cancel)
         
-        self.display_result(best_result, "Tesseract")
+        self.run_task(task, self.show_result)
     
     def display_result(self, result, method_name):
         """Display extraction result"""
@@ -1116,8 +1204,7 @@ class NumberOCRApp:
             return
         
         if self.last_raw_result:
-            self.corrections[self.last_raw_result] = digits
-            self.save_corrections()
+            self.corrections.add(self.last_raw_result, digits)
             messagebox.showinfo("Success", f"Correction saved!\n{self.last_raw_result} → {digits}")
             self.status_label.config(text=f"✓ Correction saved: {digits}")
     
@@ -1157,19 +1244,12 @@ class NumberOCRApp:
             return
         
         saved_count = 0
+        method = self.preprocess_method.get()
         for i, digit_img in enumerate(digit_images[:16]):
-            digit_label = corrected_digits[i]
-            digit_folder = os.path.join(self.dataset_folder, digit_label)
-            
-            if not os.path.exists(digit_folder):
-                os.makedirs(digit_folder)
-            
-            timestamp = int(os.times().elapsed * 1000)
-            filename = f"digit_{timestamp}_{i}.png"
-            filepath = os.path.join(digit_folder, filename)
-            
-            cv2.imwrite(filepath, digit_img)
-            saved_count += 1
+            record = self.dataset_store.add(digit_img, corrected_digits[i],
+                                            source=self.image_path, position=i, method=method)
+            if record is not None:
+                saved_count += 1
         
         new_count = self.count_dataset_images()
         self.dataset_label.config(text=f"📊 Dataset: {new_count}")
@@ -1179,50 +1259,51 @@ class NumberOCRApp:
             f"Total dataset size: {new_count} images")
         self.status_label.config(text=f"✓ Saved {saved_count} digits to dataset")
     
-    def get_digit_images(self):
-        """Get segmented digit images"""
-        if self.selection_coords is None:
-            return []
-        
-        x1, y1, x2, y2 = self.selection_coords
-        roi = self.original_image[y1:y2, x1:x2]
-        processed = self.preprocess_for_numbers(roi)
+    def train_digit_model(self):
+        """Train the digit classifier from the dataset folder in the background.
+        
+        Runs outside run_task, so previews and extractions started meanwhile
+        do not cancel it or drop its result.
+        """
+        if self.training_future is not None:
+            messagebox.showinfo("Training", "The digit model is already being trained.")
+            return
         
-        return self.segment_digits(processed)
+        model_path = os.path.join(self.model_folder, "digit_knn.npz")
+        self.status_label.config(text="🧠 Training digit model...")
+        self.training_future = self.training_executor.submit(
+            train_from_folder, self.dataset_folder, model_path, store=self.dataset_store)
+        self.root.after(100, self.poll_training, model_path)
     
-    def segment_digits(self, processed_img):
-        """Segment individual digits from processed image"""
-        contours, _ = cv2.findContours(255 - processed_img, cv2.RETR_EXTERNAL, 
-                                       cv2.CHAIN_APPROX_SIMPLE)
+    def poll_training(self, model_path):
+        """Report the finished training on the Tk thread"""
+        future = self.training_future
+        if not future.done():
+            self.root.after(100, self.poll_training, model_path)
+            return
+        self.training_future = None
         
-        if not contours:
-            return []
+        try:
+            count = future.result()
+        except Exception as e:
+            self.status_label.config(text="❌ Training failed")
+            messagebox.showerror("Error", f"Training failed: {str(e)}")
+            import traceback
+            traceback.print_exception(type(e), e, e.__traceback__)
+            return
         
-        digit_contours = []
-        h, w = processed_img.shape
-        min_area = (h * w) * 0.001
+        self.status_label.config(text=f"✓ Digit model trained on {count} samples")
+        messagebox.showinfo("Success", f"Digit model trained on {count} samples!\n{model_path}")
+    
+    def get_digit_images(self):
+        """Get segmented digit images"""
+        if self.selection_coords is None:
+            return []
         
-        for cnt in contours:
-            x, y, cw, ch = cv2.boundingRect(cnt)
-            area = cv2.contourArea(cnt)
-            
-            if area > min_area and 0.2 < ch/cw < 5:
-                digit_contours.append((x, y, cw, ch))
-        
-        digit_contours.sort(key=lambda c: c[0])
-        
-        digits = []
-        for x, y, cw, ch in digit_contours:
-            pad = 2
-            x1 = max(0, x - pad)
-            y1 = max(0, y - pad)
-            x2 = min(w, x + cw + pad)
-            y2 = min(h, y + ch + pad)
-            
-            digit_img = processed_img[y1:y2, x1:x2]
-            digits.append(digit_img)
+        roi, bbox, image_key = self.current_roi()
+        entry = self.preprocess_entry(roi, bbox, image_key=image_key)
         
-        return digits
+        return self.extractor.segment_cached(entry)
     
     def clear_all(self):
         """Clear everything"""
@@ -0,0 +1,175 @@
+"""Correction store consulted after OCR.
+
+Manual corrections are kept in SQLite (``number_training_data/corrections.db``)
+instead of rewriting ``corrections.json`` on every save. Two kinds of
+knowledge are derived from them:
+
+* exact raw -> corrected pairs, for reads that were already fixed once
+* per-position digit confusion counts (e.g. Tesseract reads 7 where the card
+  has 1 at position 13), used to repair new reads without a second OCR pass
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+NIK_LENGTH = 16
+
+# A confusion is applied when it explains at least this share of the reads of
+# that digit at that position, backed by at least MIN_CONFUSION_COUNT saves
+MIN_CONFUSION_RATIO = 0.5
+MIN_CONFUSION_COUNT = 3
+
+# Digits read with at least this confidence are never rewritten
+MAX_CONFIDENCE_TO_REWRITE = 90.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS corrections (
+    raw TEXT PRIMARY KEY,
+    corrected TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 1,
+    updated TEXT
+);
+CREATE TABLE IF NOT EXISTS confusion (
+    position INTEGER NOT NULL,
+    read TEXT NOT NULL,
+    actual TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (position, read, actual)
+);
+"""
+
+
+class CorrectionStore:
+    """SQLite-backed corrections with an in-memory confusion table"""
+    def __init__(self, db_path, legacy_json=None):
+        parent = os.path.dirname(db_path)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        # (position, read) -> {actual: count}, small enough to keep in memory
+        self.confusion = {}
+        for position, read, actual, count in self._conn.execute(
+                "SELECT position, read, actual, count FROM confusion"):
+            self.confusion.setdefault((position, read), {})[actual] = count
+
+        if legacy_json and os.path.exists(legacy_json) and len(self) == 0:
+            self.import_json(legacy_json)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM corrections").fetchone()[0]
+
+    def import_json(self, json_path):
+        """One-off import of the old corrections.json"""
+        try:
+            with open(json_path, 'r') as f:
+                pairs = json.load(f)
+        except (ValueError, OSError):
+            return 0
+        for raw, corrected in pairs.items():
+            self.add(raw, corrected)
+        return len(pairs)
+
+    def add(self, raw, corrected):
+        """Record one manual correction, O(1) in the number of stored corrections"""
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        pairs = []
+        if len(raw) == NIK_LENGTH and len(corrected) == NIK_LENGTH:
+            pairs = [(i, r, c) for i, (r, c) in enumerate(zip(raw, corrected))]
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO corrections (raw, corrected, count, updated) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(raw) DO UPDATE SET corrected = excluded.corrected, "
+                "count = count + 1, updated = excluded.updated",
+                (raw, corrected, now))
+            # Correct positions count too, they are the denominator of the ratio
+            self._conn.executemany(
+                "INSERT INTO confusion (position, read, actual, count) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT(position, read, actual) DO UPDATE SET count = count + 1",
+                pairs)
+            for position, read, actual in pairs:
+                counts = self.confusion.setdefault((position, read), {})
+                counts[actual] = counts.get(actual, 0) + 1
+
+    def lookup(self, raw):
+        """Exact correction for a raw OCR string, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT corrected FROM corrections WHERE raw = ?",
+                                     (raw,)).fetchone()
+        return row[0] if row else None
+
+    def likely_digit(self, position, read):
+        """Most likely true digit for ``read`` at ``position`` with its probability"""
+        counts = self.confusion.get((position, read))
+        if not counts:
+            return read, 1.0
+        total = sum(counts.values())
+        actual, count = max(counts.items(), key=lambda item: item[1])
+        if actual != read and count >= MIN_CONFUSION_COUNT and count / total >= MIN_CONFUSION_RATIO:
+            return actual, count / total
+        return read, counts.get(read, 0) / total
+
+    def alternatives(self, position, read):
+        """``{actual: probability}`` for ``read`` at ``position``, once enough saves back it"""
+        counts = self.confusion.get((position, read))
+        if not counts:
+            return {}
+        total = sum(counts.values())
+        if total < MIN_CONFUSION_COUNT:
+            return {}
+        return {actual: count / total for actual, count in counts.items()}
+
+    def apply(self, raw, confidences=None):
+        """Correct an OCR read.
+
+        Returns ``(digits, confidences, how)`` where ``how`` is ``"exact"``,
+        ``"confusion"`` or None when nothing changed.
+        """
+        confidences = list(confidences or [])
+        exact = self.lookup(raw)
+        if exact is not None:
+            return exact, [100.0] * len(exact), "exact"
+
+        if len(raw) != NIK_LENGTH:
+            return raw, confidences, None
+
+        digits = list(raw)
+        changed = False
+        for i, read in enumerate(raw):
+            if i < len(confidences) and confidences[i] >= MAX_CONFIDENCE_TO_REWRITE:
+                continue
+            actual, probability = self.likely_digit(i, read)
+            if actual != read:
+                digits[i] = actual
+                if i < len(confidences):
+                    confidences[i] = probability * 100.0
+                changed = True
+
+        return "".join(digits), confidences, "confusion" if changed else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_correction_store(db_path, legacy_json=None):
+    """Process-wide store per database path"""
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = CorrectionStore(db_path, legacy_json)
+            _stores[db_path] = store
+        return store
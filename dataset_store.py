@@ -0,0 +1,395 @@
+"""Indexed, append-only store for the digit dataset.
+
+Layout inside the dataset folder (``number_dataset`` by default)::
+
+    0/ .. 9/              one PNG per sample, named by content hash
+    manifest.jsonl        one JSON record per sample, append-only; a crop
+                          saved again under another label appends a relabel
+                          and its PNG moves to the new label's folder
+    index.db              SQLite content hash -> (record id, label, file)
+    state.json            counts and packing progress, small and rewritten
+    shards/shard_00000.npy, labels_00000.npy
+                          normalized 28x28 samples packed for training
+
+Adding a sample appends one manifest line, inserts one index row and
+rewrites the tiny state file, so saving and counting stay O(1) however large
+the dataset grows. Training reads the shards with ``mmap_mode='r'`` instead
+of decoding every PNG. The manifest is the source of truth: when the state
+or the index lag behind it, both are rebuilt from it in one pass.
+
+    python dataset_store.py import-legacy     # index PNGs saved before the store
+    python dataset_store.py pack
+    python dataset_store.py stats
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import cv2 # type: ignore
+import numpy as np # type: ignore
+
+from digit_classifier import DIGIT_SIZE, normalize_digit
+
+MANIFEST_NAME = "manifest.jsonl"
+STATE_NAME = "state.json"
+INDEX_NAME = "index.db"
+SHARD_FOLDER = "shards"
+SHARD_SIZE = 10000
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    hash TEXT PRIMARY KEY,
+    id INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    file TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class DatasetStore:
+    """Digit samples with a persistent manifest, incremental counts and NumPy shards"""
+    def __init__(self, root="number_dataset"):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self.state_path = os.path.join(root, STATE_NAME)
+        self.shard_folder = os.path.join(root, SHARD_FOLDER)
+        self._lock = threading.Lock()
+
+        for digit in range(10):
+            os.makedirs(os.path.join(root, str(digit)), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, INDEX_NAME), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(INDEX_SCHEMA)
+        self.state = self._load_state()
+
+    @property
+    def total(self):
+        return self.state["records"]
+
+    @property
+    def counts(self):
+        return {label: self.state["counts"].get(label, 0) for label in map(str, range(10))}
+
+    def _manifest_bytes(self):
+        if os.path.exists(self.manifest_path):
+            return os.path.getsize(self.manifest_path)
+        return 0
+
+    def _indexed_bytes(self):
+        """Manifest size the index was last brought up to, or None"""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'manifest_bytes'").fetchone()
+        return row[0] if row else None
+
+    def _set_indexed_bytes(self, size):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('manifest_bytes', ?)",
+                           (size,))
+
+    def _load_state(self):
+        manifest_bytes = self._manifest_bytes()
+        if os.path.exists(self.state_path) and self._indexed_bytes() == manifest_bytes:
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                # Trust the cached counts only if the manifest has not moved on
+                if state.get("manifest_bytes") == manifest_bytes:
+                    return state
+            except (ValueError, OSError):
+                pass
+        return self._rebuild_state()
+
+    def _rebuild_state(self):
+        """Recount and reindex from the manifest with one sequential read"""
+        counts = {}
+        ids = {}
+        labels = {}
+        files = {}
+        records = 0
+        for line in self._iter_lines():
+            label = line["label"]
+            if "relabel" in line:
+                counts[labels[line["hash"]]] -= 1
+            else:
+                ids[line["hash"]] = line["id"]
+                records += 1
+            labels[line["hash"]] = label
+            files[line["hash"]] = line["file"]
+            counts[label] = counts.get(label, 0) + 1
+
+        with self._conn:
+            self._conn.execute("DELETE FROM samples")
+            self._conn.executemany(
+                "INSERT INTO samples (hash, id, label, file) VALUES (?, ?, ?, ?)",
+                ((digest, ids[digest], labels[digest], files[digest]) for digest in ids))
+            self._set_indexed_bytes(self._manifest_bytes())
+
+        packed = 0
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    packed = min(json.load(f).get("packed", 0), records)
+            except (ValueError, OSError):
+                packed = 0
+
+        state = {"manifest_bytes": self._manifest_bytes(), "records": records,
+                 "counts": counts, "packed": packed}
+        self._write_state(state)
+        return state
+
+    def _write_state(self, state):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _iter_lines(self):
+        """Raw manifest lines, sample records and relabels"""
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Torn line from an interrupted write
+                    continue
+
+    def iter_records(self):
+        """Sample records in insertion order, with their current label and file"""
+        with self._lock:
+            current = {digest: (label, file) for digest, label, file in
+                       self._conn.execute("SELECT hash, label, file FROM samples")}
+        for record in self._iter_lines():
+            if "relabel" in record:
+                continue
+            if record["hash"] in current:
+                record["label"], record["file"] = current[record["hash"]]
+            yield record
+
+    def _lookup(self, digest):
+        """``(record id, label, file)`` of a stored crop, or None"""
+        return self._conn.execute("SELECT id, label, file FROM samples WHERE hash = ?",
+                                  (digest,)).fetchone()
+
+    def add(self, digit_img, label, source=None, position=None, method=None):
+        """Store one digit crop, returns its record.
+
+        A crop that is already stored is not added twice: under the same
+        label it returns None, under another one its label is corrected.
+        """
+        label = str(label)
+        ok, encoded = cv2.imencode(".png", digit_img)
+        if not ok:
+            raise ValueError("Could not encode digit image")
+        data = encoded.tobytes()
+        digest = hashlib.sha1(data).hexdigest()
+
+        with self._lock:
+            known = self._lookup(digest)
+            if known is not None:
+                if known[1] == label:
+                    return None
+                return self._relabel(digest, *known, label)
+
+            rel_path = os.path.join(label, f"{digest[:20]}.png")
+            with open(os.path.join(self.root, rel_path), 'wb') as f:
+                f.write(data)
+
+            record = {
+                "id": self.state["records"],
+                "label": label,
+                "file": rel_path.replace(os.sep, "/"),
+                "source": source,
+                "position": position,
+                "method": method,
+                "hash": digest,
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            self._append([record])
+            return record
+
+    def _relabel(self, digest, record_id, old_label, old_file, label):
+        """Correct a stored crop's label and move its PNG, returns the relabel record"""
+        name = os.path.basename(old_file)
+        rel_path = f"{label}/{name}"
+        if os.path.exists(os.path.join(self.root, rel_path)):
+            # A legacy name taken by another crop in that folder
+            stem, ext = os.path.splitext(name)
+            rel_path = f"{label}/{stem}_{digest[:8]}{ext}"
+        source = os.path.join(self.root, old_file)
+        if os.path.exists(source):
+            # Folder-based readers (load_folder_dataset) take the label from here
+            os.replace(source, os.path.join(self.root, rel_path))
+
+        record = {
+            "relabel": record_id,
+            "label": label,
+            "file": rel_path,
+            "hash": digest,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with open(self.manifest_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+
+        with self._conn:
+            self._conn.execute("UPDATE samples SET label = ?, file = ? WHERE hash = ?",
+                               (label, rel_path, digest))
+            self._set_indexed_bytes(self._manifest_bytes())
+        counts = self.state["counts"]
+        counts[old_label] -= 1
+        counts[label] = counts.get(label, 0) + 1
+        if record_id < self.state.get("packed", 0):
+            # Already in a shard, correct its label there too
+            _, label_path = self._shard_paths(record_id // SHARD_SIZE)
+            labels = np.load(label_path)
+            labels[record_id % SHARD_SIZE] = int(label)
+            np.save(label_path, labels)
+        self.state["manifest_bytes"] = self._manifest_bytes()
+        self._write_state(self.state)
+        return record
+
+    def _append(self, records):
+        with open(self.manifest_path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO samples (hash, id, label, file) VALUES (?, ?, ?, ?)",
+                [(record["hash"], record["id"], record["label"], record["file"])
+                 for record in records])
+            self._set_indexed_bytes(self._manifest_bytes())
+        for record in records:
+            counts = self.state["counts"]
+            counts[record["label"]] = counts.get(record["label"], 0) + 1
+            self.state["records"] += 1
+        self.state["manifest_bytes"] = self._manifest_bytes()
+        self._write_state(self.state)
+
+    def import_legacy(self):
+        """Index PNGs from before the manifest existed (one-off folder walk)"""
+        indexed = {record["file"] for record in self.iter_records()}
+        hashes = set()
+        new_records = []
+        for digit in range(10):
+            folder = os.path.join(self.root, str(digit))
+            for name in sorted(os.listdir(folder)):
+                rel_path = f"{digit}/{name}"
+                if not name.lower().endswith(('.png', '.jpg', '.jpeg')) or rel_path in indexed:
+                    continue
+                with open(os.path.join(folder, name), 'rb') as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()
+                if digest in hashes or self._lookup(digest) is not None:
+                    continue
+                hashes.add(digest)
+                new_records.append({
+                    "id": self.state["records"] + len(new_records),
+                    "label": str(digit),
+                    "file": rel_path,
+                    "source": None,
+                    "position": None,
+                    "method": None,
+                    "hash": digest,
+                    "time": None,
+                })
+        with self._lock:
+            if new_records:
+                self._append(new_records)
+        return len(new_records)
+
+    def pack(self):
+        """Pack samples added since the last pack into fixed-size .npy shards.
+
+        Only new records are decoded; the last partial shard is rewritten
+        together with them. Returns the number of packed samples.
+        """
+        os.makedirs(self.shard_folder, exist_ok=True)
+        packed = self.state.get("packed", 0)
+        total = self.state["records"]
+        if packed >= total:
+            return packed
+
+        # Restart from the beginning of the partially filled shard
+        start = (packed // SHARD_SIZE) * SHARD_SIZE
+        shard_index = start // SHARD_SIZE
+        images = []
+        labels = []
+
+        def flush(index, images, labels):
+            path, label_path = self._shard_paths(index)
+            array = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                              shape=(len(images), DIGIT_SIZE, DIGIT_SIZE))
+            array[:] = np.stack(images)
+            array.flush()
+            del array
+            np.save(label_path, np.array(labels, np.uint8))
+
+        for i, record in enumerate(self.iter_records()):
+            if i < start:
+                continue
+            crop = cv2.imread(os.path.join(self.root, record["file"]), cv2.IMREAD_GRAYSCALE)
+            if crop is None:
+                crop = np.full((DIGIT_SIZE, DIGIT_SIZE), 255, np.uint8)
+            images.append(normalize_digit(crop))
+            labels.append(int(record["label"]))
+            if len(images) == SHARD_SIZE:
+                flush(shard_index, images, labels)
+                shard_index += 1
+                images, labels = [], []
+
+        if images:
+            flush(shard_index, images, labels)
+
+        with self._lock:
+            self.state["packed"] = total
+            self._write_state(self.state)
+        return total
+
+    def _shard_paths(self, index):
+        return (os.path.join(self.shard_folder, f"shard_{index:05d}.npy"),
+                os.path.join(self.shard_folder, f"labels_{index:05d}.npy"))
+
+    def load_arrays(self):
+        """Packed samples as (normalized N x 28 x 28 uint8, labels), memory-mapped shards"""
+        packed = self.state.get("packed", 0)
+        images = []
+        labels = []
+        for index in range((packed + SHARD_SIZE - 1) // SHARD_SIZE):
+            path, label_path = self._shard_paths(index)
+            if not os.path.exists(path):
+                break
+            images.append(np.load(path, mmap_mode='r'))
+            labels.append(np.load(label_path))
+        if not images:
+            return np.zeros((0, DIGIT_SIZE, DIGIT_SIZE), np.uint8), np.zeros(0, np.int32)
+        if len(images) == 1:
+            return images[0], labels[0].astype(np.int32)
+        return np.concatenate(images), np.concatenate(labels).astype(np.int32)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Digit dataset store maintenance")
+    parser.add_argument("command", choices=["import-legacy", "pack", "stats"])
+    parser.add_argument("--dataset", default="number_dataset")
+    args = parser.parse_args(argv)
+
+    store = DatasetStore(args.dataset)
+    if args.command == "import-legacy":
+        print(f"Indexed {store.import_legacy()} legacy images")
+    elif args.command == "pack":
+        print(f"Packed {store.pack()} samples into {store.shard_folder}")
+    print(json.dumps({"total": store.total, "counts": store.counts,
+                      "packed": store.state.get("packed", 0)}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
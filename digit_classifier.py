@@ -0,0 +1,235 @@
+"""CPU-only digit recognizer trained from the dataset builder output.
+
+Each segmented crop is normalised to 28x28, described with HOG and classified
+with k-nearest neighbours (``cv2.ml.KNearest``). All crops of a NIK are
+classified in one batch, so 16 digits cost well under a millisecond instead
+of a Tesseract pass.
+
+    python digit_classifier.py train --dataset number_dataset
+    python digit_classifier.py eval --dataset number_dataset
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import cv2 # type: ignore
+import numpy as np # type: ignore
+
+DIGIT_SIZE = 28
+DEFAULT_MODEL_PATH = os.path.join("models", "digit_knn.npz")
+DEFAULT_K = 3
+
+_hog = cv2.HOGDescriptor((DIGIT_SIZE, DIGIT_SIZE), (14, 14), (7, 7), (7, 7), 9)
+
+
+def normalize_digit(crop):
+    """Binary crop (text black on white) -> 28x28 uint8, text white, centered"""
+    if len(crop.shape) == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    inverted = 255 - crop
+
+    points = cv2.findNonZero(inverted)
+    if points is not None:
+        x, y, w, h = cv2.boundingRect(points)
+        inverted = inverted[y:y + h, x:x + w]
+
+    h, w = inverted.shape[:2]
+    if h == 0 or w == 0:
+        return np.zeros((DIGIT_SIZE, DIGIT_SIZE), np.uint8)
+
+    # Longest side to 20 px like MNIST, keep the aspect ratio
+    fit = 20.0 / max(h, w)
+    new_w, new_h = max(1, int(round(w * fit))), max(1, int(round(h * fit)))
+    small = cv2.resize(inverted, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+    canvas = np.zeros((DIGIT_SIZE, DIGIT_SIZE), np.uint8)
+    x0 = (DIGIT_SIZE - new_w) // 2
+    y0 = (DIGIT_SIZE - new_h) // 2
+    canvas[y0:y0 + new_h, x0:x0 + new_w] = small
+    return canvas
+
+
+def hog_features(normalized):
+    """HOG features for a stack of normalized digits, shape (N, F) float32"""
+    if len(normalized) == 0:
+        return np.zeros((0, _hog.getDescriptorSize()), np.float32)
+    return np.vstack([_hog.compute(img).reshape(1, -1) for img in normalized]).astype(np.float32)
+
+
+def load_folder_dataset(dataset_folder):
+    """Read number_dataset/<digit>/*.png into (crops, labels)"""
+    images = []
+    labels = []
+    for digit in range(10):
+        folder = os.path.join(dataset_folder, str(digit))
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(('.png', '.jpg', '.jpeg')):
+                continue
+            crop = cv2.imread(os.path.join(folder, name), cv2.IMREAD_GRAYSCALE)
+            if crop is None:
+                continue
+            images.append(crop)
+            labels.append(digit)
+    return images, np.array(labels, np.int32)
+
+
+class DigitClassifier:
+    """HOG + kNN digit recognizer"""
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.features = None
+        self.labels = None
+        self._knn = None
+
+    @property
+    def trained(self):
+        return self._knn is not None
+
+    def fit(self, crops, labels):
+        """Train from segmented crops (text black on white) and integer labels"""
+        return self.fit_normalized([normalize_digit(c) for c in crops], labels)
+
+    def fit_normalized(self, normalized, labels):
+        """Train from already normalized 28x28 digits (e.g. packed dataset shards)"""
+        self.features = hog_features(normalized)
+        self.labels = np.asarray(labels, np.int32)
+        if len(self.labels) == 0:
+            raise ValueError("No training samples")
+        self._build()
+        return self
+
+    def _build(self):
+        knn = cv2.ml.KNearest_create()
+        knn.train(self.features, cv2.ml.ROW_SAMPLE, self.labels.reshape(-1, 1).astype(np.float32))
+        self._knn = knn
+
+    def predict(self, crops):
+        """Classify segmented crops in one batch.
+
+        Returns ``(digits, confidences)``: a digit string and, per digit, the
+        share of the k neighbours that agreed (0-100).
+        """
+        if not self.trained:
+            raise RuntimeError("Digit classifier is not trained")
+        if len(crops) == 0:
+            return "", []
+
+        features = hog_features([normalize_digit(c) for c in crops])
+        k = min(self.k, len(self.labels))
+        _, results, neighbours, _ = self._knn.findNearest(features, k)
+
+        predicted = results.ravel().astype(np.int32)
+        agree = (neighbours == predicted[:, None]).sum(axis=1) / float(k) * 100.0
+        return "".join(str(d) for d in predicted), [float(c) for c in agree]
+
+    def save(self, path=DEFAULT_MODEL_PATH):
+        parent = os.path.dirname(path)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent)
+        np.savez_compressed(path, features=self.features, labels=self.labels,
+                            k=np.int32(self.k))
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH):
+        data = np.load(path)
+        model = cls(k=int(data["k"]))
+        model.features = data["features"].astype(np.float32)
+        model.labels = data["labels"].astype(np.int32)
+        model._build()
+        return model
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_classifier(path=DEFAULT_MODEL_PATH):
+    """Process-wide cached model, or None if it has not been trained yet"""
+    with _models_lock:
+        entry = _models.get(path)
+        if not os.path.exists(path):
+            return None
+        mtime = os.path.getmtime(path)
+        # Reload after retraining
+        if entry is None or entry[0] != mtime:
+            entry = (mtime, DigitClassifier.load(path))
+            _models[path] = entry
+        return entry[1]
+
+
+def train_from_folder(dataset_folder, model_path=DEFAULT_MODEL_PATH, k=DEFAULT_K, store=None):
+    """Train on the dataset and save, returns the sample count.
+
+    Uses the packed shards of the dataset store when it has a manifest,
+    otherwise decodes number_dataset/0..9 directly. Pass the application's
+    ``store`` so only one DatasetStore writes the folder's state.
+    """
+    from dataset_store import DatasetStore
+
+    store = store or DatasetStore(dataset_folder)
+    if store.total:
+        store.pack()
+        images, labels = store.load_arrays()
+        model = DigitClassifier(k=k).fit_normalized(images, labels)
+    else:
+        images, labels = load_folder_dataset(dataset_folder)
+        model = DigitClassifier(k=k).fit(images, labels)
+    model.save(model_path)
+    return len(labels)
+
+
+def cmd_train(args):
+    start = time.perf_counter()
+    count = train_from_folder(args.dataset, args.model, args.k)
+    print(f"Trained on {count} digits in {time.perf_counter() - start:.1f}s -> {args.model}")
+    return 0
+
+
+def cmd_eval(args):
+    """Hold out every 5th sample and report accuracy and batch latency"""
+    images, labels = load_folder_dataset(args.dataset)
+    if len(labels) < 10:
+        print("Not enough samples to evaluate", file=sys.stderr)
+        return 1
+
+    test = np.arange(len(labels)) % 5 == 0
+    train_images = [img for img, t in zip(images, test) if not t]
+    test_images = [img for img, t in zip(images, test) if t]
+    model = DigitClassifier(k=args.k).fit(train_images, labels[~test])
+
+    start = time.perf_counter()
+    digits, _ = model.predict(test_images)
+    elapsed = time.perf_counter() - start
+
+    predicted = np.array([int(d) for d in digits])
+    accuracy = float(np.mean(predicted == labels[test]))
+    per_16 = elapsed / len(test_images) * 16 * 1e6
+    print(f"Accuracy: {accuracy:.2%} on {len(test_images)} held-out digits, "
+          f"~{per_16:.0f} us per 16 digits")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="HOG + kNN digit classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, func, help_text in (("train", cmd_train, "Train and save the model"),
+                                  ("eval", cmd_eval, "Hold-out accuracy and latency")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--dataset", default="number_dataset")
+        p.add_argument("--model", default=DEFAULT_MODEL_PATH)
+        p.add_argument("-k", type=int, default=DEFAULT_K)
+        p.set_defaults(func=func)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
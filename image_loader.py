@@ -0,0 +1,278 @@
+"""Reduced-resolution image loading for the GUI.
+
+Phone photos of KTPs are 12-48 MP JPEGs, while the canvas shows about 1000
+px and card detection works on a ~1700 px card. JPEGs are therefore decoded
+with libjpeg's DCT scaling (``IMREAD_REDUCED_COLOR_2/4/8``) to the smallest
+level whose longest side is still at least ``WORKING_SIZE``; that skips most
+of the decode work and memory. The full resolution is only decoded when a
+NIK crop needs it. EXIF orientation is read with PIL and applied to both, so
+their coordinates always match.
+
+``ImagePyramid`` holds power-of-two display levels of a LoadedImage for the
+zoomable canvas, cut into tiles so only the visible ones are rendered.
+"""
+import math
+import threading
+
+import cv2 # type: ignore
+import numpy as np # type: ignore
+
+from nik_engine import warp_card
+
+try:
+    from PIL import Image # type: ignore
+except ImportError:
+    Image = None
+
+# Longest side of the working image used for display and detection
+WORKING_SIZE = 1600
+
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+                 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+EXIF_ORIENTATION = 0x0112
+
+
+def apply_orientation(image, orientation):
+    """Rotate/flip a decoded image the way EXIF ``orientation`` (1-8) asks"""
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.transpose(image)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(image), -1)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+
+def read_header(path):
+    """``(format, (width, height), orientation)`` from the file header, without decoding"""
+    if Image is None:
+        return None, None, 1
+    try:
+        with Image.open(path) as pil:
+            orientation = pil.getexif().get(EXIF_ORIENTATION, 1)
+            return pil.format, pil.size, orientation
+    except Exception:
+        return None, None, 1
+
+
+def pick_reduction(size, max_side=WORKING_SIZE):
+    """Largest JPEG reduction (1, 2, 4, 8) keeping the longest side >= ``max_side``"""
+    longest = max(size)
+    for factor in (8, 4, 2):
+        if longest // factor >= max_side:
+            return factor
+    return 1
+
+
+class LoadedImage:
+    """Working image for display and detection, full resolution decoded on demand.
+
+    Coordinates given to ``crop`` and ``to_full`` are in ``image`` pixels.
+    """
+    def __init__(self, path, image, reduction=1, orientation=1, fmt=None):
+        self.path = path
+        self.image = image
+        self.reduction = reduction
+        self.orientation = orientation
+        self.format = fmt
+        self._full = image if reduction == 1 else None
+        self._lock = threading.Lock()
+
+    @property
+    def full_size(self):
+        """(width, height) of the oriented full-resolution image"""
+        if self._full is not None:
+            return self._full.shape[1], self._full.shape[0]
+        h, w = self.image.shape[:2]
+        return w * self.reduction, h * self.reduction
+
+    def full(self):
+        """Full-resolution image, decoded on first use and kept"""
+        with self._lock:
+            if self._full is None:
+                flags = cv2.IMREAD_COLOR
+                if Image is not None:
+                    flags |= cv2.IMREAD_IGNORE_ORIENTATION
+                image = cv2.imread(self.path, flags)
+                if image is None:
+                    raise IOError(f"failed to decode {self.path}")
+                self._full = apply_orientation(image, self.orientation)
+            return self._full
+
+    def to_full(self, bbox):
+        """``bbox`` scaled to full-resolution pixels and clamped to the image"""
+        full = self.full()
+        h, w = full.shape[:2]
+        x1, y1, x2, y2 = (int(round(v * self.reduction)) for v in bbox)
+        return max(0, min(x1, w)), max(0, min(y1, h)), max(0, min(x2, w)), max(0, min(y2, h))
+
+    def crop(self, bbox):
+        """Full-resolution pixels under ``bbox``"""
+        x1, y1, x2, y2 = self.to_full(bbox)
+        return self.full()[y1:y2, x1:x2]
+
+
+# Edge of a display tile in level pixels
+TILE_SIZE = 256
+
+
+class ImagePyramid:
+    """Display levels of a LoadedImage, level ``n`` at 1/2**n of full resolution.
+
+    Levels are built on first use: the working image is level
+    ``log2(reduction)``, coarser levels are halved from it and finer ones
+    are resized from the full-resolution decode.
+    """
+    def __init__(self, loaded, tile_size=TILE_SIZE):
+        self.loaded = loaded
+        self.tile_size = tile_size
+        self.base = int(round(math.log2(loaded.reduction)))
+        self.levels = {self.base: loaded.image}
+        # Coarsest level still larger than one tile
+        longest = max(loaded.image.shape[:2])
+        self.max_level = self.base
+        while longest > tile_size:
+            longest //= 2
+            self.max_level += 1
+
+    def level_for(self, scale):
+        """Coarsest level with at least ``scale`` pixels per working-image pixel"""
+        per_full = scale / self.loaded.reduction
+        if per_full >= 1.0:
+            return 0
+        return max(0, min(self.max_level, int(math.floor(math.log2(1.0 / per_full)))))
+
+    def level(self, n):
+        image = self.levels.get(n)
+        if image is None:
+            if n < self.base:
+                full = self.loaded.full()
+                h, w = full.shape[:2]
+                factor = 2 ** n
+                image = full if n == 0 else cv2.resize(
+                    full, (max(1, w // factor), max(1, h // factor)), interpolation=cv2.INTER_AREA)
+            else:
+                finer = self.level(n - 1)
+                h, w = finer.shape[:2]
+                image = cv2.resize(finer, (max(1, w // 2), max(1, h // 2)),
+                                   interpolation=cv2.INTER_AREA)
+            self.levels[n] = image
+        return image
+
+    def level_scale(self, n):
+        """Level ``n`` pixels per working-image pixel"""
+        return self.level(n).shape[1] / float(self.loaded.image.shape[1])
+
+    def tiles(self, n, x1, y1, x2, y2):
+        """``(tx, ty)`` of the level-``n`` tiles covering level pixels [x1, x2) x [y1, y2)"""
+        h, w = self.level(n).shape[:2]
+        size = self.tile_size
+        x1, y1 = max(0, int(x1)), max(0, int(y1))
+        x2, y2 = min(w, int(math.ceil(x2))), min(h, int(math.ceil(y2)))
+        return [(tx, ty) for ty in range(y1 // size, (y2 - 1) // size + 1)
+                for tx in range(x1 // size, (x2 - 1) // size + 1)
+                if x2 > x1 and y2 > y1]
+
+    def tile(self, n, tx, ty):
+        """Level pixels of a tile and its ``(x, y)`` origin in level pixels"""
+        size = self.tile_size
+        x, y = tx * size, ty * size
+        return self.level(n)[y:y + size, x:x + size], (x, y)
+
+
+def open_image(path, max_side=WORKING_SIZE):
+    """Decode ``path`` for display and detection, returns a LoadedImage or None"""
+    fmt, size, orientation = read_header(path)
+    reduction = 1
+    if fmt == "JPEG" and size:
+        reduction = pick_reduction(size, max_side)
+
+    flags = REDUCED_FLAGS.get(reduction, cv2.IMREAD_COLOR)
+    if Image is not None:
+        # Orientation is applied below, identically for the full decode
+        flags |= cv2.IMREAD_IGNORE_ORIENTATION
+    else:
+        orientation = 1
+    image = cv2.imread(path, flags)
+    if image is None:
+        return None
+    return LoadedImage(path, apply_orientation(image, orientation), reduction, orientation, fmt)
+
+
+def extract_loaded(extractor, loaded, bbox=None, settings=None, cache=None, image_key=None,
+                   cancel=None):
+    """``extractor.extract`` on a LoadedImage, decoding full resolution only when needed.
+
+    Without ``bbox`` the NIK is detected and read on the working image and
+    re-read from full resolution only when that is not a valid NIK; the
+    better of the two reads is returned. When the card was rectified, the
+    re-read warps the NIK region's corners straight from the full-resolution
+    image, so the strip stays rectified. A given ``bbox`` (working image
+    coordinates) is read from the full-resolution crop directly. Either way
+    the result's bbox is in working image coordinates.
+    """
+    settings = settings or extractor.settings
+    if loaded.reduction == 1:
+        return extractor.extract(loaded.image, bbox=bbox, settings=settings, cache=cache,
+                                 image_key=image_key, cancel=cancel)
+
+    def read_roi(roi, bbox, settings, key):
+        h, w = roi.shape[:2]
+        if image_key is not None:
+            key = (image_key, "full") + key
+        else:
+            key = None
+        result = extractor.extract(roi, bbox=(0, 0, w, h), settings=settings, cache=cache,
+                                   image_key=key, cancel=cancel)
+        result.bbox = tuple(bbox)
+        return result
+
+    def read_full(bbox, settings):
+        return read_roi(loaded.crop(bbox), bbox, settings, (tuple(bbox),))
+
+    def read_full_rectified(result, settings):
+        quad = np.asarray(result.quad, np.float32) * loaded.reduction
+        h, w = result.roi.shape[:2]
+        # The strip at the full image's own resolution, never below the card frame
+        scale = max(1.0, float(np.linalg.norm(quad[1] - quad[0])) / w)
+        strip, _ = warp_card(loaded.full(), quad,
+                             (int(round(w * scale)), int(round(h * scale))))
+        return read_roi(strip, result.bbox, settings, ("card", tuple(result.bbox)))
+
+    if bbox is not None:
+        return read_full(bbox, settings)
+
+    result = extractor.extract(loaded.image, settings=settings, cache=cache,
+                               image_key=image_key, cancel=cancel)
+    if result.bbox is None or result.valid:
+        return result
+
+    if result.color_detected:
+        method = "auto" if settings.method == "auto" else "color"
+        settings = settings.copy(method=method, target_color=result.target_color,
+                                 tolerance=result.tolerance)
+    if result.card_rectified:
+        full = read_full_rectified(result, settings)
+    else:
+        full = read_full(result.bbox, settings)
+    full.quad, full.card_rectified = result.quad, result.card_rectified
+    full.color_detected = result.color_detected
+    full.timings["detect"] = result.timings.get("detect", 0.0)
+
+    if full.valid or (full.digit_count, full.confidence) > (result.digit_count, result.confidence):
+        best, other = full, result
+    else:
+        best, other = result, full
+    # Both reads were paid for, report them together
+    best.trace.merge(other.trace)
+    best.timings["total"] = result.timings.get("total", 0.0) + full.timings.get("total", 0.0)
+    return best
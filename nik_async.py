@@ -0,0 +1,209 @@
+"""Asyncio batch pipeline with overlapping stages.
+
+Each image passes three stages, each with its own concurrency limit:
+
+    decode   cv2.imread in a thread pool
+    cpu      card detection, cropping and preprocessing in a thread pool
+             (OpenCV releases the GIL inside its kernels)
+    ocr      the Tesseract PSM cascade as asyncio subprocesses
+
+Images flow through independently, so image N+1 is decoded and preprocessed
+while Tesseract reads image N, and no thread sits blocked on a Tesseract
+launch. ``window`` caps how many images are in flight, which keeps memory
+flat on large backlogs. Used by ``nik_batch.py --async``.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2 # type: ignore
+
+from nik_engine import NikExtractor, NikResult, NikSettings, PsmCascade, digits_from_data
+from nik_ensemble import vote_reads
+from nik_trace import Trace, activate, pixel_count
+from ocr_backend import DIGIT_WHITELIST, ENGINE_ERRORS, OCR_PASS_ERRORS, AsyncTesseract
+
+
+def default_limits(cpu=None):
+    """Per-stage concurrency: two decoders, a thread per core, two Tesseracts per core"""
+    cpu = cpu or os.cpu_count() or 1
+    return {"decode": 2, "cpu": cpu, "ocr": cpu * 2}
+
+
+class AsyncPipeline:
+    """decode -> cpu -> ocr, with a semaphore per stage and a bounded in-flight window"""
+    def __init__(self, settings=None, limits=None, window=None, tesseract=None):
+        self.settings = settings or NikSettings()
+        self.limits = default_limits()
+        self.limits.update(limits or {})
+        self.window = window or sum(self.limits.values())
+        self.extractor = NikExtractor(self.settings)
+        self.tesseract = tesseract or AsyncTesseract()
+        self._decode_pool = ThreadPoolExecutor(self.limits["decode"], thread_name_prefix="nik-decode")
+        self._cpu_pool = ThreadPoolExecutor(self.limits["cpu"], thread_name_prefix="nik-cpu")
+        # Created in ``run``, semaphores bind to the running loop
+        self._semaphores = None
+
+    async def _stage(self, stage, pool, func, *args):
+        async with self._semaphores[stage]:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+    async def process(self, path):
+        """Extract one image, returns the same row as ``nik_batch.process_image``.
+
+        ``ENGINE_ERRORS`` propagate and end the run.
+        """
+        start = time.perf_counter()
+        row = {"path": path}
+        try:
+            image = await self._stage("decode", self._decode_pool, cv2.imread, path)
+            if image is None:
+                row["error"] = "failed to load image"
+            else:
+                row.update((await self.extract(image)).to_dict())
+        except ENGINE_ERRORS:
+            raise
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+        row["seconds"] = round(time.perf_counter() - start, 4)
+        return row
+
+    async def extract(self, image):
+        """``NikExtractor.extract`` with the OCR cascade run as subprocesses"""
+        if self.settings.ocr_engine == "classifier":
+            # Tesseract is only the classifier's fallback there, keep it on the CPU stage
+            return await self._stage("cpu", self._cpu_pool, self.extractor.extract, image)
+
+        start = time.perf_counter()
+        trace = Trace()
+        result, settings, jobs = await self._stage("cpu", self._cpu_pool, self.prepare, image, trace)
+        if jobs:
+            t = time.perf_counter()
+            tasks = [asyncio.ensure_future(self.recognize(png, pixels, job, trace))
+                     for job, png, pixels in jobs]
+            try:
+                reads = await asyncio.gather(*tasks)
+            except Exception:
+                # e.g. no tesseract binary, the other methods would fail alike
+                for task in tasks:
+                    task.cancel()
+                raise
+            result.timings["ocr"] = time.perf_counter() - t
+            if settings.method == "auto":
+                result.reads = {job.method: read[:2] for (job, _, _), read in zip(jobs, reads)}
+                result.raw, result.digit_confidences, result.ocr_raw = vote_reads(
+                    list(result.reads.values()), self.extractor.confusion(settings),
+                    settings.min_confidence)
+                result.ocr_engine = "ensemble"
+            else:
+                (result.raw, result.digit_confidences, result.psm, result.ocr_passes,
+                 result.ocr_raw) = reads[0]
+                result.ocr_engine = "tesseract"
+
+            if settings.corrections_path:
+                await self._stage("cpu", self._cpu_pool, self.extractor.apply_corrections,
+                                  result, settings)
+
+        result.timings["total"] = time.perf_counter() - start
+        result.trace = trace
+        return result
+
+    def prepare(self, image, trace):
+        """CPU stage: locate and crop the NIK, preprocess it per method and encode PNGs.
+
+        Returns ``(result, settings, [(job_settings, png, pixels)])``; no jobs
+        when the NIK was not found.
+        """
+        result = NikResult()
+        with activate(trace):
+            located = self.extractor.crop_nik(image, None, self.settings, result)
+            if located is None:
+                return result, self.settings, []
+            roi, _, settings, _ = located
+
+            t = time.perf_counter()
+            if settings.method == "auto":
+                jobs = self.extractor.ensemble_jobs(settings)
+            else:
+                jobs = [settings]
+            encoded = []
+            for job in jobs:
+                processed = self.extractor.preprocess(roi, job)
+                ok, png = cv2.imencode(".png", processed)
+                if ok:
+                    encoded.append((job, png.tobytes(), pixel_count(processed)))
+            result.timings["preprocess"] = time.perf_counter() - t
+        return result, settings, encoded
+
+    async def recognize(self, png, pixels, settings, trace):
+        """OCR stage: the early-exit PSM cascade, one Tesseract process per pass.
+
+        Only a failed pass moves on to the next PSM; a missing binary raises
+        and ends up in the image's error row.
+        """
+        cascade = PsmCascade(settings, self.extractor.confusion(settings),
+                             self.extractor.psm_stats)
+        for psm in cascade.order():
+            async with self._semaphores["ocr"]:
+                t = time.perf_counter()
+                try:
+                    data = await self.tesseract.image_to_data(png, psm=psm,
+                                                              whitelist=DIGIT_WHITELIST)
+                except OCR_PASS_ERRORS as e:
+                    cascade.fail(e)
+                    continue
+                finally:
+                    trace.add("ocr.tesseract_async", time.perf_counter() - t, pixels)
+            if cascade.offer(psm, *digits_from_data(data)):
+                break
+        return cascade.result()
+
+    async def run(self, paths, on_row):
+        """Process ``paths``, calling ``on_row(row)`` as each image finishes"""
+        self._semaphores = {stage: asyncio.Semaphore(limit)
+                            for stage, limit in self.limits.items()}
+        window = asyncio.Semaphore(self.window)
+        tasks = set()
+        # An on_row error (e.g. disk full) or an engine error raised in a
+        # callback would only be logged
+        failures = []
+
+        def finished(task):
+            tasks.discard(task)
+            window.release()
+            if task.cancelled():
+                return
+            try:
+                on_row(task.result())
+            except Exception as e:
+                failures.append(e)
+
+        try:
+            for path in paths:
+                await window.acquire()
+                if failures:
+                    break
+                task = asyncio.ensure_future(self.process(path))
+                tasks.add(task)
+                task.add_done_callback(finished)
+            while tasks and not failures:
+                await asyncio.wait(set(tasks), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+        if failures:
+            raise failures[0]
+
+    def close(self):
+        self._decode_pool.shutdown(wait=True)
+        self._cpu_pool.shutdown(wait=True)
+
+
+def run_async(paths, on_row, settings=None, limits=None, window=None):
+    """Blocking entry point: run the pipeline over ``paths`` in a fresh event loop"""
+    pipeline = AsyncPipeline(settings, limits, window)
+    try:
+        asyncio.run(pipeline.run(paths, on_row))
+    finally:
+        pipeline.close()
@@ -0,0 +1,403 @@
+"""Batch NIK extraction over folders of KTP images.
+
+    python nik_batch.py scans/ -o results.jsonl
+    python nik_batch.py --list files.txt -o results.csv --workers 8
+
+Results are appended as each image finishes, so an interrupted run can be
+resumed by running the same command again: paths already read without an
+error are skipped, failed ones are retried. A run stops as soon as the OCR
+engine itself cannot run (e.g. Tesseract not installed) instead of writing
+an error row for every image.
+
+JSONL rows carry the per-image stage trace; ``--trace`` also writes the
+totals over the run, and ``--profile`` runs in-process under cProfile or
+pyinstrument:
+
+    python nik_batch.py scans/ --trace trace.json
+    python nik_batch.py scans/ --profile cprofile --profile-output batch.prof
+
+``--async`` runs one process with overlapping stages instead of a process
+pool: images are decoded and preprocessed in threads while Tesseract reads
+earlier ones as asyncio subprocesses (see nik_async):
+
+    python nik_batch.py scans/ --async --workers 8 --ocr-jobs 16
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import cv2 # type: ignore
+
+from nik_async import default_limits, run_async
+from nik_engine import (NikExtractor, NikSettings, METHODS,
+                        COLOR_SPACES, DENOISE_MODES, OCR_ENGINES, DEFAULT_MIN_CONFIDENCE)
+from nik_trace import Trace
+from ocr_backend import ENGINE_ERRORS, EngineUnavailable, configure_tesseract
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif')
+
+CSV_FIELDS = ["path", "nik", "digit_count", "confidence", "method", "bbox",
+              "error", "seconds"]
+
+# Per-process engine, created once by the pool initializer
+_extractor = None
+
+
+def _init_worker(settings):
+    global _extractor
+    _extractor = NikExtractor(NikSettings(**settings))
+
+
+def process_image(path):
+    """Auto-detect and extract one image, returns a JSON-serialisable row.
+
+    Raises EngineUnavailable when the OCR engine cannot run at all, which is
+    no fault of the image.
+    """
+    start = time.perf_counter()
+    row = {"path": path}
+    try:
+        image = cv2.imread(path)
+        if image is None:
+            row["error"] = "failed to load image"
+        else:
+            row.update(_extractor.extract(image).to_dict())
+    except ENGINE_ERRORS as e:
+        raise EngineUnavailable(str(e)) from None
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = round(time.perf_counter() - start, 4)
+    return row
+
+
+def iter_images(inputs, recursive=True):
+    """Yield image paths from files and directories"""
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                for root, dirs, files in os.walk(item):
+                    dirs.sort()
+                    for name in sorted(files):
+                        if name.lower().endswith(IMAGE_EXTENSIONS):
+                            yield os.path.join(root, name)
+            else:
+                for name in sorted(os.listdir(item)):
+                    path = os.path.join(item, name)
+                    if os.path.isfile(path) and name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield path
+        elif os.path.isfile(item):
+            yield item
+        else:
+            print(f"Skipping missing input: {item}", file=sys.stderr)
+
+
+def read_list_file(list_path):
+    """Read one path per line, ignoring blanks and # comments"""
+    with open(list_path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+class ResultWriter:
+    """Append-only CSV/JSONL writer that also knows what is already done"""
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.format = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+        self.file = None
+        self.csv_writer = None
+
+    def completed_paths(self):
+        """Paths already read without an error (the resume checkpoint)"""
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, 'r', encoding='utf-8', newline='') as f:
+            if self.format == "csv":
+                for row in csv.DictReader(f):
+                    if row.get("path") and not row.get("error"):
+                        done.add(row["path"])
+            else:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                        if not row.get("error"):
+                            done.add(row["path"])
+                    except (ValueError, KeyError):
+                        # A torn last line from a killed run, reprocess it
+                        continue
+        return done
+
+    def open(self):
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        parent = os.path.dirname(self.path)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent)
+        self.file = open(self.path, 'a', encoding='utf-8', newline='')
+        if self.format == "csv":
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS,
+                                             extrasaction='ignore')
+            if not exists:
+                self.csv_writer.writeheader()
+        return self
+
+    def write(self, row):
+        if self.format == "csv":
+            flat = dict(row)
+            if flat.get("bbox"):
+                flat["bbox"] = " ".join(str(v) for v in flat["bbox"])
+            self.csv_writer.writerow(flat)
+        else:
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        # Flush every row so a crash loses at most the in-flight images
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def run_batch(paths, writer, settings, workers=None, progress=True, trace=None):
+    """Run extraction over ``paths`` with a process pool, writing as results arrive.
+
+    With ``workers=1`` images are processed in this process, which is what
+    a profiler needs. Each row's trace is added to ``trace`` when given.
+    """
+    workers = workers or os.cpu_count() or 1
+    todo = _remaining(paths, writer, progress)
+    total = len(todo)
+
+    stats = {"processed": 0, "complete": 0, "failed": 0}
+    start = time.perf_counter()
+    # Bounded in-flight window keeps memory flat on very large backlogs
+    window = workers * 4
+    pending = set()
+    queue = iter(todo)
+
+    writer.open()
+    if workers == 1:
+        _init_worker(settings.to_dict())
+        try:
+            for path in queue:
+                _record(process_image(path), writer, stats, trace)
+                if progress:
+                    _report(stats, total, start)
+        finally:
+            writer.close()
+        stats["seconds"] = round(time.perf_counter() - start, 2)
+        return stats
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(settings.to_dict(),)) as pool:
+            for path in queue:
+                pending.add(pool.submit(process_image, path))
+                if len(pending) >= window:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        _record(future.result(), writer, stats, trace)
+                    if progress:
+                        _report(stats, total, start)
+
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    _record(future.result(), writer, stats, trace)
+                if progress:
+                    _report(stats, total, start)
+    finally:
+        writer.close()
+
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def run_async_batch(paths, writer, settings, limits=None, progress=True, trace=None):
+    """Like ``run_batch``, through the asyncio pipeline with per-stage ``limits``"""
+    todo = _remaining(paths, writer, progress)
+    total = len(todo)
+    stats = {"processed": 0, "complete": 0, "failed": 0}
+    start = time.perf_counter()
+
+    def on_row(row):
+        _record(row, writer, stats, trace)
+        if progress:
+            _report(stats, total, start)
+
+    writer.open()
+    try:
+        run_async(todo, on_row, settings, limits)
+    finally:
+        writer.close()
+
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def _remaining(paths, writer, progress):
+    """``paths`` not yet in the output file"""
+    done = writer.completed_paths()
+    todo = [p for p in paths if p not in done]
+    if progress and done:
+        print(f"Resuming: {len(done)} already done, {len(todo)} remaining", file=sys.stderr)
+    return todo
+
+
+def _record(row, writer, stats, trace=None):
+    writer.write(row)
+    if trace is not None and row.get("trace"):
+        trace.merge(row["trace"])
+    stats["processed"] += 1
+    if row.get("error"):
+        stats["failed"] += 1
+    elif row.get("digit_count") == 16:
+        stats["complete"] += 1
+
+
+def _report(stats, total, start):
+    elapsed = time.perf_counter() - start
+    rate = stats["processed"] / elapsed if elapsed > 0 else 0.0
+    print(f"\r{stats['processed']}/{total}  {rate:.1f} img/s  "
+          f"complete={stats['complete']} failed={stats['failed']}",
+          end="", file=sys.stderr, flush=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Batch NIK extraction from KTP images")
+    parser.add_argument("inputs", nargs="*", help="Image files or folders")
+    parser.add_argument("--list", dest="list_file", help="Text file with one image path per line")
+    parser.add_argument("-o", "--output", default="nik_results.jsonl",
+                        help="Output file (.jsonl or .csv), also used as resume checkpoint")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Override output format")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes, or CPU stage threads with --async (default: CPU count)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Overlap decode, preprocessing and Tesseract subprocesses in one process")
+    parser.add_argument("--decode-jobs", type=int,
+                        help="Images decoded at once with --async (default: 2)")
+    parser.add_argument("--ocr-jobs", type=int,
+                        help="Tesseract processes at once with --async (default: 2 per CPU)")
+    parser.add_argument("--method", choices=METHODS, default="adaptive",
+                        help="Preprocessing method when text color is not auto-detected")
+    parser.add_argument("--no-auto-color", action="store_true",
+                        help="Do not switch to color masking from the detected text color")
+    parser.add_argument("--color-space", choices=COLOR_SPACES, default="bgr",
+                        help="Color matching: BGR box or perceptual LAB distance")
+    parser.add_argument("--denoise", choices=DENOISE_MODES,
+                        help="Denoise filter before upscaling (default: per method)")
+    parser.add_argument("--tesseract", metavar="PATH",
+                        help="tesseract binary (default: $TESSERACT_CMD or from PATH)")
+    parser.add_argument("--ocr", choices=OCR_ENGINES, default="tesseract",
+                        help="OCR engine (classifier falls back to Tesseract when unsure)")
+    parser.add_argument("--corrections", metavar="DB",
+                        help="Apply stored corrections, e.g. number_training_data/corrections.db")
+    parser.add_argument("--scale", type=float,
+                        help="Fixed upscale factor (default: from measured digit height)")
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help="Mean Tesseract confidence that stops the PSM cascade early")
+    parser.add_argument("--no-recursive", action="store_true", help="Do not descend into subfolders")
+    parser.add_argument("--trace", metavar="JSON",
+                        help="Write per-stage calls, time and pixels summed over the run")
+    parser.add_argument("--profile", choices=PROFILERS,
+                        help="Profile the run in-process (forces --workers 1)")
+    parser.add_argument("--profile-output", metavar="FILE",
+                        help="cProfile stats (.prof) or pyinstrument HTML output file")
+    parser.add_argument("-q", "--quiet", action="store_true", help="No progress output")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.tesseract:
+        configure_tesseract(args.tesseract)
+
+    inputs = list(args.inputs)
+    if args.list_file:
+        inputs += read_list_file(args.list_file)
+    if not inputs:
+        build_parser().error("no input images given")
+
+    paths = list(iter_images(inputs, recursive=not args.no_recursive))
+    settings = NikSettings(method=args.method, auto_color=not args.no_auto_color,
+                          min_confidence=args.min_confidence,
+                          color_space=args.color_space, denoise=args.denoise,
+                          scale=args.scale, ocr_engine=args.ocr,
+                          corrections_path=args.corrections)
+    writer = ResultWriter(args.output, args.format)
+    trace = Trace() if args.trace else None
+    workers = 1 if args.profile else args.workers
+
+    def run():
+        if args.use_async:
+            limits = default_limits(args.workers)
+            if args.decode_jobs:
+                limits["decode"] = args.decode_jobs
+            if args.ocr_jobs:
+                limits["ocr"] = args.ocr_jobs
+            return run_async_batch(paths, writer, settings, limits,
+                                   progress=not args.quiet, trace=trace)
+        return run_batch(paths, writer, settings, workers=workers,
+                         progress=not args.quiet, trace=trace)
+
+    try:
+        if args.profile:
+            stats = run_profiled(run, args.profile, args.profile_output)
+        else:
+            stats = run()
+    except KeyboardInterrupt:
+        print("\nInterrupted, rerun the same command to resume", file=sys.stderr)
+        return 130
+    except ENGINE_ERRORS as e:
+        print(f"\nOCR engine unavailable, stopped: {e}", file=sys.stderr)
+        return 2
+
+    if not args.quiet:
+        print(file=sys.stderr)
+    if trace is not None:
+        with open(args.trace, 'w', encoding='utf-8') as f:
+            json.dump({"images": stats["processed"], "stages": trace.to_dict()}, f, indent=2)
+    print(json.dumps(stats))
+    return 0
+
+
+def run_profiled(run, profiler, output=None):
+    """Call ``run()`` under cProfile or pyinstrument and save or print the profile"""
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler # type: ignore
+        except ImportError:
+            raise SystemExit("pyinstrument is not installed (pip install pyinstrument)")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            return run()
+        finally:
+            profiler.stop()
+            if output:
+                with open(output, 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html())
+            else:
+                print(profiler.output_text(unicode=True), file=sys.stderr)
+
+    import cProfile
+    import pstats
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return run()
+    finally:
+        profile.disable()
+        if output:
+            profile.dump_stats(output)
+        else:
+            pstats.Stats(profile, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+"""Accuracy/latency benchmarks for the NIK pipeline.
+
+    python nik_bench.py denoise labeled/ -o denoise.json
+    python nik_bench.py denoise --labels labels.csv --methods adaptive contrast
+    python nik_bench.py pipeline --synthetic 200 -o bench.json
+    python nik_bench.py pipeline labeled/ --methods adaptive auto -o bench.json
+    python nik_bench.py synth 100 synthetic/
+    python nik_bench.py compare baseline.json bench.json
+
+A labeled set is either a CSV with ``path,nik`` columns or a folder of images
+whose file names contain the 16-digit NIK (e.g. ``3201234567890123_01.jpg``).
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+
+import cv2 # type: ignore
+
+from nik_batch import iter_images
+from nik_engine import (NikExtractor, NikSettings, PREPROCESS_METHODS, METHODS, DENOISE_MODES,
+                        NIK_LENGTH)
+from nik_ensemble import get_ensemble_pool
+from nik_synth import synthesize
+
+# Stages reported by the pipeline benchmark; "ocr" covers Tesseract, the
+# digit classifier and the auto ensemble. "color" is also part of "detect".
+PIPELINE_STAGES = ("detect", "color", "preprocess", "ocr", "segment", "total")
+OCR_TIMINGS = ("ocr", "classify", "ensemble")
+
+
+def load_labels(source):
+    """Return [(path, nik)] from a labels CSV or a folder of NIK-named images"""
+    samples = []
+    if os.path.isdir(source):
+        for path in iter_images([source]):
+            match = re.search(r'\d{16}', os.path.basename(path))
+            if match:
+                samples.append((path, match.group(0)))
+        return samples
+
+    base = os.path.dirname(source)
+    with open(source, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            path = row["path"]
+            if not os.path.isabs(path):
+                path = os.path.join(base, path)
+            samples.append((path, row["nik"].strip()))
+    return samples
+
+
+def score(predicted, expected):
+    """(full NIK correct, number of correct digit positions)"""
+    correct = sum(1 for p, e in zip(predicted, expected) if p == e)
+    return predicted[:NIK_LENGTH] == expected, correct
+
+
+def stage_time(timings, stage):
+    if stage == "ocr":
+        return sum(timings.get(key, 0.0) for key in OCR_TIMINGS)
+    return timings.get(stage, 0.0)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(name, rows, stages=("preprocess", "ocr", "total")):
+    """Aggregate per-image rows of one configuration"""
+    n = len(rows) or 1
+    full = sum(1 for r in rows if r["full"])
+    digits = sum(r["digits"] for r in rows)
+    summary = {
+        "config": name,
+        "images": len(rows),
+        "full_nik_accuracy": round(full / n, 4),
+        "digit_accuracy": round(digits / (n * NIK_LENGTH), 4),
+    }
+    for stage in stages:
+        values = [stage_time(r["timings"], stage) for r in rows]
+        summary[f"mean_{stage}_ms"] = round(1000 * sum(values) / n, 2)
+    return summary
+
+
+def bench_denoise(samples, methods, modes, extractor=None):
+    """Run every (method, denoise) pair over the labeled samples.
+
+    Detection runs once per image so only preprocessing and OCR differ
+    between configurations. The color method has no gray denoise step and is
+    measured once per image with the detected text color.
+    """
+    extractor = extractor or NikExtractor()
+    configs = []
+    for method in methods:
+        if method == "color":
+            configs.append(("color", None))
+        else:
+            configs.extend((method, mode) for mode in modes)
+    results = {config: [] for config in configs}
+
+    for path, nik in samples:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Skipping unreadable image: {path}", file=sys.stderr)
+            continue
+
+        # Crop from the rectified card when its outline was found
+        source, bbox, color, _ = extractor.locate_nik(image)
+        if bbox is None:
+            for config in configs:
+                results[config].append({"full": False, "digits": 0, "timings": {}})
+            continue
+
+        for method, mode in configs:
+            settings = NikSettings(method=method, denoise=mode)
+            if method == "color":
+                if color is None:
+                    results[(method, mode)].append({"full": False, "digits": 0, "timings": {}})
+                    continue
+                settings = settings.copy(target_color=color[0], tolerance=color[1])
+
+            result = extractor.extract(source, bbox=bbox, settings=settings)
+            full, digits = score(result.digits, nik)
+            results[(method, mode)].append({"full": full, "digits": digits,
+                                            "timings": result.timings})
+
+    summaries = []
+    for (method, mode), rows in results.items():
+        name = method if mode is None else f"{method}/{mode}"
+        summaries.append(summarize(name, rows))
+    return summaries
+
+
+def cheapest_within(summaries, max_drop=0.0):
+    """Fastest config whose full-NIK accuracy is within max_drop of the best"""
+    if not summaries:
+        return None
+    best = max(s["full_nik_accuracy"] for s in summaries)
+    eligible = [s for s in summaries if s["full_nik_accuracy"] >= best - max_drop]
+    return min(eligible, key=lambda s: s["mean_total_ms"])
+
+
+def print_table(summaries):
+    header = f"{'config':<22}{'full':>8}{'digit':>8}{'prep ms':>10}{'ocr ms':>10}{'total ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for s in summaries:
+        print(f"{s['config']:<22}{s['full_nik_accuracy']:>8.1%}{s['digit_accuracy']:>8.1%}"
+              f"{s['mean_preprocess_ms']:>10.1f}{s['mean_ocr_ms']:>10.1f}{s['mean_total_ms']:>10.1f}")
+
+
+def iter_samples(args):
+    """Yield ``(name, nik, image)`` from the labeled set or the synthetic generator"""
+    if args.synthetic:
+        for i, (nik, image, _) in enumerate(synthesize(args.synthetic, args.seed)):
+            yield f"synthetic_{i:05d}", nik, image
+        return
+
+    samples = load_labels(args.labels)
+    if args.limit:
+        samples = samples[:args.limit]
+    for path, nik in samples:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Skipping unreadable image: {path}", file=sys.stderr)
+            continue
+        yield path, nik, image
+
+
+def bench_pipeline(samples, methods, extractor=None):
+    """Run the full headless pipeline (detect to segment) per method.
+
+    Every method starts from the raw image, so detection is measured for
+    each. "color" keeps the detected text color; the other methods ignore it.
+    """
+    extractor = extractor or NikExtractor()
+    results = {method: [] for method in methods}
+
+    for _, nik, image in samples:
+        for method in methods:
+            settings = NikSettings(method=method, auto_color=method in ("color", "auto"))
+            result = extractor.extract(image, settings=settings, segment=True)
+            full, digits = score(result.digits, nik)
+            results[method].append({"full": full, "digits": digits,
+                                    "detected": result.bbox is not None,
+                                    "valid": result.valid,
+                                    "timings": result.timings})
+
+    summaries = []
+    for method, rows in results.items():
+        summary = summarize(method, rows, PIPELINE_STAGES)
+        totals = [r["timings"].get("total", 0.0) for r in rows]
+        n = len(rows) or 1
+        summary["detect_rate"] = round(sum(1 for r in rows if r["detected"]) / n, 4)
+        summary["valid_rate"] = round(sum(1 for r in rows if r["valid"]) / n, 4)
+        summary["p50_total_ms"] = round(1000 * percentile(totals, 0.5), 2)
+        summary["p95_total_ms"] = round(1000 * percentile(totals, 0.95), 2)
+        summary["images_per_s"] = round(len(rows) / sum(totals), 3) if sum(totals) else 0.0
+        summaries.append(summary)
+    return summaries
+
+
+def print_pipeline_table(summaries):
+    header = (f"{'method':<10}{'full':>8}{'digit':>8}{'detect':>9}{'color':>8}{'prep':>8}"
+              f"{'ocr':>9}{'seg':>7}{'total':>9}{'p95':>9}{'img/s':>8}")
+    print(header)
+    print("-" * len(header))
+    for s in summaries:
+        print(f"{s['config']:<10}{s['full_nik_accuracy']:>8.1%}{s['digit_accuracy']:>8.1%}"
+              f"{s['mean_detect_ms']:>9.1f}{s['mean_color_ms']:>8.1f}"
+              f"{s['mean_preprocess_ms']:>8.1f}{s['mean_ocr_ms']:>9.1f}"
+              f"{s['mean_segment_ms']:>7.1f}{s['mean_total_ms']:>9.1f}"
+              f"{s['p95_total_ms']:>9.1f}{s['images_per_s']:>8.2f}")
+
+
+def git_commit():
+    """Current commit of the working tree, or None outside git"""
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def cmd_pipeline(args):
+    if not args.synthetic and not args.labels:
+        print("Give a labeled set or --synthetic N", file=sys.stderr)
+        return 1
+
+    extractor = NikExtractor(pool=get_ensemble_pool()) if "auto" in args.methods else None
+    start = time.perf_counter()
+    summaries = bench_pipeline(iter_samples(args), args.methods, extractor)
+    seconds = time.perf_counter() - start
+    if not summaries or not summaries[0]["images"]:
+        print("No images benchmarked", file=sys.stderr)
+        return 1
+
+    print_pipeline_table(summaries)
+    if args.output:
+        report = {
+            "benchmark": "pipeline",
+            "commit": git_commit(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": f"synthetic:{args.synthetic}:seed={args.seed}" if args.synthetic else args.labels,
+            "images": summaries[0]["images"],
+            "seconds": round(seconds, 2),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "results": summaries,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def cmd_synth(args):
+    """Write synthetic cards as NIK-named JPEGs plus labels.csv"""
+    os.makedirs(args.folder, exist_ok=True)
+    with open(os.path.join(args.folder, "labels.csv"), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["path", "nik"])
+        for i, (nik, image, _) in enumerate(synthesize(args.count, args.seed)):
+            name = f"{nik}_{i:05d}.jpg"
+            cv2.imwrite(os.path.join(args.folder, name), image)
+            writer.writerow([name, nik])
+    print(f"Wrote {args.count} images to {args.folder}")
+    return 0
+
+
+def cmd_compare(args):
+    """Compare two pipeline reports, non-zero exit on a regression"""
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = {s["config"]: s for s in json.load(f)["results"]}
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = {s["config"]: s for s in json.load(f)["results"]}
+
+    regressed = False
+    print(f"{'config':<12}{'full':>10}{'digit':>10}{'total ms':>12}")
+    for config, new in current.items():
+        old = baseline.get(config)
+        if old is None:
+            continue
+        full = new["full_nik_accuracy"] - old["full_nik_accuracy"]
+        digit = new["digit_accuracy"] - old["digit_accuracy"]
+        slowdown = (new["mean_total_ms"] / old["mean_total_ms"] - 1.0) if old["mean_total_ms"] else 0.0
+        print(f"{config:<12}{full:>+10.1%}{digit:>+10.1%}{slowdown:>+12.1%}")
+        if full < -args.max_drop or slowdown > args.max_slowdown:
+            regressed = True
+    return 1 if regressed else 0
+
+
+def cmd_denoise(args):
+    samples = load_labels(args.labels)
+    if args.limit:
+        samples = samples[:args.limit]
+    if not samples:
+        print("No labeled images found", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    summaries = bench_denoise(samples, args.methods, args.modes)
+    pick = cheapest_within(summaries, args.max_drop)
+
+    print_table(summaries)
+    if pick:
+        print(f"\nCheapest within {args.max_drop:.1%} of best full-NIK accuracy: {pick['config']}")
+
+    if args.output:
+        report = {
+            "benchmark": "denoise",
+            "labels": args.labels,
+            "images": len(samples),
+            "seconds": round(time.perf_counter() - start, 2),
+            "recommended": pick["config"] if pick else None,
+            "results": summaries,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="NIK pipeline benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("denoise", help="OCR accuracy vs time per method and denoise filter")
+    p.add_argument("labels", help="Labels CSV (path,nik) or folder of NIK-named images")
+    p.add_argument("--methods", nargs="+", choices=PREPROCESS_METHODS,
+                   default=["adaptive", "edge", "contrast"])
+    p.add_argument("--modes", nargs="+", choices=DENOISE_MODES, default=list(DENOISE_MODES))
+    p.add_argument("--max-drop", type=float, default=0.0,
+                   help="Accuracy loss allowed when picking the cheapest config")
+    p.add_argument("--limit", type=int, help="Only use the first N images")
+    p.add_argument("-o", "--output", help="Write the report as JSON")
+    p.set_defaults(func=cmd_denoise)
+
+    p = sub.add_parser("pipeline", help="Per-stage latency, throughput and accuracy per method")
+    p.add_argument("labels", nargs="?", help="Labels CSV (path,nik) or folder of NIK-named images")
+    p.add_argument("--synthetic", type=int, metavar="N",
+                   help="Benchmark N generated KTP-like images instead of a labeled set")
+    p.add_argument("--seed", type=int, default=0, help="Seed of the synthetic generator")
+    p.add_argument("--methods", nargs="+", choices=METHODS, default=list(PREPROCESS_METHODS))
+    p.add_argument("--limit", type=int, help="Only use the first N images")
+    p.add_argument("-o", "--output", help="Write the report as JSON")
+    p.set_defaults(func=cmd_pipeline)
+
+    p = sub.add_parser("synth", help="Write synthetic KTP-like images and labels.csv")
+    p.add_argument("count", type=int)
+    p.add_argument("folder")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=cmd_synth)
+
+    p = sub.add_parser("compare", help="Compare two pipeline reports")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--max-drop", type=float, default=0.02,
+                   help="Full-NIK accuracy loss that counts as a regression")
+    p.add_argument("--max-slowdown", type=float, default=0.2,
+                   help="Relative mean latency increase that counts as a regression")
+    p.set_defaults(func=cmd_compare)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1211 @@
+import cv2 # type: ignore
+import numpy as np # type: ignore
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import wait
+from functools import lru_cache
+
+from corrections import get_correction_store
+from digit_classifier import DEFAULT_MODEL_PATH, get_classifier
+from nik_ensemble import ENSEMBLE_METHODS, read_method, vote_reads
+from nik_trace import Trace, activate, current_trace, traced
+from nik_validator import DEFAULT_MIN_CONFIDENCE, check_nik, is_valid_nik, trusted_decode
+from ocr_backend import DIGIT_WHITELIST, OCR_PASS_ERRORS, get_backend
+
+PREPROCESS_METHODS = ("adaptive", "color", "edge", "contrast")
+
+# "auto" reads the strip with every preprocessing method and votes per digit
+METHODS = PREPROCESS_METHODS + ("auto",)
+
+# "classifier" is the HOG + kNN model trained from number_dataset
+OCR_ENGINES = ("tesseract", "classifier")
+
+# "bgr": per-channel box of +/- tolerance, "lab": CIE76 distance <= tolerance
+COLOR_SPACES = ("bgr", "lab")
+
+# Denoise filters, applied to the gray ROI before it is upscaled
+DENOISE_MODES = ("nlm", "bilateral", "median", "none")
+
+# Default denoise per method and the NLM strength each method used to apply
+DEFAULT_DENOISE = {"adaptive": "nlm", "edge": "nlm", "contrast": "nlm"}
+NLM_STRENGTH = {"adaptive": 12, "edge": 10, "contrast": 15}
+
+# Upscale so digits end up about this tall, Tesseract's preferred 30-40 px band
+TARGET_DIGIT_HEIGHT = 35
+MIN_SCALE = 0.25
+MAX_SCALE = 5.0
+# Upper bound on the processed strip, whatever the ROI size
+MAX_PROCESSED_PIXELS = 2000000
+
+NIK_LENGTH = 16
+
+# Card outline is searched on a copy no larger than this (longest side)
+CARD_DETECT_SIZE = 640
+# ID-1 card (85.6 x 54 mm) at 20 px/mm, the frame the fixed ROI ratios assume
+KTP_SIZE = (1712, 1080)
+# The card must cover this share of the frame and have a card-like aspect ratio
+MIN_CARD_AREA = 0.2
+CARD_ASPECT_RANGE = (1.3, 1.9)
+# The NIK line is located on the pyramid level where the image's longest side
+# first drops below twice this (1/4 scale for a 12 MP photo), then refined
+# at full resolution in a small window around it
+DETECT_SIZE = 800
+# The text color is sampled from at most about this many pixels of the NIK
+# box, taken with a stride so stroke colors are not blurred into the background
+COLOR_SAMPLE_PIXELS = 40000
+
+# Page segmentation modes used to read the selected NIK strip (digits only):
+# single line, single word, raw line
+DIGIT_PSMS = (7, 8, 13)
+
+# Free-text modes used to find the NIK line inside the card ROI
+TEXT_PSMS = (6, 7, 8)
+
+
+
+class ExtractionCancelled(Exception):
+    """Raised when a newer request superseded this extraction"""
+
+
+def check_cancelled(cancel):
+    """Raise ExtractionCancelled if the ``cancel`` event (or None) is set"""
+    if cancel is not None and cancel.is_set():
+        raise ExtractionCancelled()
+
+
+class PsmStats:
+    """Counts which PSM produced accepted reads so the cascade tries the best one first"""
+    def __init__(self, psms=DIGIT_PSMS):
+        self.psms = tuple(psms)
+        self.hits = {psm: 0 for psm in self.psms}
+        self.passes = 0
+
+    def order(self):
+        """PSMs sorted by hit count, ties keep the default order"""
+        return sorted(self.psms, key=lambda psm: (-self.hits[psm], self.psms.index(psm)))
+
+    def record(self, psm, passes):
+        self.passes += passes
+        if psm in self.hits:
+            self.hits[psm] += 1
+
+    def to_dict(self):
+        return {"hits": dict(self.hits), "passes": self.passes}
+
+
+class PsmCascade:
+    """Early-exit bookkeeping of one PSM cascade, fed one read at a time.
+
+    Kept apart from the OCR calls so the asyncio pipeline can drive the same
+    cascade with Tesseract subprocesses.
+    """
+    def __init__(self, settings, confusion=None, psm_stats=None):
+        self.settings = settings
+        self.confusion = confusion
+        self.psm_stats = psm_stats or PsmStats()
+        self.best = ("", [], None, "")
+        self.best_score = (False, False, 0, 0.0)
+        self.passes = 0
+        self.accepted = False
+        self.error = None
+
+    def order(self):
+        return self.psm_stats.order()
+
+    def offer(self, psm, digits, confs, alternatives=None):
+        """Score one read, returns True once the cascade can stop.
+
+        A read is only replaced by its decode when that is trusted: valid as
+        read, or valid after rewriting a single low-confidence digit. Any
+        other read is kept as OCR read it, so it stays invalid. Only a
+        trusted read may stop the cascade; the confidence judged is that of
+        the decoded digits.
+        """
+        self.passes += 1
+        raw = digits
+        decoded = trusted_decode(digits, confs, alternatives, self.confusion,
+                                 self.settings.min_confidence)
+        if decoded is not None:
+            digits, confs = decoded
+
+        mean_conf = sum(confs) / len(confs) if confs else 0.0
+        if decoded is not None and mean_conf >= self.settings.min_confidence:
+            self.best = (digits, confs, psm, raw)
+            self.accepted = True
+            return True
+
+        score = (decoded is not None, len(digits) == NIK_LENGTH, len(digits), mean_conf)
+        if score > self.best_score:
+            self.best, self.best_score = (digits, confs, psm, raw), score
+        return False
+
+    def fail(self, error):
+        """Record a pass that raised one of ``OCR_PASS_ERRORS``"""
+        self.error = error
+
+    def result(self):
+        """``(digits, confidences, psm, passes, ocr_raw)``, recording the outcome
+        in the PSM stats. ``ocr_raw`` is the chosen pass as OCR read it.
+
+        Raises the last pass error when no pass succeeded, so a Tesseract
+        that fails on every call is reported instead of read as no digits.
+        """
+        if self.passes == 0 and self.error is not None:
+            raise self.error
+        digits, confs, psm, raw = self.best
+        self.psm_stats.record(psm if self.accepted else None, self.passes)
+        return digits, confs, psm, self.passes, raw
+
+
+@lru_cache(maxsize=64)
+def lab_distance_luts(target_bgr):
+    """Per-channel squared LAB distance tables (256 entries each) for a target color"""
+    target = cv2.cvtColor(np.uint8([[target_bgr]]), cv2.COLOR_BGR2LAB)[0, 0].astype(np.float32)
+    levels = np.arange(256, dtype=np.float32)
+    # OpenCV stores 8-bit L as L*255/100, so rescale it back to CIE units
+    lut_l = ((levels - target[0]) * (100.0 / 255.0)) ** 2
+    lut_a = (levels - target[1]) ** 2
+    lut_b = (levels - target[2]) ** 2
+    return lut_l, lut_a, lut_b
+
+
+def color_mask(image, target_color, tolerance, color_space="bgr"):
+    """255 where a BGR pixel is within tolerance of target_color, else 0"""
+    if color_space == "lab":
+        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+        lut_l, lut_a, lut_b = lab_distance_luts(tuple(int(c) for c in target_color))
+        dist2 = lut_l[lab[..., 0]] + lut_a[lab[..., 1]] + lut_b[lab[..., 2]]
+        return np.where(dist2 <= float(tolerance) ** 2, 255, 0).astype(np.uint8)
+
+    target = np.array(target_color, dtype=np.int16)
+    lower = np.clip(target - tolerance, 0, 255).astype(np.uint8)
+    upper = np.clip(target + tolerance, 0, 255).astype(np.uint8)
+    return cv2.inRange(image, lower, upper)
+
+
+def measure_digit_height(text_mask):
+    """Median height of digit-like blobs in a mask where text is 255, or None"""
+    n, _, stats, _ = cv2.connectedComponentsWithStats(text_mask, connectivity=8)
+    if n <= 1:
+        return None
+
+    roi_height = text_mask.shape[0]
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    # Drop specks, blobs spanning the whole strip and merged runs of digits
+    keep = ((heights >= max(3, 0.2 * roi_height)) & (heights <= 0.95 * roi_height) &
+            (widths <= 1.5 * heights))
+    if not np.any(keep):
+        return None
+    return float(np.median(heights[keep]))
+
+
+def adaptive_scale(text_mask, target=TARGET_DIGIT_HEIGHT, max_pixels=MAX_PROCESSED_PIXELS):
+    """Scale factor that brings measured digits to ``target`` px, capped by pixel count"""
+    height, width = text_mask.shape[:2]
+    # Detected boxes are padded around the line, digits fill most of it
+    digit_height = measure_digit_height(text_mask) or 0.6 * height
+    scale = min(MAX_SCALE, max(MIN_SCALE, target / max(digit_height, 1.0)))
+
+    if width * height * scale * scale > max_pixels:
+        scale = (max_pixels / float(width * height)) ** 0.5
+    return scale
+
+
+def resize_by(image, scale, interpolation=cv2.INTER_CUBIC):
+    """Resize by a factor, using INTER_AREA when shrinking"""
+    if scale == 1.0:
+        return image
+    height, width = image.shape[:2]
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA if scale < 1.0 else interpolation)
+
+
+def order_quad(points):
+    """Four points as float32 (top-left, top-right, bottom-right, bottom-left)"""
+    points = np.asarray(points, np.float32).reshape(4, 2)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([points[np.argmin(sums)], points[np.argmin(diffs)],
+                     points[np.argmax(sums)], points[np.argmax(diffs)]], np.float32)
+
+
+@traced("card_quad")
+def find_card_quad(image):
+    """Outline of an upright, landscape card in image coordinates, or None.
+
+    Runs on a copy downscaled to ``CARD_DETECT_SIZE`` so the cost does not
+    grow with camera resolution.
+    """
+    h, w = image.shape[:2]
+    fit = min(1.0, CARD_DETECT_SIZE / float(max(h, w)))
+    small = resize_by(image, fit)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if len(small.shape) == 3 else small
+
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.Canny(blurred, 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area = MIN_CARD_AREA * small.shape[0] * small.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        if cv2.contourArea(contour) < min_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) != 4 or not cv2.isContourConvex(approx):
+            continue
+
+        quad = order_quad(approx) / fit
+        tl, tr, br, bl = quad
+        width = (np.linalg.norm(tr - tl) + np.linalg.norm(br - bl)) / 2
+        height = (np.linalg.norm(bl - tl) + np.linalg.norm(br - tr)) / 2
+        if height > 0 and CARD_ASPECT_RANGE[0] <= width / height <= CARD_ASPECT_RANGE[1]:
+            return quad
+    return None
+
+
+@traced("warp_card")
+def warp_card(image, quad, size=KTP_SIZE):
+    """Warp the card to the canonical KTP frame, returns (card, image->card matrix)"""
+    width, height = size
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]],
+                      np.float32)
+    matrix = cv2.getPerspectiveTransform(order_quad(quad), target)
+    card = cv2.warpPerspective(image, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_REPLICATE)
+    return card, matrix
+
+
+def quad_bounds(quad, shape):
+    """Axis-aligned (x1, y1, x2, y2) around a quadrilateral, clipped to the image"""
+    h, w = shape[:2]
+    quad = np.asarray(quad, np.float32)
+    x1, y1 = np.floor(quad.min(axis=0))
+    x2, y2 = np.ceil(quad.max(axis=0))
+    return (int(max(0, x1)), int(max(0, y1)), int(min(w, x2)), int(min(h, y2)))
+
+
+def pyramid_levels(shape, max_size=DETECT_SIZE):
+    """Number of pyrDown halvings that bring the longest side below 2 * max_size"""
+    longest = max(shape[:2])
+    levels = 0
+    while longest >= 2 * max_size:
+        longest = (longest + 1) // 2
+        levels += 1
+    return levels
+
+
+def sample_pixels(image, max_pixels=COLOR_SAMPLE_PIXELS):
+    """Every n-th row and column of ``image`` so that at most ~``max_pixels`` remain"""
+    h, w = image.shape[:2]
+    step = int(np.ceil(np.sqrt(h * w / float(max_pixels)))) if h * w > max_pixels else 1
+    return image[::step, ::step]
+
+
+def pyr_down(image, levels):
+    for _ in range(levels):
+        image = cv2.pyrDown(image)
+    return image
+
+
+def digit_runs(data):
+    """Runs of adjacent digit words on each line of an ``image_to_data`` dict.
+
+    Returns ``[(digits, confidences, (x1, y1, x2, y2))]``; words without
+    digits (``NIK``, ``:``) split runs, so the NIK line gives one 16-digit run.
+    """
+    runs = []
+    current = None
+    for i, text in enumerate(data['text']):
+        line = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        word = re.sub(r'[^0-9]', '', str(text))
+        if not word:
+            current = None
+            continue
+        left, top = data['left'][i], data['top'][i]
+        right, bottom = left + data['width'][i], top + data['height'][i]
+        conf = max(0.0, float(data['conf'][i]))
+
+        if current is None or current[0] != line:
+            current = [line, "", [], [left, top, right, bottom]]
+            runs.append(current)
+        box = current[3]
+        current[1] += word
+        current[2].extend([conf] * len(word))
+        box[0], box[1] = min(box[0], left), min(box[1], top)
+        box[2], box[3] = max(box[2], right), max(box[3], bottom)
+
+    return [(digits, confs, tuple(box)) for _, digits, confs, box in runs]
+
+
+def digits_from_data(data):
+    """Digits of an ``image_to_data`` dict, each with its word's confidence"""
+    digits = ""
+    confs = []
+    for text, conf in zip(data['text'], data['conf']):
+        word = re.sub(r'[^0-9]', '', str(text))
+        if not word:
+            continue
+        conf = max(0.0, float(conf))
+        digits += word
+        confs.extend([conf] * len(word))
+    return digits, confs
+
+
+def denoise(gray, mode="nlm", strength=12):
+    """Denoise a gray image at native resolution"""
+    if mode == "nlm":
+        # Windows sized for native-resolution glyphs, not the 5x upscale
+        return cv2.fastNlMeansDenoising(gray, None, h=strength, templateWindowSize=5,
+                                        searchWindowSize=11)
+    elif mode == "bilateral":
+        return cv2.bilateralFilter(gray, 5, 50, 50)
+    elif mode == "median":
+        return cv2.medianBlur(gray, 3)
+    return gray
+
+
+class CacheEntry:
+    """Preprocessed ROI plus its segmented digits (filled on first use)"""
+    def __init__(self, processed):
+        self.processed = processed
+        self.digits = None
+
+
+class PreprocessCache:
+    """Bounded LRU of preprocessed ROIs.
+
+    Keyed on (image key, ROI, method, target color, tolerance) so preview,
+    extract and dataset save share one preprocessing pass per state.
+    """
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image_key, bbox, settings):
+        # Color and tolerance only matter to the color method
+        if settings.method == "color" and settings.target_color is not None:
+            variant = (settings.target_color, settings.tolerance, settings.color_space)
+        else:
+            variant = settings.denoise_mode()
+        return (image_key, tuple(int(v) for v in bbox), settings.method, variant,
+                settings.scale)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, processed):
+        entry = CacheEntry(processed)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NikSettings:
+    """Settings for one extraction run"""
+    def __init__(self, method="adaptive", target_color=None, tolerance=40,
+                 auto_color=True, min_confidence=DEFAULT_MIN_CONFIDENCE,
+                 color_space="bgr", denoise=None, scale=None, ocr_engine="tesseract",
+                 model_path=DEFAULT_MODEL_PATH, corrections_path=None):
+        self.method = method
+        self.target_color = tuple(target_color) if target_color is not None else None
+        self.tolerance = int(tolerance)
+        self.color_space = color_space
+        # None means the method's default from DEFAULT_DENOISE
+        self.denoise = denoise
+        # None picks the upscale factor from the measured digit height
+        self.scale = scale
+        self.ocr_engine = ocr_engine
+        self.model_path = model_path
+        # SQLite correction store consulted after OCR, None disables it
+        self.corrections_path = corrections_path
+        self.auto_color = auto_color
+        self.min_confidence = float(min_confidence)
+
+    def denoise_mode(self):
+        """Denoise filter in effect for the current method"""
+        return self.denoise or DEFAULT_DENOISE.get(self.method, "nlm")
+
+    def copy(self, **changes):
+        """Return a copy with some fields replaced"""
+        values = self.to_dict()
+        values.update(changes)
+        return NikSettings(**values)
+
+    def to_dict(self):
+        return {
+            "method": self.method,
+            "target_color": self.target_color,
+            "tolerance": self.tolerance,
+            "color_space": self.color_space,
+            "denoise": self.denoise,
+            "scale": self.scale,
+            "ocr_engine": self.ocr_engine,
+            "model_path": self.model_path,
+            "corrections_path": self.corrections_path,
+            "auto_color": self.auto_color,
+            "min_confidence": self.min_confidence,
+        }
+
+
+class NikResult:
+    """Structured result of a NIK extraction"""
+    def __init__(self):
+        self.bbox = None
+        # NIK region corners in image coordinates, tilted when the card was rectified
+        self.quad = None
+        self.card_rectified = False
+        self.raw = ""
+        # What OCR read before stored corrections were applied
+        self.ocr_raw = ""
+        self.correction = None
+        self.digit_confidences = []
+        self.method = None
+        self.target_color = None
+        self.tolerance = None
+        self.color_detected = False
+        self.ocr_engine = None
+        self.psm = None
+        self.ocr_passes = 0
+        self.timings = {}
+        self.processed = None
+        self.digit_images = []
+        # Strip OCR read (from the rectified card when there was one) and its
+        # preprocess cache location as ``(bbox, image_key)``, for the GUI
+        self.roi = None
+        self.roi_key = None
+        # Per-method reads behind an "auto" result
+        self.reads = {}
+        # Per-stage calls, wall time and pixels (nik_trace.Trace)
+        self.trace = None
+        self.error = None
+
+    @property
+    def digits(self):
+        """16-character NIK, padded with '?' where no digit was read"""
+        if len(self.raw) >= NIK_LENGTH:
+            return self.raw[:NIK_LENGTH]
+        return self.raw.ljust(NIK_LENGTH, '?')
+
+    @property
+    def digit_count(self):
+        return len([d for d in self.digits if d != '?'])
+
+    @property
+    def valid(self):
+        """True when the 16 digits pass the NIK structure rules"""
+        return is_valid_nik(self.digits)
+
+    @property
+    def problems(self):
+        return check_nik(self.digits)
+
+    @property
+    def confidence(self):
+        """Mean per-digit confidence (0-100), unread digits count as 0"""
+        confs = list(self.digit_confidences[:NIK_LENGTH])
+        confs += [0.0] * (NIK_LENGTH - len(confs))
+        return sum(confs) / NIK_LENGTH
+
+    def to_dict(self):
+        return {
+            "bbox": list(self.bbox) if self.bbox else None,
+            "quad": [[round(float(x), 1), round(float(y), 1)] for x, y in self.quad]
+                    if self.quad is not None else None,
+            "card_rectified": self.card_rectified,
+            "raw": self.raw,
+            "ocr_raw": self.ocr_raw,
+            "correction": self.correction,
+            "nik": self.digits,
+            "digit_count": self.digit_count,
+            "valid": self.valid,
+            "digit_confidences": [round(c, 1) for c in self.digit_confidences],
+            "confidence": round(self.confidence, 1),
+            "method": self.method,
+            "target_color": list(self.target_color) if self.target_color else None,
+            "tolerance": self.tolerance,
+            "ocr_engine": self.ocr_engine,
+            "psm": self.psm,
+            "ocr_passes": self.ocr_passes,
+            "reads": {method: digits for method, (digits, _) in self.reads.items()},
+            "timings": {k: round(v, 4) for k, v in self.timings.items()},
+            "trace": self.trace.to_dict() if self.trace else None,
+            "error": self.error,
+        }
+
+
+class NikExtractor:
+    """Stateless NIK pipeline: detect, preprocess, OCR and segment.
+
+    Nothing here touches Tk, so it can run headless and in worker processes.
+    """
+    def __init__(self, settings=None, backend=None, psm_stats=None, pool=None):
+        self.settings = settings or NikSettings()
+        # Long-lived OCR engine shared by every call in this process
+        self.backend = backend or get_backend()
+        self.psm_stats = psm_stats or PsmStats()
+        # Executor for the "auto" ensemble, None runs the methods one by one here
+        self.pool = pool
+
+    def extract(self, image, bbox=None, settings=None, segment=False,
+                cache=None, image_key=None, cancel=None):
+        """Run the full pipeline on a BGR image and return a NikResult.
+
+        When ``bbox`` is None the NIK region is auto-detected and, if
+        ``settings.auto_color`` is set, the text color is taken from the card.
+        With a ``cache`` and an ``image_key`` identifying the image, the
+        preprocessing and segmentation of each state is computed only once.
+        ``cancel`` is an optional ``threading.Event``; once set, the run stops
+        at the next stage boundary with ExtractionCancelled.
+        """
+        trace = Trace()
+        with activate(trace):
+            result = self.run_pipeline(image, bbox, settings, segment, cache, image_key, cancel)
+        result.trace = trace
+        return result
+
+    def run_pipeline(self, image, bbox, settings, segment, cache, image_key, cancel):
+        """Body of ``extract``, runs with the result's trace active"""
+        settings = settings or self.settings
+        result = NikResult()
+        start = time.perf_counter()
+
+        if image is None or image.size == 0:
+            result.error = "empty image"
+            return result
+
+        located = self.crop_nik(image, bbox, settings, result, image_key)
+        if located is None:
+            result.timings["total"] = time.perf_counter() - start
+            return result
+        roi, crop_bbox, settings, image_key = located
+        result.roi = roi
+        result.roi_key = (crop_bbox, image_key)
+
+        check_cancelled(cancel)
+        entry = None
+        if settings.method == "auto":
+            t = time.perf_counter()
+            result.reads = self.read_ensemble(roi, settings, cancel)
+            result.raw, result.digit_confidences, result.ocr_raw = vote_reads(
+                list(result.reads.values()), self.confusion(settings), settings.min_confidence)
+            result.ocr_engine = "ensemble"
+            result.timings["ensemble"] = time.perf_counter() - t
+        else:
+            entry = self.read_single(roi, crop_bbox, settings, cache, image_key, cancel, result)
+
+        self.apply_corrections(result, settings)
+
+        if segment and "segment" not in result.timings:
+            t = time.perf_counter()
+            if entry is None:
+                entry = self.preprocess_cached(roi, crop_bbox, settings, cache, image_key)
+            result.digit_images = self.segment_cached(entry)
+            result.timings["segment"] = time.perf_counter() - t
+
+        result.timings["total"] = time.perf_counter() - start
+        return result
+
+    def crop_nik(self, image, bbox, settings, result, image_key=None):
+        """Detect the NIK when ``bbox`` is None and crop it, filling ``result``.
+
+        Returns ``(roi, crop_bbox, settings, image_key)`` with the settings
+        switched to the detected text color, or None with ``result.error`` set.
+        """
+        # Image the ROI is cropped from: the input, or the rectified card
+        source = image
+        if bbox is None:
+            t = time.perf_counter()
+            source, bbox, color, result.quad = self.locate_nik(image, result.timings)
+            result.timings["detect"] = time.perf_counter() - t
+            if bbox is None:
+                result.error = "NIK region not found"
+                return None
+            if color is not None and settings.auto_color:
+                target_color, tolerance = color
+                method = "auto" if settings.method == "auto" else "color"
+                settings = settings.copy(method=method, target_color=target_color,
+                                         tolerance=tolerance)
+                result.color_detected = True
+
+        crop_bbox = tuple(int(v) for v in bbox)
+        if source is image:
+            result.bbox = crop_bbox
+        else:
+            # Report where the NIK is on the input; crop from the flat card
+            result.card_rectified = True
+            result.bbox = quad_bounds(result.quad, image.shape)
+            if image_key is not None:
+                image_key = (image_key, "card")
+        result.method = settings.method
+        result.target_color = settings.target_color
+        result.tolerance = settings.tolerance
+
+        x1, y1, x2, y2 = crop_bbox
+        roi = source[y1:y2, x1:x2]
+        if roi.size == 0:
+            result.error = "empty selection"
+            return None
+        return roi, crop_bbox, settings, image_key
+
+    def apply_corrections(self, result, settings):
+        """Apply stored corrections to ``result.raw``; ``ocr_raw`` keeps the OCR read"""
+        if not settings.corrections_path:
+            return
+        t = time.perf_counter()
+        store = get_correction_store(settings.corrections_path)
+        corrected, confs, how = store.apply(result.raw, result.digit_confidences)
+        # A confusion rewrite must not break a read that was already valid
+        if how != "confusion" or is_valid_nik(corrected) or not is_valid_nik(result.raw):
+            result.raw, result.digit_confidences, result.correction = corrected, confs, how
+        result.timings["correct"] = time.perf_counter() - t
+
+    def ensemble_jobs(self, settings):
+        """Settings of each method the "auto" ensemble reads the strip with"""
+        return [settings.copy(method=method, corrections_path=None)
+                for method in ENSEMBLE_METHODS
+                if method != "color" or settings.target_color is not None]
+
+    def read_single(self, roi, crop_bbox, settings, cache, image_key, cancel, result):
+        """Preprocess and OCR the strip with one method, filling ``result``.
+
+        Returns the cache entry so segmentation can reuse the processed strip.
+        """
+        t = time.perf_counter()
+        entry = self.preprocess_cached(roi, crop_bbox, settings, cache, image_key)
+        processed = entry.processed
+        result.timings["preprocess"] = time.perf_counter() - t
+        result.processed = processed
+
+        check_cancelled(cancel)
+        read = None
+        if settings.ocr_engine == "classifier":
+            t = time.perf_counter()
+            result.digit_images = self.segment_cached(entry)
+            result.timings["segment"] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            read = self.classify(result.digit_images, settings)
+            if read is not None:
+                ocr_raw = read[0]
+                read = trusted_decode(*read, confusion=self.confusion(settings),
+                                      low_confidence=settings.min_confidence)
+            result.timings["classify"] = time.perf_counter() - t
+            if read is not None:
+                result.ocr_engine = "classifier"
+                result.raw, result.digit_confidences = read
+                result.ocr_raw = ocr_raw
+
+        # Tesseract, or the fallback when the model is missing, segmentation
+        # did not produce exactly 16 crops or no trusted NIK could be decoded
+        if read is None:
+            t = time.perf_counter()
+            read = self.recognize(processed, settings, cancel)
+            result.ocr_engine = "tesseract"
+            (result.raw, result.digit_confidences, result.psm, result.ocr_passes,
+             result.ocr_raw) = read
+            result.timings["ocr"] = time.perf_counter() - t
+
+        return entry
+
+    def read_ensemble(self, roi, settings, cancel=None):
+        """Read the strip with every preprocessing method, ``{method: (digits, confidences)}``.
+
+        With a pool the methods run in parallel worker processes; color is
+        skipped while no text color is known. Each method's trace is merged
+        into the caller's.
+        """
+        trace = current_trace()
+        jobs = self.ensemble_jobs(settings)
+        reads = {}
+        if self.pool is None:
+            for job in jobs:
+                check_cancelled(cancel)
+                method, digits, confs, stages = read_method(roi, job, self)
+                reads[method] = (digits, confs)
+                if trace is not None:
+                    trace.merge(stages)
+            return reads
+
+        futures = [self.pool.submit(read_method, roi, job) for job in jobs]
+        pending = set(futures)
+        while pending:
+            if cancel is not None and cancel.is_set():
+                for future in pending:
+                    future.cancel()
+                raise ExtractionCancelled()
+            done, pending = wait(pending, timeout=0.05)
+            for future in done:
+                if future.exception() is not None:
+                    # Raised like on the sequential path, the other methods would fail alike
+                    for other in pending:
+                        other.cancel()
+                method, digits, confs, stages = future.result()
+                reads[method] = (digits, confs)
+                if trace is not None:
+                    trace.merge(stages)
+        return reads
+
+    def locate_nik(self, image, timings=None):
+        """Find the NIK line, rectifying the card first when its outline is visible.
+
+        Returns ``(source, bbox, color, quad)``: the image ``bbox`` refers to
+        (the warped card or ``image`` itself), the text color, and the NIK
+        region as four corners in ``image`` coordinates. Time spent on text
+        color detection is added to ``timings["color"]`` when given.
+        """
+        quad = find_card_quad(image)
+        if quad is not None:
+            card, matrix = warp_card(image, quad)
+            bbox, color = self.detect_fixed_region(card, timings)
+            if bbox is not None:
+                x1, y1, x2, y2 = bbox
+                corners = np.array([[[x1, y1], [x2, y1], [x2, y2], [x1, y2]]], np.float32)
+                corners = cv2.perspectiveTransform(corners, np.linalg.inv(matrix))[0]
+                return card, bbox, color, corners
+
+        bbox, color = self.detect_fixed_region(image, timings)
+        if bbox is None:
+            return image, None, color, None
+        x1, y1, x2, y2 = bbox
+        return image, bbox, color, np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], np.float32)
+
+    def detect_region(self, image):
+        """Automatically detect NIK region in Indonesian ID card.
+
+        Returns ``(bbox, color)`` where ``bbox`` is in ``image`` coordinates
+        and ``color`` is ``(target_color, tolerance)`` sampled from the card
+        text, or None.
+        """
+        _, bbox, color, quad = self.locate_nik(image)
+        if bbox is None:
+            return None, color
+        return quad_bounds(quad, image.shape), color
+
+    @traced("detect_region")
+    def detect_fixed_region(self, image, timings=None):
+        """NIK region at the fixed KTP ratios of an upright card filling ``image``"""
+        h, w = image.shape[:2]
+
+        # Fixed NIK locations based on Indonesian ID card structure
+        roi_top = int(h * 0.15)
+        roi_bottom = int(h * 0.25)
+        roi_left = int(w * 0.2)
+        roi_right = int(w * 0.75)
+
+        # Extract potential NIK region
+        roi = image[roi_top:roi_bottom, roi_left:roi_right]
+
+        if roi.size == 0:
+            return None, None
+
+        # Coarse pass on a pyramid level, so its cost does not depend on resolution
+        levels = pyramid_levels(image.shape)
+        factor = 0.5 ** levels
+        coarse = pyr_down(roi, levels)
+
+        gray = cv2.cvtColor(coarse, cv2.COLOR_BGR2GRAY)
+        processed = self.enhance_nik_region(gray)
+
+        contours, _ = cv2.findContours(processed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        # Filter contours by size and aspect ratio (limits are full-resolution pixels)
+        potential_nik_contours = []
+        for contour in contours:
+            x, y, cw, ch = cv2.boundingRect(contour)
+            area = cv2.contourArea(contour)
+
+            # Look for contours that could contain NIK digits
+            if (area > 100 * factor * factor and ch > 15 * factor and cw > 100 * factor and
+                ch/cw < 1.0 and ch/cw > 0.1):
+                potential_nik_contours.append((x, y, cw, ch))
+
+        if not potential_nik_contours:
+            # Try alternative approach - look for text blocks
+            return (self.find_nik_by_text_structure(roi, roi_left, roi_top),
+                    self.timed_text_color(coarse, timings))
+
+        # Sort by position and take the top-most candidate
+        potential_nik_contours.sort(key=lambda c: (c[1], c[0]))
+        x, y, cw, ch = (int(round(v / factor)) for v in potential_nik_contours[0])
+        if levels:
+            x, y, cw, ch = self.refine_line(roi, (x, y, cw, ch), factor)
+
+        # Expand the region slightly
+        padding_x = 10
+        padding_y = 5
+        x = max(0, x - padding_x)
+        y = max(0, y - padding_y)
+        cw = min(roi.shape[1] - x, cw + 2 * padding_x)
+        ch = min(roi.shape[0] - y, ch + 2 * padding_y)
+
+        # Sampled so color detection, like the coarse pass, does not grow with resolution
+        color = self.timed_text_color(sample_pixels(roi[y:y + ch, x:x + cw]), timings)
+
+        # Convert back to original image coordinates
+        abs_x = roi_left + x
+        abs_y = roi_top + y
+
+        return (abs_x, abs_y, abs_x + cw, abs_y + ch), color
+
+    @traced("refine")
+    def refine_line(self, roi, rect, factor):
+        """Tighten a coarse (x, y, w, h) at full resolution inside a small window.
+
+        The window covers the coarse box plus the pixels it may have lost to
+        downscaling; text is merged into lines and the widest line centered
+        in the coarse row wins. Falls back to ``rect``.
+        """
+        x, y, cw, ch = rect
+        slack = int(np.ceil(2 / factor))
+        wx1 = max(0, x - slack - cw // 10)
+        wy1 = max(0, y - slack - ch // 2)
+        wx2 = min(roi.shape[1], x + cw + slack + cw // 10)
+        wy2 = min(roi.shape[0], y + ch + slack + ch // 2)
+        window = roi[wy1:wy2, wx1:wx2]
+        if window.size == 0:
+            return rect
+
+        gray = cv2.cvtColor(window, cv2.COLOR_BGR2GRAY)
+        _, text = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        # Close the gaps between digits so a NIK becomes one component
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, int(ch * 0.6)), 1))
+        lines = cv2.morphologyEx(text, cv2.MORPH_CLOSE, kernel)
+
+        n, _, stats, _ = cv2.connectedComponentsWithStats(lines, connectivity=8)
+        best = None
+        for i in range(1, n):
+            lx, ly, lw, lh = stats[i, :4]
+            center_y = wy1 + ly + lh / 2.0
+            if not y <= center_y <= y + ch or lw < cw // 2 or lh > 2 * ch:
+                continue
+            if best is None or lw > best[2]:
+                best = (wx1 + lx, wy1 + ly, lw, lh)
+        return tuple(int(v) for v in best) if best else rect
+
+    def timed_text_color(self, roi, timings=None):
+        t = time.perf_counter()
+        color = self.detect_text_color(roi)
+        if timings is not None:
+            timings["color"] = timings.get("color", 0.0) + time.perf_counter() - t
+        return color
+
+    @traced("text_color")
+    def detect_text_color(self, roi):
+        """Detect text color from region, returns (target_color, tolerance) or None"""
+        if roi.size == 0:
+            return None
+
+        # Calculate standard deviation to determine color variation
+        std_bgr = np.std(roi, axis=(0, 1))
+        avg_std = np.mean(std_bgr)
+
+        # More variation = higher tolerance
+        tolerance = int(20 + avg_std * 0.5)
+        tolerance = min(80, max(20, tolerance))
+
+        # Find dominant dark colors (likely text)
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+        text_mask = binary == 0
+        if np.sum(text_mask) == 0:
+            return None
+
+        text_pixels = roi[text_mask]
+        avg_color = np.median(text_pixels, axis=0)
+        return tuple(map(int, avg_color)), tolerance
+
+    @traced("text_structure")
+    def find_nik_by_text_structure(self, roi, roi_left, roi_top):
+        """Find NIK by analyzing text structure and patterns.
+
+        One ``image_to_data`` pass per PSM gives both the text and the word
+        boxes, so a 16-digit line comes with its coordinates. Stops at the
+        first run that is a valid NIK (allowing one low-confidence digit to be
+        decoded); otherwise returns the first 16-digit run, or None.
+        """
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+        enhanced = self.enhance_nik_region(gray)
+
+        # First 16-digit run that is not a valid NIK, used if no valid one turns up
+        fallback = None
+        for psm in TEXT_PSMS:
+            try:
+                data = self.backend.image_to_data(enhanced, psm=psm)
+            except OCR_PASS_ERRORS:
+                continue
+
+            for digits, confs, (x1, y1, x2, y2) in digit_runs(data):
+                if len(digits) != NIK_LENGTH:
+                    continue
+                bbox = (roi_left + x1, roi_top + y1, roi_left + x2, roi_top + y2)
+                if trusted_decode(digits, confs) is not None:
+                    return bbox
+                if fallback is None:
+                    fallback = bbox
+
+        return fallback
+
+    @traced("enhance")
+    def enhance_nik_region(self, gray_image):
+        """Enhance NIK region for better detection"""
+        # Bilateral filter reduces noise while keeping edges sharp
+        denoised = cv2.bilateralFilter(gray_image, 9, 75, 75)
+
+        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+        enhanced = clahe.apply(denoised)
+
+        binary = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                      cv2.THRESH_BINARY, 11, 2)
+
+        kernel = np.ones((2, 2), np.uint8)
+        cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+
+        return cleaned
+
+    def preview(self, image, settings=None, max_width=360, max_height=120):
+        """Cheap preprocessing at preview-canvas resolution for live feedback"""
+        h, w = image.shape[:2]
+        if h == 0 or w == 0:
+            return np.full((max_height, max_width), 255, np.uint8)
+
+        fit = min(max_width / w, max_height / h)
+        interp = cv2.INTER_LINEAR if fit > 1.0 else cv2.INTER_AREA
+        small = cv2.resize(image, (max(1, int(w * fit)), max(1, int(h * fit))),
+                           interpolation=interp)
+        return self.preprocess(small, settings, scale=1.0)
+
+    @traced("preprocess")
+    def preprocess(self, image, settings=None, scale=None):
+        """Advanced preprocessing for NIK number recognition.
+
+        ``scale`` overrides ``settings.scale``; when both are None the factor
+        is derived from the digit height (see ``adaptive_scale``).
+        """
+        settings = settings or self.settings
+        method = settings.method
+        # The ensemble shows and segments the adaptive strip
+        if method == "auto":
+            method = "adaptive"
+        if scale is None:
+            scale = settings.scale
+
+        if method == "color" and settings.target_color is not None and len(image.shape) == 3:
+            return self.preprocess_color(image, settings, scale)
+
+        if len(image.shape) == 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = image.copy()
+
+        # Denoise before upscaling: same effect on 1/25th of the pixels
+        gray = denoise(gray, settings.denoise_mode(), NLM_STRENGTH.get(method, 12))
+
+        if scale is None:
+            _, text_mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+            scale = adaptive_scale(text_mask)
+        denoised = resize_by(gray, scale)
+
+        if method == "edge":
+            edges = cv2.Canny(denoised, 50, 150)
+            kernel = np.ones((3,3), np.uint8)
+            dilated = cv2.dilate(edges, kernel, iterations=2)
+            filled = cv2.morphologyEx(dilated, cv2.MORPH_CLOSE, kernel, iterations=2)
+            return filled
+
+        elif method == "contrast":
+            clahe = cv2.createCLAHE(clipLimit=4.0, tileGridSize=(4,4))
+            enhanced = clahe.apply(denoised)
+            kernel_sharpen = np.array([[-1,-1,-1], [-1, 9,-1], [-1,-1,-1]])
+            sharpened = cv2.filter2D(enhanced, -1, kernel_sharpen)
+            _, binary = cv2.threshold(sharpened, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            kernel = np.ones((2,2), np.uint8)
+            cleaned = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, iterations=1)
+            return cleaned
+
+        else:
+            bilateral = cv2.bilateralFilter(denoised, 9, 75, 75)
+            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+            enhanced = clahe.apply(bilateral)
+
+            binary1 = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                           cv2.THRESH_BINARY, blockSize=15, C=10)
+            binary2 = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                           cv2.THRESH_BINARY, blockSize=25, C=15)
+            binary = cv2.bitwise_and(binary1, binary2)
+
+            kernel_small = np.ones((2,2), np.uint8)
+            kernel_medium = np.ones((3,3), np.uint8)
+            opened = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel_small, iterations=1)
+            closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, kernel_medium, iterations=1)
+            cleaned = cv2.medianBlur(closed, 3)
+
+            return cleaned
+
+    def preprocess_cached(self, roi, bbox, settings=None, cache=None, image_key=None):
+        """Preprocess ``roi`` through ``cache``, returns a CacheEntry"""
+        settings = settings or self.settings
+        if cache is None or image_key is None:
+            return CacheEntry(self.preprocess(roi, settings))
+
+        key = cache.make_key(image_key, bbox, settings)
+        entry = cache.get(key)
+        if entry is None:
+            entry = cache.put(key, self.preprocess(roi, settings))
+        return entry
+
+    def segment_cached(self, entry):
+        """Segmented digits of a CacheEntry, computed on first use"""
+        if entry.digits is None:
+            entry.digits = self.segment_digits(entry.processed)
+        return entry.digits
+
+    def preprocess_color(self, image, settings, scale=None):
+        """Color method: mask at native resolution, then upscale only the mask.
+
+        Upscaling the 3-channel ROI first costs 25x the pixels in both the
+        resize and inRange for the same result.
+        """
+        mask = color_mask(image, settings.target_color, settings.tolerance,
+                          settings.color_space)
+        if scale is None:
+            scale = adaptive_scale(mask)
+
+        # Text black on white
+        result = cv2.bitwise_not(mask)
+
+        if scale != 1.0:
+            result = resize_by(result, scale, cv2.INTER_LINEAR)
+            _, result = cv2.threshold(result, 127, 255, cv2.THRESH_BINARY)
+
+        kernel = np.ones((2,2), np.uint8)
+        result = cv2.morphologyEx(result, cv2.MORPH_CLOSE, kernel, iterations=1)
+        result = cv2.morphologyEx(result, cv2.MORPH_OPEN, kernel, iterations=1)
+
+        return result
+
+    @traced("classify")
+    def classify(self, digit_images, settings=None):
+        """Classify 16 segmented crops in one batch, or None to fall back to Tesseract"""
+        settings = settings or self.settings
+        if len(digit_images) != NIK_LENGTH:
+            return None
+        model = get_classifier(settings.model_path)
+        if model is None:
+            return None
+        return model.predict(digit_images)
+
+    def confusion(self, settings):
+        """Per-position confusion lookup learned from corrections, or None"""
+        if not settings.corrections_path:
+            return None
+        return get_correction_store(settings.corrections_path).alternatives
+
+    @traced("recognize")
+    def recognize(self, processed, settings=None, cancel=None):
+        """OCR the processed strip with an early-exit PSM cascade.
+
+        Every 16-digit read is passed through the NIK decoder, which may swap
+        one low-confidence digit for its most likely alternative so the
+        number passes the structure rules; reads needing more stay as read.
+        PSMs are tried in order of past success and the cascade stops at the
+        first valid NIK with mean confidence of at least
+        ``settings.min_confidence``. Otherwise the best read wins: valid
+        first, then 16 digits, then the longest, then the most confident. A failed pass moves on to the next PSM; any
+        other backend error (e.g. Tesseract not installed) propagates.
+
+        Returns ``(digits, confidences, psm, passes, ocr_raw)``.
+        """
+        settings = settings or self.settings
+        cascade = PsmCascade(settings, self.confusion(settings), self.psm_stats)
+        for psm in cascade.order():
+            check_cancelled(cancel)
+            try:
+                read = self.read_digits(processed, psm)
+            except OCR_PASS_ERRORS as e:
+                cascade.fail(e)
+                continue
+            if cascade.offer(psm, *read):
+                break
+        return cascade.result()
+
+    def read_digits(self, image, psm):
+        """Single Tesseract pass.
+
+        Returns digits, a confidence per digit and, when the backend reports
+        them, the alternative characters per digit (otherwise None).
+        """
+        symbols = self.backend.image_to_symbols(image, psm=psm, whitelist=DIGIT_WHITELIST)
+        if symbols is not None:
+            digits = ""
+            confs = []
+            alternatives = []
+            for text, conf, choices in symbols:
+                if len(text) != 1 or not text.isdigit():
+                    continue
+                digits += text
+                confs.append(max(0.0, float(conf)))
+                alternatives.append({c: conf for c, conf in choices.items() if c.isdigit()})
+            return digits, confs, alternatives
+
+        data = self.backend.image_to_data(image, psm=psm, whitelist=DIGIT_WHITELIST)
+        digits, confs = digits_from_data(data)
+        return digits, confs, None
+
+    @traced("segment")
+    def segment_digits(self, processed_img):
+        """Segment individual digits from processed image"""
+        contours, _ = cv2.findContours(255 - processed_img, cv2.RETR_EXTERNAL,
+                                       cv2.CHAIN_APPROX_SIMPLE)
+
+        if not contours:
+            return []
+
+        digit_contours = []
+        h, w = processed_img.shape
+        min_area = (h * w) * 0.001
+
+        for cnt in contours:
+            x, y, cw, ch = cv2.boundingRect(cnt)
+            area = cv2.contourArea(cnt)
+
+            if area > min_area and 0.2 < ch/cw < 5:
+                digit_contours.append((x, y, cw, ch))
+
+        digit_contours.sort(key=lambda c: c[0])
+
+        digits = []
+        for x, y, cw, ch in digit_contours:
+            pad = 2
+            x1 = max(0, x - pad)
+            y1 = max(0, y - pad)
+            x2 = min(w, x + cw + pad)
+            y2 = min(h, y + ch + pad)
+
+            digits.append(processed_img[y1:y2, x1:x2])
+
+        return digits
@@ -0,0 +1,115 @@
+"""Preprocessing ensemble behind ``method="auto"``.
+
+Every preprocessing method reads the same NIK strip, in worker processes when
+a pool is given, and the reads are combined by per-position digit voting
+weighted by OCR confidence. The voted digits then go through the NIK decoder
+with the losing votes as alternatives.
+"""
+import os
+import threading
+
+from nik_validator import DEFAULT_MIN_CONFIDENCE, NIK_LENGTH, is_valid_nik, trusted_decode
+
+ENSEMBLE_METHODS = ("adaptive", "color", "edge", "contrast")
+
+# Weight of a vote read with zero confidence, so it still breaks ties
+MIN_VOTE_WEIGHT = 1.0
+
+# Per-process engine of the ensemble pool
+_extractor = None
+
+
+def _init_worker():
+    global _extractor
+    from nik_engine import NikExtractor
+
+    _extractor = NikExtractor()
+
+
+def read_method(roi, settings, extractor=None):
+    """OCR a NIK strip with one method.
+
+    Returns ``(method, digits, confidences, trace)`` with the run's trace as
+    a dict, so stages timed in a worker process reach the caller.
+    """
+    if extractor is None:
+        if _extractor is None:
+            _init_worker()
+        extractor = _extractor
+    h, w = roi.shape[:2]
+    result = extractor.extract(roi, bbox=(0, 0, w, h), settings=settings)
+    return settings.method, result.raw, result.digit_confidences, result.trace.to_dict()
+
+
+def vote_reads(reads, confusion=None, low_confidence=DEFAULT_MIN_CONFIDENCE):
+    """Combine ``[(digits, confidences)]`` into one read by weighted voting.
+
+    Only 16-digit reads can be aligned position by position; without any,
+    the longest, most confident read is returned unchanged. Each position
+    goes to the digit with the most confidence-weighted votes. A digit's
+    confidence is the best confidence it was read with, scaled by its share
+    of the votes, so agreement never lowers it. The plurality read is kept
+    when it is a valid NIK; otherwise the decoder may swap in a losing vote,
+    but only at a single position whose winner is below ``low_confidence``.
+    Returns ``(digits, confidences, plurality)``, ``plurality`` being the
+    voted digits before decoding.
+    """
+    reads = [(digits, list(confs)) for digits, confs in reads]
+    full = [(digits, confs) for digits, confs in reads if len(digits) == NIK_LENGTH]
+    if not full:
+        if not reads:
+            return "", [], ""
+        digits, confs = max(reads, key=lambda r: (len(r[0]),
+                                                  sum(r[1]) / len(r[1]) if r[1] else 0.0))
+        return digits, confs, digits
+
+    votes = [{} for _ in range(NIK_LENGTH)]
+    best_conf = [{} for _ in range(NIK_LENGTH)]
+    for digits, confs in full:
+        for i, digit in enumerate(digits):
+            conf = confs[i] if i < len(confs) else 0.0
+            votes[i][digit] = votes[i].get(digit, 0.0) + max(MIN_VOTE_WEIGHT, conf)
+            best_conf[i][digit] = max(best_conf[i].get(digit, 0.0), conf)
+
+    digits = ""
+    confs = []
+    alternatives = []
+    for position, best in zip(votes, best_conf):
+        total = sum(position.values())
+        ranked = {d: min(100.0, best[d]) * w / total for d, w in position.items()}
+        winner = max(position, key=position.get)
+        digits += winner
+        confs.append(ranked[winner])
+        alternatives.append({d: c for d, c in ranked.items() if d != winner})
+
+    if is_valid_nik(digits):
+        return digits, confs, digits
+    decoded = trusted_decode(digits, confs, alternatives, confusion, low_confidence)
+    if decoded is None:
+        # Kept as voted, and so reported invalid
+        return digits, confs, digits
+    return decoded[0], decoded[1], digits
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ensemble_pool(workers=None):
+    """Process-wide worker pool for the ensemble, processes start on first use"""
+    global _pool
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _pool_lock:
+        if _pool is None:
+            workers = workers or min(len(ENSEMBLE_METHODS), os.cpu_count() or 1)
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        return _pool
+
+
+def shutdown_ensemble_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,475 @@
+"""Local HTTP service around the headless NIK pipeline.
+
+    python nik_server.py --port 8765 --workers 4
+    curl --data-binary @ktp.jpg -H "Content-Type: image/jpeg" localhost:8765/extract
+    curl -F image=@ktp.jpg "localhost:8765/extract?method=auto"
+    curl -d '{"path": "/scans/ktp.jpg"}' localhost:8765/extract   # needs --allow-path /scans
+    curl localhost:8765/health
+    curl localhost:8765/metrics
+
+Worker processes are started once and keep their NikExtractor (and OCR
+engine) loaded. Requests that arrive within a few milliseconds of each other
+are grouped and sent to the workers in batches, one IPC round trip per
+batch instead of per card.
+"""
+import argparse
+import base64
+import email.parser
+import email.policy
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2 # type: ignore
+import numpy as np # type: ignore
+
+from nik_engine import (NikExtractor, NikSettings, METHODS, COLOR_SPACES, DENOISE_MODES,
+                        OCR_ENGINES, DEFAULT_MIN_CONFIDENCE)
+from nik_trace import Trace
+from ocr_backend import ENGINE_ERRORS, EngineUnavailable, configure_tesseract
+
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+WARMUP_TIMEOUT = 120.0
+
+# Request fields that override the server's default settings
+SETTING_FIELDS = {
+    "method": str,
+    "color_space": str,
+    "denoise": str,
+    "ocr_engine": str,
+    "min_confidence": float,
+    "scale": float,
+    "tolerance": int,
+}
+
+# Per-process engine and start-up barrier, set once by the pool initializer
+_extractor = None
+_warmup_barrier = None
+
+
+def _init_worker(settings, barrier=None):
+    """Create this worker's engine"""
+    global _extractor, _warmup_barrier
+    _extractor = NikExtractor(NikSettings(**settings))
+    _warmup_barrier = barrier
+
+
+def _warm_worker():
+    """Load this worker's OCR engine before the first request.
+
+    Every warm-up task waits on the barrier until all workers hold one, so
+    one task per worker cannot land twice on the same process.
+    """
+    if _warmup_barrier is not None:
+        _warmup_barrier.wait(WARMUP_TIMEOUT)
+    try:
+        _extractor.backend.image_to_string(np.full((32, 96), 255, np.uint8))
+    except ENGINE_ERRORS as e:
+        raise EngineUnavailable(str(e)) from None
+
+
+def process_batch(jobs):
+    """Extract a batch of ``{"image": bytes | "path": str, "bbox", "settings"}`` jobs.
+
+    Raises EngineUnavailable when the OCR engine cannot run at all, which
+    fails the whole batch instead of every card in it.
+    """
+    rows = []
+    for job in jobs:
+        start = time.perf_counter()
+        row = {}
+        try:
+            if job.get("path"):
+                image = cv2.imread(job["path"])
+            else:
+                image = cv2.imdecode(np.frombuffer(job["image"], np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                row["error"] = "failed to decode image"
+            else:
+                settings = _extractor.settings.copy(**job.get("settings", {}))
+                row.update(_extractor.extract(image, bbox=job.get("bbox"),
+                                              settings=settings).to_dict())
+        except ENGINE_ERRORS as e:
+            raise EngineUnavailable(str(e)) from None
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+        row["seconds"] = round(time.perf_counter() - start, 4)
+        rows.append(row)
+    return rows
+
+
+class MicroBatcher:
+    """Groups queued jobs and spreads each group over the worker pool.
+
+    The batcher waits up to ``window`` seconds after the first job for more
+    to arrive, takes at most ``max_batch`` jobs per worker and splits them
+    into one batch per worker. The queue is bounded; ``submit`` raises
+    ``queue.Full`` when the service is saturated.
+    """
+    def __init__(self, pool, workers, metrics, max_batch=4, window=0.01, max_queue=256):
+        self.pool = pool
+        self.workers = workers
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.window = window
+        self.queue = queue.Queue(maxsize=max_queue)
+        # At most two batches per worker in flight, the rest wait in the queue
+        self._slots = threading.Semaphore(workers * 2)
+        self._thread = threading.Thread(target=self._run, name="nik-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, job):
+        future = Future()
+        self.queue.put_nowait((job, future, time.perf_counter()))
+        return future
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _collect(self):
+        first = self.queue.get()
+        if first is None:
+            return None
+        items = [first]
+        deadline = time.perf_counter() + self.window
+        limit = self.max_batch * self.workers
+        while len(items) < limit:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)
+                break
+            items.append(item)
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            if items is None:
+                return
+            chunks = min(self.workers, len(items))
+            for i in range(chunks):
+                batch = items[i::chunks]
+                self._slots.acquire()
+                self.metrics.batch(len(batch))
+                try:
+                    pool_future = self.pool.submit(process_batch, [job for job, _, _ in batch])
+                except Exception as e:
+                    self._slots.release()
+                    for _, future, _ in batch:
+                        future.set_exception(e)
+                    continue
+                pool_future.add_done_callback(lambda f, batch=batch: self._deliver(batch, f))
+
+    def _deliver(self, batch, pool_future):
+        self._slots.release()
+        try:
+            rows = pool_future.result()
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, queued), row in zip(batch, rows):
+            row["queue_seconds"] = round(time.perf_counter() - queued - row.get("seconds", 0.0), 4)
+            future.set_result(row)
+
+
+class Metrics:
+    """Counters, recent latencies and summed stage traces"""
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=1000)
+        self.trace = Trace()
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def end(self, seconds, row=None, error=False):
+        with self._lock:
+            self.in_flight -= 1
+            self.latencies.append(seconds)
+            if error or (row and row.get("error")):
+                self.errors += 1
+            if row and row.get("trace"):
+                self.trace.merge(row["trace"])
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+            self.in_flight -= 1
+
+    def batch(self, size):
+        with self._lock:
+            self.batches += 1
+            self.batched_items += size
+
+    def to_dict(self, queue_depth=0):
+        with self._lock:
+            latencies = sorted(self.latencies)
+
+            def pct(q):
+                if not latencies:
+                    return 0.0
+                return round(1000 * latencies[min(len(latencies) - 1, int(q * len(latencies)))], 2)
+
+            return {
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "requests": self.requests,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "in_flight": self.in_flight,
+                "queue_depth": queue_depth,
+                "batches": self.batches,
+                "mean_batch_size": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+                "latency_ms": {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99)},
+                "stages": self.trace.to_dict(),
+            }
+
+
+class NikServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher, metrics, workers, allowed_paths=(), timeout=60.0):
+        super().__init__(address, NikRequestHandler)
+        self.batcher = batcher
+        self.metrics = metrics
+        self.workers = workers
+        self.allowed_paths = [os.path.realpath(p) for p in allowed_paths]
+        self.request_timeout = timeout
+
+    def path_allowed(self, path):
+        real = os.path.realpath(path)
+        return any(os.path.commonpath([real, root]) == root for root in self.allowed_paths)
+
+
+def parse_bbox(value):
+    """``[x1, y1, x2, y2]`` or ``"x1,y1,x2,y2"`` -> tuple of ints, or None"""
+    if value in (None, ""):
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    bbox = tuple(int(float(v)) for v in value)
+    if len(bbox) != 4:
+        raise ValueError("bbox needs 4 values: x1,y1,x2,y2")
+    return bbox
+
+
+def parse_settings(fields):
+    """Validated NikSettings overrides from request fields"""
+    settings = {}
+    for name, cast in SETTING_FIELDS.items():
+        if fields.get(name) not in (None, ""):
+            settings[name] = cast(fields[name])
+    choices = {"method": METHODS, "color_space": COLOR_SPACES, "denoise": DENOISE_MODES,
+               "ocr_engine": OCR_ENGINES}
+    for name, allowed in choices.items():
+        if name in settings and settings[name] not in allowed:
+            raise ValueError(f"{name} must be one of {', '.join(allowed)}")
+    if fields.get("target_color"):
+        color = fields["target_color"]
+        if isinstance(color, str):
+            color = color.split(",")
+        settings["target_color"] = tuple(int(c) for c in color)
+    return settings
+
+
+class NikRequestHandler(BaseHTTPRequestHandler):
+    server_version = "NikServer/1.0"
+
+    def log_message(self, format, *args):
+        # Access log only on errors, the metrics endpoint covers the rest
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self.send_json(200, {"status": "ok", "workers": self.server.workers,
+                                 "queue_depth": self.server.batcher.queue.qsize()})
+        elif url.path == "/metrics":
+            self.send_json(200, self.server.metrics.to_dict(self.server.batcher.queue.qsize()))
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/extract":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            self.send_json(400, {"error": "empty request body"})
+            return
+        if length > MAX_UPLOAD_BYTES:
+            self.send_json(413, {"error": f"upload larger than {MAX_UPLOAD_BYTES} bytes"})
+            return
+
+        body = self.rfile.read(length)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            job = self.parse_job(body, self.headers.get("Content-Type", ""), query)
+        except PermissionError as e:
+            self.send_json(403, {"error": str(e)})
+            return
+        except (ValueError, TypeError, KeyError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        metrics = self.server.metrics
+        metrics.begin()
+        start = time.perf_counter()
+        try:
+            future = self.server.batcher.submit(job)
+        except queue.Full:
+            metrics.reject()
+            self.send_json(503, {"error": "server busy, retry later"})
+            return
+
+        try:
+            row = future.result(timeout=self.server.request_timeout)
+        except EngineUnavailable as e:
+            metrics.end(time.perf_counter() - start, error=True)
+            self.send_json(503, {"error": f"OCR engine unavailable: {e}"})
+            return
+        except Exception as e:
+            metrics.end(time.perf_counter() - start, error=True)
+            status = 504 if isinstance(e, FutureTimeout) else 500
+            self.send_json(status, {"error": f"{type(e).__name__}: {e}"})
+            return
+
+        metrics.end(time.perf_counter() - start, row)
+        self.send_json(200, row)
+
+    def parse_job(self, body, content_type, query):
+        """Build a worker job from a raw image, multipart upload or JSON body"""
+        fields = dict(query)
+        image = None
+        mime = content_type.split(";")[0].strip().lower()
+
+        if mime == "application/json":
+            fields.update(json.loads(body.decode("utf-8")))
+            if fields.get("image"):
+                image = base64.b64decode(fields["image"])
+        elif mime == "multipart/form-data":
+            message = email.parser.BytesParser(policy=email.policy.default).parsebytes(
+                b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                payload = part.get_payload(decode=True) or b""
+                if name == "image":
+                    image = payload
+                elif name:
+                    fields[name] = payload.decode("utf-8")
+        else:
+            # Raw image bytes (image/jpeg, image/png, application/octet-stream)
+            image = body
+
+        job = {"bbox": parse_bbox(fields.get("bbox")), "settings": parse_settings(fields)}
+        if image:
+            job["image"] = image
+        elif fields.get("path"):
+            if not self.server.path_allowed(fields["path"]):
+                raise PermissionError("path is outside the --allow-path folders")
+            job["path"] = fields["path"]
+        else:
+            raise ValueError("send an image (raw body, multipart 'image' or base64) or a 'path'")
+        return job
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Local HTTP NIK extraction service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--max-batch", type=int, default=4,
+                        help="Most requests sent to one worker in a single batch")
+    parser.add_argument("--batch-window-ms", type=float, default=10.0,
+                        help="How long to wait for more requests before dispatching")
+    parser.add_argument("--max-queue", type=int, default=256,
+                        help="Queued requests before answering 503")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout (s)")
+    parser.add_argument("--allow-path", action="append", default=[], metavar="DIR",
+                        help="Allow {\"path\": ...} requests for files under DIR (repeatable)")
+    parser.add_argument("--method", choices=METHODS, default="adaptive",
+                        help="Default preprocessing method")
+    parser.add_argument("--tesseract", metavar="PATH",
+                        help="tesseract binary (default: $TESSERACT_CMD or from PATH)")
+    parser.add_argument("--ocr", choices=OCR_ENGINES, default="tesseract")
+    parser.add_argument("--corrections", metavar="DB", help="Apply stored corrections")
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.tesseract:
+        configure_tesseract(args.tesseract)
+    workers = max(1, args.workers or 1)
+    settings = NikSettings(method=args.method, ocr_engine=args.ocr,
+                           corrections_path=args.corrections,
+                           min_confidence=args.min_confidence)
+
+    barrier = multiprocessing.Barrier(workers)
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(settings.to_dict(), barrier))
+    # Start every worker and load its OCR engine before accepting requests
+    try:
+        for future in [pool.submit(_warm_worker) for _ in range(workers)]:
+            future.result()
+    except ENGINE_ERRORS as e:
+        pool.shutdown(wait=False, cancel_futures=True)
+        print(f"OCR engine unavailable: {e}", file=sys.stderr)
+        return 2
+
+    metrics = Metrics()
+    batcher = MicroBatcher(pool, workers, metrics, max_batch=args.max_batch,
+                           window=args.batch_window_ms / 1000.0, max_queue=args.max_queue)
+    server = NikServer((args.host, args.port), batcher, metrics, workers,
+                       allowed_paths=args.allow_path, timeout=args.timeout)
+    print(f"NIK server on http://{args.host}:{args.port} with {workers} workers",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        pool.shutdown(wait=True, cancel_futures=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Synthetic KTP-like images with known NIKs, for benchmarks.
+
+A flat card is drawn in the canonical KTP frame with the NIK line where the
+detector expects it, then placed on a background and distorted (rotation,
+color cast, blur, noise, JPEG). Everything is driven by a seeded
+``random.Random`` so a benchmark run can be reproduced exactly.
+"""
+import random
+
+import cv2 # type: ignore
+import numpy as np # type: ignore
+
+from nik_engine import KTP_SIZE
+from nik_validator import DAYS_IN_MONTH, PROVINCE_CODES
+
+FONTS = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX,
+         cv2.FONT_HERSHEY_COMPLEX, cv2.FONT_HERSHEY_TRIPLEX)
+
+# BGR: black, navy, dark brown
+TEXT_COLORS = ((25, 25, 25), (90, 40, 15), (30, 45, 70))
+
+# Upper bound of each distortion, drawn uniformly per image
+DEFAULT_DISTORTIONS = {
+    "rotation": 6.0,        # degrees
+    "color_cast": 0.2,      # per-channel gain deviation
+    "blur": 1.5,            # gaussian sigma in px
+    "noise": 10.0,          # gaussian std in gray levels
+    "jpeg": 60,             # lowest JPEG quality
+    "margin": 0.15,         # background around the card, share of card width
+}
+
+FIELD_LABELS = ("Nama", "Tempat/Tgl Lahir", "Jenis Kelamin", "Alamat",
+                "RT/RW", "Kel/Desa", "Kecamatan", "Agama", "Pekerjaan")
+
+
+def random_nik(rng):
+    """Structurally valid NIK (see nik_validator)"""
+    province = rng.choice(sorted(PROVINCE_CODES))
+    regency = rng.randint(71, 79) if rng.random() < 0.2 else rng.randint(1, 30)
+    district = rng.randint(1, 40)
+    month = rng.randint(1, 12)
+    day = rng.randint(1, DAYS_IN_MONTH[month - 1])
+    if rng.random() < 0.5:
+        day += 40
+    return (f"{province}{regency:02d}{district:02d}{day:02d}{month:02d}"
+            f"{rng.randint(0, 99):02d}{rng.randint(1, 9999):04d}")
+
+
+def random_word(rng, length):
+    return "".join(rng.choice("ABCDEFGHIJKLMNOPRSTUWY") for _ in range(length))
+
+
+def fit_scale(text, font, thickness, height):
+    """Font scale that makes digits ``height`` px tall"""
+    (_, base_height), _ = cv2.getTextSize(text, font, 1.0, thickness)
+    return height / float(max(base_height, 1))
+
+
+def render_card(nik, rng):
+    """Upright, undistorted card in the canonical KTP frame"""
+    width, height = KTP_SIZE
+    # Light blue vertical gradient like the KTP background
+    top = np.array([rng.randint(225, 245), rng.randint(210, 230), rng.randint(185, 205)], np.float32)
+    ramp = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None, None]
+    card = (top * (1.0 - 0.08 * ramp)).repeat(width, axis=1).astype(np.uint8)
+
+    font = rng.choice(FONTS)
+    color = rng.choice(TEXT_COLORS)
+    thickness = rng.randint(2, 3)
+
+    for text, y in (("PROVINSI " + random_word(rng, 8), 0.06),
+                    ("KABUPATEN " + random_word(rng, 7), 0.11)):
+        scale = fit_scale(text, font, thickness, 0.035 * height)
+        (tw, _), _ = cv2.getTextSize(text, font, scale, thickness)
+        cv2.putText(card, text, ((width - tw) // 2, int(y * height)), font, scale, color,
+                    thickness, cv2.LINE_AA)
+
+    # NIK line inside the 15-25% / 20-75% window the detector crops
+    baseline = int(rng.uniform(0.215, 0.225) * height)
+    digit_height = rng.uniform(0.045, 0.055) * height
+    scale = fit_scale(nik, font, thickness + 1, digit_height)
+    cv2.putText(card, "NIK", (int(0.04 * width), baseline), font, scale, color,
+                thickness + 1, cv2.LINE_AA)
+    cv2.putText(card, ":", (int(0.17 * width), baseline), font, scale, color,
+                thickness + 1, cv2.LINE_AA)
+    cv2.putText(card, nik, (int(rng.uniform(0.21, 0.24) * width), baseline), font, scale,
+                color, thickness + 1, cv2.LINE_AA)
+
+    field_scale = fit_scale("Ag", font, thickness - 1, 0.028 * height)
+    for i, label in enumerate(FIELD_LABELS):
+        y = int((0.32 + i * 0.06) * height)
+        cv2.putText(card, label, (int(0.04 * width), y), font, field_scale, color,
+                    thickness - 1, cv2.LINE_AA)
+        cv2.putText(card, ": " + random_word(rng, rng.randint(4, 14)), (int(0.26 * width), y),
+                    font, field_scale, color, thickness - 1, cv2.LINE_AA)
+
+    # Photo placeholder
+    x1, y1 = int(0.76 * width), int(0.26 * height)
+    x2, y2 = int(0.95 * width), int(0.72 * height)
+    card[y1:y2, x1:x2] = rng.randint(90, 160)
+    return card
+
+
+def distort(card, rng, distortions=None):
+    """Place the card on a background and apply random photo distortions"""
+    limits = dict(DEFAULT_DISTORTIONS)
+    limits.update(distortions or {})
+    params = {}
+
+    h, w = card.shape[:2]
+    margin = int(rng.uniform(0.0, limits["margin"]) * w)
+    background = np.array([rng.randint(20, 120) for _ in range(3)], np.uint8)
+    canvas = np.empty((h + 2 * margin, w + 2 * margin, 3), np.uint8)
+    canvas[:] = background
+    canvas[margin:margin + h, margin:margin + w] = card
+    params["margin"] = margin
+
+    angle = rng.uniform(-limits["rotation"], limits["rotation"])
+    if abs(angle) > 0.05:
+        ch, cw = canvas.shape[:2]
+        matrix = cv2.getRotationMatrix2D((cw / 2.0, ch / 2.0), angle, 1.0)
+        canvas = cv2.warpAffine(canvas, matrix, (cw, ch), flags=cv2.INTER_LINEAR,
+                                borderValue=tuple(int(c) for c in background))
+    params["rotation"] = round(angle, 2)
+
+    gains = [1.0 + rng.uniform(-limits["color_cast"], limits["color_cast"]) for _ in range(3)]
+    canvas = np.clip(canvas.astype(np.float32) * np.array(gains, np.float32), 0, 255)
+    params["color_cast"] = [round(g, 3) for g in gains]
+
+    sigma = rng.uniform(0.0, limits["blur"])
+    if sigma > 0.3:
+        canvas = cv2.GaussianBlur(canvas, (0, 0), sigma)
+    params["blur"] = round(sigma, 2)
+
+    std = rng.uniform(0.0, limits["noise"])
+    if std > 0:
+        noise = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0.0, std, canvas.shape)
+        canvas = canvas + noise.astype(np.float32)
+    params["noise"] = round(std, 2)
+    canvas = np.clip(canvas, 0, 255).astype(np.uint8)
+
+    quality = rng.randint(int(limits["jpeg"]), 95)
+    ok, encoded = cv2.imencode(".jpg", canvas, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if ok:
+        canvas = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    params["jpeg"] = quality
+    return canvas, params
+
+
+def synthesize(count, seed=0, distortions=None):
+    """Yield ``(nik, image, params)`` for ``count`` reproducible synthetic cards"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        nik = random_nik(rng)
+        image, params = distort(render_card(nik, rng), rng, distortions)
+        yield nik, image, params
@@ -0,0 +1,93 @@
+"""Lightweight per-image instrumentation of the NIK pipeline.
+
+``NikExtractor.extract`` activates a ``Trace`` for the calling thread. Every
+function decorated with ``traced`` then adds its wall time, the pixel count
+of the image it was given and a call count under its stage name. Times are
+inclusive, so nested stages (e.g. ``ocr.image_to_data`` inside
+``recognize``) overlap. Without an active trace a decorated call costs one
+thread-local lookup.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+_local = threading.local()
+
+
+class Trace:
+    """Stage name -> calls, wall time and pixels, in first-seen order"""
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, seconds, pixels=0, calls=1):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {"calls": 0, "seconds": 0.0, "pixels": 0}
+        stage["calls"] += calls
+        stage["seconds"] += seconds
+        stage["pixels"] += pixels
+
+    def merge(self, other):
+        """Add another trace (or its ``to_dict``), e.g. from an ensemble worker"""
+        stages = other.to_dict() if isinstance(other, Trace) else (other or {})
+        for name, stage in stages.items():
+            self.add(name, stage["ms"] / 1000.0, stage["pixels"], stage["calls"])
+
+    def to_dict(self):
+        return {name: {"calls": s["calls"], "ms": round(s["seconds"] * 1000.0, 3),
+                       "pixels": s["pixels"]}
+                for name, s in self.stages.items()}
+
+    def summary(self, limit=4):
+        """Slowest stages as one line, e.g. ``ocr.image_to_data 3x 812ms``"""
+        slowest = sorted(self.stages.items(), key=lambda item: -item[1]["seconds"])[:limit]
+        parts = []
+        for name, s in slowest:
+            calls = f"{s['calls']}x " if s["calls"] > 1 else ""
+            parts.append(f"{name} {calls}{s['seconds'] * 1000.0:.0f}ms")
+        return " · ".join(parts)
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def activate(trace):
+    """Record traced calls of this thread into ``trace``"""
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def pixel_count(value):
+    shape = getattr(value, "shape", None)
+    if shape is None or len(shape) < 2:
+        return 0
+    return int(shape[0]) * int(shape[1])
+
+
+def traced(name):
+    """Decorator recording calls under ``name``; pixels come from the first image argument"""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = getattr(_local, "trace", None)
+            if trace is None:
+                return func(*args, **kwargs)
+            pixels = 0
+            for arg in args:
+                if hasattr(arg, "shape"):
+                    pixels = pixel_count(arg)
+                    break
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                trace.add(name, time.perf_counter() - start, pixels)
+        return wrapper
+    return decorate
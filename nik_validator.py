@@ -0,0 +1,258 @@
+"""Structural validation of Indonesian NIK numbers and constrained decoding.
+
+A NIK is laid out as::
+
+    PP RR DD ddmmyy SSSS
+    |  |  |  |      serial, 0001-9999
+    |  |  |  birth date, women have 40 added to the day
+    |  |  district (kecamatan)
+    |  regency (kabupaten 01-59, kota 71-79)
+    province
+
+``decode_nik`` turns a 16-digit OCR read with per-digit confidences (and,
+when the backend provides them, per-character alternatives) into the most
+likely read that passes these rules, so impossible reads are rejected
+without another OCR pass.
+"""
+import math
+
+NIK_LENGTH = 16
+
+# Province codes (Kemendagri), including the 2022 Papua provinces
+PROVINCE_CODES = {
+    "11": "Aceh",
+    "12": "Sumatera Utara",
+    "13": "Sumatera Barat",
+    "14": "Riau",
+    "15": "Jambi",
+    "16": "Sumatera Selatan",
+    "17": "Bengkulu",
+    "18": "Lampung",
+    "19": "Kepulauan Bangka Belitung",
+    "21": "Kepulauan Riau",
+    "31": "DKI Jakarta",
+    "32": "Jawa Barat",
+    "33": "Jawa Tengah",
+    "34": "DI Yogyakarta",
+    "35": "Jawa Timur",
+    "36": "Banten",
+    "51": "Bali",
+    "52": "Nusa Tenggara Barat",
+    "53": "Nusa Tenggara Timur",
+    "61": "Kalimantan Barat",
+    "62": "Kalimantan Tengah",
+    "63": "Kalimantan Selatan",
+    "64": "Kalimantan Timur",
+    "65": "Kalimantan Utara",
+    "71": "Sulawesi Utara",
+    "72": "Sulawesi Tengah",
+    "73": "Sulawesi Selatan",
+    "74": "Sulawesi Tenggara",
+    "75": "Gorontalo",
+    "76": "Sulawesi Barat",
+    "81": "Maluku",
+    "82": "Maluku Utara",
+    "91": "Papua",
+    "92": "Papua Barat",
+    "93": "Papua Selatan",
+    "94": "Papua Tengah",
+    "95": "Papua Pegunungan",
+    "96": "Papua Barat Daya",
+}
+
+# Kabupaten are numbered from 01, kota from 71
+MAX_KABUPATEN = 59
+MIN_KOTA = 71
+MAX_KOTA = 79
+
+DAYS_IN_MONTH = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# Digits Tesseract commonly mistakes for each other on KTP fonts, tried when
+# the backend gives no alternatives of its own
+VISUAL_CONFUSIONS = {
+    "0": "869", "1": "74", "2": "7", "3": "85", "4": "1",
+    "5": "63", "6": "508", "7": "12", "8": "036", "9": "80",
+}
+VISUAL_CONFUSION_WEIGHT = 0.3
+
+# Confidence assumed for digits read without one (e.g. image_to_string)
+DEFAULT_CONFIDENCE = 90.0
+
+BEAM_WIDTH = 64
+MAX_CANDIDATES = 4
+
+# About half of all random 16-digit strings decode to some valid NIK, so a
+# decoded read is only trusted as-is when the decoder rewrote at most this
+# many digits, each of them read with low confidence
+MAX_TRUSTED_REWRITES = 1
+
+# Confidence below which a digit counts as low confidence, the same mean the
+# PSM cascade needs from a valid NIK to stop
+DEFAULT_MIN_CONFIDENCE = 60.0
+
+
+def check_province(code):
+    return code in PROVINCE_CODES
+
+
+def check_regency(code):
+    value = int(code)
+    return 1 <= value <= MAX_KABUPATEN or MIN_KOTA <= value <= MAX_KOTA
+
+
+def check_district(code):
+    return code != "00"
+
+
+def check_birth_date(day_code, month_code):
+    day = int(day_code)
+    month = int(month_code)
+    if day > 40:
+        day -= 40
+    if not 1 <= month <= 12:
+        return False
+    return 1 <= day <= DAYS_IN_MONTH[month - 1]
+
+
+def check_serial(code):
+    return code != "0000"
+
+
+def check_nik(digits):
+    """List of structural problems, empty for a valid NIK"""
+    if len(digits) != NIK_LENGTH:
+        return [f"expected {NIK_LENGTH} digits, got {len(digits)}"]
+    if not digits.isdigit():
+        return ["contains non-digit characters"]
+
+    problems = []
+    if not check_province(digits[0:2]):
+        problems.append(f"unknown province code {digits[0:2]}")
+    if not check_regency(digits[2:4]):
+        problems.append(f"invalid regency code {digits[2:4]}")
+    if not check_district(digits[4:6]):
+        problems.append(f"invalid district code {digits[4:6]}")
+    if not check_birth_date(digits[6:8], digits[8:10]):
+        problems.append(f"invalid birth date {digits[6:8]}-{digits[8:10]}")
+    if not check_serial(digits[12:16]):
+        problems.append("serial number 0000")
+    return problems
+
+
+def is_valid_nik(digits):
+    return not check_nik(digits)
+
+
+def gender(digits):
+    """'F' when 40 was added to the birth day, 'M' otherwise, None if unknown"""
+    if len(digits) < 8 or not digits[6:8].isdigit():
+        return None
+    return "F" if int(digits[6:8]) > 40 else "M"
+
+
+# Rule to check once a prefix reaches the given length
+_PREFIX_CHECKS = {
+    2: lambda p: check_province(p[0:2]),
+    4: lambda p: check_regency(p[2:4]),
+    6: lambda p: check_district(p[4:6]),
+    10: lambda p: check_birth_date(p[6:8], p[8:10]),
+    16: lambda p: check_serial(p[12:16]),
+}
+
+
+def _position_candidates(i, read, confidence, alternatives, confusion):
+    """[(digit, probability)] for one position, most likely first"""
+    p_read = min(0.99, max(0.05, confidence / 100.0))
+    residual = 1.0 - p_read
+    weights = {}
+
+    if alternatives:
+        # Each alternative takes the share of the residual its own confidence
+        # earns, so a weak alternative cannot outweigh the read digit
+        for digit, conf in alternatives.items():
+            if digit != read and digit.isdigit():
+                share = residual * min(1.0, max(0.0, conf) / 100.0)
+                weights[digit] = max(weights.get(digit, 0.0), share)
+
+    if confusion is not None:
+        for digit, share in (confusion(i, read) or {}).items():
+            if digit != read:
+                weights[digit] = max(weights.get(digit, 0.0), residual * share)
+
+    visual = VISUAL_CONFUSIONS.get(read, "")
+    for digit in visual:
+        share = residual * VISUAL_CONFUSION_WEIGHT / len(visual)
+        weights[digit] = max(weights.get(digit, 0.0), share)
+
+    candidates = [(read, p_read)] + sorted(weights.items(), key=lambda item: -item[1])
+    return [(d, p) for d, p in candidates if p > 0][:MAX_CANDIDATES]
+
+
+def decode_nik(digits, confidences=None, alternatives=None, confusion=None,
+               beam_width=BEAM_WIDTH):
+    """Most likely valid NIK for a 16-digit read, or None.
+
+    ``confidences`` are per-digit 0-100 scores, ``alternatives`` an optional
+    per-position ``{digit: confidence}`` of other choices the OCR considered,
+    and ``confusion(position, read)`` an optional ``{digit: probability}``
+    learned from corrections. Each rule is checked as soon as its digits are
+    placed, so invalid prefixes are pruned from the beam early.
+
+    Returns ``(digits, confidences)`` with the chosen digit's probability
+    (0-100) at each position.
+    """
+    if len(digits) != NIK_LENGTH or not digits.isdigit():
+        return None
+    confidences = list(confidences or [])
+    alternatives = list(alternatives or [])
+
+    beam = [(0.0, "", [])]
+    for i, read in enumerate(digits):
+        confidence = confidences[i] if i < len(confidences) else DEFAULT_CONFIDENCE
+        options = _position_candidates(i, read, confidence,
+                                       alternatives[i] if i < len(alternatives) else None,
+                                       confusion)
+        check = _PREFIX_CHECKS.get(i + 1)
+
+        expanded = []
+        for score, prefix, probs in beam:
+            for digit, p in options:
+                candidate = prefix + digit
+                if check is not None and not check(candidate):
+                    continue
+                expanded.append((score + math.log(p), candidate, probs + [p * 100.0]))
+        if not expanded:
+            return None
+        expanded.sort(key=lambda item: -item[0])
+        beam = expanded[:beam_width]
+
+    _, best, probs = beam[0]
+    return best, probs
+
+
+def rewritten_positions(read, decoded):
+    """Positions where ``decoded`` differs from the OCR ``read``"""
+    return [i for i, (a, b) in enumerate(zip(read, decoded)) if a != b]
+
+
+def is_trusted_decode(read, confidences, decoded, low_confidence):
+    """True when ``decoded`` keeps the read, or only rewrites up to
+    ``MAX_TRUSTED_REWRITES`` digits read below ``low_confidence``"""
+    changed = rewritten_positions(read, decoded)
+    if len(changed) > MAX_TRUSTED_REWRITES:
+        return False
+    confidences = list(confidences or [])
+    return all(i < len(confidences) and confidences[i] < low_confidence for i in changed)
+
+
+def trusted_decode(digits, confidences=None, alternatives=None, confusion=None,
+                   low_confidence=DEFAULT_MIN_CONFIDENCE):
+    """``decode_nik`` when ``is_trusted_decode`` accepts the result, otherwise None.
+
+    An untrusted decode rewrites confidently read digits just to pass the
+    rules, so callers keep the read as is (and report it invalid) instead.
+    """
+    decoded = decode_nik(digits, confidences, alternatives, confusion)
+    if decoded is None or not is_trusted_decode(digits, confidences, decoded[0], low_confidence):
+        return None
+    return decoded
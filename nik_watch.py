@@ -0,0 +1,290 @@
+"""Watch a folder and extract NIKs from images as they land.
+
+    python nik_watch.py inbox/ -o results.jsonl
+    python nik_watch.py //branch-share/scans -o results.jsonl --poll --workers 4
+
+New files are picked up with inotify (``pip install inotify_simple``, Linux)
+or, without it or with ``--poll``, by scanning the folder a few times per
+second; use ``--poll`` on network shares, which do not deliver inotify
+events. Each image goes through the headless pipeline in a warm worker
+process, its row is appended to the output file and the image is moved to
+``done/`` (16 digits read) or ``failed/``.
+
+Queues between the stages are bounded: when the workers fall behind, the
+watcher stops taking new files instead of buffering without limit.
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from nik_batch import IMAGE_EXTENSIONS, ResultWriter, _init_worker, process_image
+from nik_engine import NikSettings, METHODS, OCR_ENGINES, DEFAULT_MIN_CONFIDENCE
+from ocr_backend import configure_tesseract
+
+try:
+    from inotify_simple import INotify, flags # type: ignore
+except ImportError:
+    INotify = None
+
+POLL_INTERVAL = 0.25
+
+
+def is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith('.')
+
+
+class PollingWatcher:
+    """Reports files whose size and mtime did not change between two scans"""
+    def __init__(self, folder, interval=POLL_INTERVAL):
+        self.folder = folder
+        self.interval = interval
+        self._last = {}
+
+    def poll(self):
+        current = {}
+        ready = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or not is_image(entry.name):
+                    continue
+                stat = entry.stat()
+                current[entry.path] = (stat.st_size, stat.st_mtime)
+                # Still being written while size or mtime keep moving
+                if stat.st_size > 0 and self._last.get(entry.path) == current[entry.path]:
+                    ready.append(entry.path)
+        self._last = current
+        return ready
+
+    def wait(self):
+        time.sleep(self.interval)
+        return self.poll()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Reports files as soon as their writer closes them or they are moved in"""
+    def __init__(self, folder):
+        self.folder = folder
+        self._inotify = INotify()
+        self._inotify.add_watch(folder, flags.CLOSE_WRITE | flags.MOVED_TO)
+
+    def poll(self):
+        """Files that were already there before the watch started"""
+        with os.scandir(self.folder) as entries:
+            return [e.path for e in entries if e.is_file() and is_image(e.name)]
+
+    def wait(self):
+        events = self._inotify.read(timeout=int(POLL_INTERVAL * 1000))
+        return [os.path.join(self.folder, e.name) for e in events if is_image(e.name)]
+
+    def close(self):
+        self._inotify.close()
+
+
+def file_signature(path):
+    """``(size, mtime)`` of ``path``, or None when it is gone"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def move_to(path, folder):
+    """Move ``path`` into ``folder`` without overwriting, returns the new path"""
+    os.makedirs(folder, exist_ok=True)
+    name = os.path.basename(path)
+    target = os.path.join(folder, name)
+    if os.path.exists(target):
+        stem, ext = os.path.splitext(name)
+        target = os.path.join(folder, f"{stem}_{time.strftime('%Y%m%d%H%M%S')}_{os.getpid()}{ext}")
+    os.replace(path, target)
+    return target
+
+
+class FolderIngest:
+    """watcher -> bounded queue -> worker pool (decode, detect, preprocess, OCR) -> writer.
+
+    ``queue_size`` bounds the files waiting for a worker and ``workers * 2``
+    the images in flight; the writer thread appends rows and moves files.
+    """
+    def __init__(self, folder, writer, settings, done_folder, failed_folder,
+                 workers=None, queue_size=64, poll=False, progress=True):
+        self.folder = folder
+        self.writer = writer
+        self.settings = settings
+        self.done_folder = done_folder
+        self.failed_folder = failed_folder
+        self.workers = workers or os.cpu_count() or 1
+        self.progress = progress
+        self.incoming = queue.Queue(maxsize=queue_size)
+        self.finished = queue.Queue()
+        self.stats = {"processed": 0, "complete": 0, "failed": 0}
+        self._slots = threading.Semaphore(self.workers * 2)
+        # Paths queued or in flight, so a rescan does not submit them twice
+        self._pending = set()
+        # Files that could not be moved away, by signature, so every rescan
+        # does not extract and append them again; a replaced file differs
+        self._unmoved = {}
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        if poll or INotify is None:
+            self.watcher = PollingWatcher(folder)
+        else:
+            self.watcher = InotifyWatcher(folder)
+
+    def _enqueue(self, paths):
+        for path in paths:
+            with self._pending_lock:
+                # Already queued, moved away after a scan listed it, or
+                # already processed and left in place by a failed move
+                if path in self._pending:
+                    continue
+                signature = file_signature(path)
+                if signature is None or self._unmoved.get(path) == signature:
+                    continue
+                self._unmoved.pop(path, None)
+                self._pending.add(path)
+            # Blocks while the pipeline is full: back-pressure on the watcher
+            while not self._stop.is_set():
+                try:
+                    self.incoming.put(path, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def _watch(self):
+        try:
+            self._enqueue(self.watcher.poll())
+            while not self._stop.is_set():
+                self._enqueue(self.watcher.wait())
+        finally:
+            self.watcher.close()
+
+    def _write(self):
+        while True:
+            item = self.finished.get()
+            if item is None:
+                return
+            path, future = item
+            try:
+                row = future.result()
+            except Exception as e:
+                if self._stop.is_set():
+                    # Interrupted with the pool, leave the file for the next run
+                    self._finish(path)
+                    continue
+                row = {"path": path, "error": f"{type(e).__name__}: {e}"}
+
+            ok = not row.get("error") and row.get("digit_count") == 16
+            try:
+                row["moved_to"] = move_to(path, self.done_folder if ok else self.failed_folder)
+            except OSError as e:
+                row.setdefault("error", f"move failed: {e}")
+                print(f"could not move {path}: {e}", file=sys.stderr)
+                with self._pending_lock:
+                    self._unmoved[path] = file_signature(path)
+            self.writer.write(row)
+
+            self.stats["processed"] += 1
+            self.stats["complete" if ok else "failed"] += 1
+            self._finish(path)
+            if self.progress:
+                print(f"{row.get('nik', '-')}  {os.path.basename(path)}  "
+                      f"{row.get('seconds', 0):.2f}s", file=sys.stderr)
+
+    def _finish(self, path):
+        with self._pending_lock:
+            self._pending.discard(path)
+        self._slots.release()
+
+    def run(self):
+        """Process files until interrupted"""
+        self.writer.open()
+        watcher = threading.Thread(target=self._watch, name="nik-watch", daemon=True)
+        writer = threading.Thread(target=self._write, name="nik-writer", daemon=True)
+        writer.start()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self.settings.to_dict(),)) as pool:
+                watcher.start()
+                try:
+                    while True:
+                        try:
+                            path = self.incoming.get(timeout=0.5)
+                        except queue.Empty:
+                            continue
+                        self._slots.acquire()
+                        future = pool.submit(process_image, path)
+                        future.add_done_callback(lambda f, path=path: self.finished.put((path, f)))
+                except KeyboardInterrupt:
+                    # Before the pool drains, so interrupted images stay in the folder
+                    self._stop.set()
+                    raise
+        finally:
+            self._stop.set()
+            # The pool has drained on exit, so every submitted image is in the queue
+            self.finished.put(None)
+            writer.join()
+            self.writer.close()
+        return self.stats
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Extract NIKs from images dropped into a folder")
+    parser.add_argument("folder", help="Folder to watch (top level only)")
+    parser.add_argument("-o", "--output", default="nik_results.jsonl",
+                        help="Output file (.jsonl or .csv), rows appended as images finish")
+    parser.add_argument("--done", help="Folder for read images (default: <folder>/done)")
+    parser.add_argument("--failed", help="Folder for failed images (default: <folder>/failed)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="Files waiting for a worker before the watcher pauses")
+    parser.add_argument("--poll", action="store_true",
+                        help="Scan the folder instead of inotify (network shares)")
+    parser.add_argument("--method", choices=METHODS, default="adaptive")
+    parser.add_argument("--tesseract", metavar="PATH",
+                        help="tesseract binary (default: $TESSERACT_CMD or from PATH)")
+    parser.add_argument("--ocr", choices=OCR_ENGINES, default="tesseract")
+    parser.add_argument("--corrections", metavar="DB", help="Apply stored corrections")
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE)
+    parser.add_argument("-q", "--quiet", action="store_true", help="No per-image output")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.tesseract:
+        configure_tesseract(args.tesseract)
+    if not os.path.isdir(args.folder):
+        build_parser().error(f"not a folder: {args.folder}")
+
+    settings = NikSettings(method=args.method, ocr_engine=args.ocr,
+                           corrections_path=args.corrections,
+                           min_confidence=args.min_confidence)
+    ingest = FolderIngest(args.folder, ResultWriter(args.output), settings,
+                          done_folder=args.done or os.path.join(args.folder, "done"),
+                          failed_folder=args.failed or os.path.join(args.folder, "failed"),
+                          workers=args.workers, queue_size=args.queue_size,
+                          poll=args.poll, progress=not args.quiet)
+    mode = "polling" if isinstance(ingest.watcher, PollingWatcher) else "inotify"
+    print(f"Watching {args.folder} ({mode}), Ctrl+C to stop", file=sys.stderr)
+    try:
+        stats = ingest.run()
+    except KeyboardInterrupt:
+        stats = ingest.stats
+    print(json.dumps(stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""OCR backends used by the NIK engine.
+
+``pytesseract`` starts a new tesseract process (and reloads traineddata) on
+every call. When ``tesserocr`` is installed we keep one initialised
+TessBaseAPI per thread instead and only switch the page segmentation mode and
+whitelist between calls, so a card costs zero process launches.
+
+Both backends return the same dict layout as ``pytesseract.Output.DICT``.
+Only tesserocr exposes per-character alternatives (``image_to_symbols``);
+the pytesseract backend returns None there. ``AsyncTesseract`` runs the same
+CLI as an asyncio subprocess, for the pipeline in nik_async.
+"""
+import asyncio
+import os
+import threading
+
+import cv2 # type: ignore
+import pytesseract # type: ignore
+
+from nik_trace import traced
+
+try:
+    import tesserocr # type: ignore
+except ImportError:
+    tesserocr = None
+
+# Default location of the Windows installer, used when it exists
+WINDOWS_TESSERACT = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+DIGIT_WHITELIST = "0123456789"
+
+# A single pass failing on one strip. A missing binary or a broken install
+# raises something else and is not retried with the next PSM.
+OCR_PASS_ERRORS = (pytesseract.TesseractError,)
+
+
+class EngineUnavailable(RuntimeError):
+    """The OCR engine cannot run at all, e.g. the tesseract binary is missing"""
+
+
+# No image can be read while these are raised, batch runs stop on them.
+# TesseractNotFoundError does not survive pickling, workers re-raise it as
+# EngineUnavailable.
+ENGINE_ERRORS = (EngineUnavailable, pytesseract.TesseractNotFoundError)
+
+DATA_KEYS = ("level", "block_num", "par_num", "line_num", "word_num",
+             "left", "top", "width", "height", "conf", "text")
+
+
+class PytesseractBackend:
+    """Subprocess backend, one tesseract launch per call"""
+    name = "pytesseract"
+
+    def __init__(self, lang="eng", oem=3):
+        self.lang = lang
+        self.oem = oem
+
+    def build_config(self, psm, whitelist=None):
+        config = f'--oem {self.oem} --psm {psm}'
+        if whitelist:
+            config += f' -c tessedit_char_whitelist={whitelist}'
+        return config
+
+    @traced("ocr.image_to_string")
+    def image_to_string(self, image, psm=7, whitelist=None):
+        return pytesseract.image_to_string(image, lang=self.lang,
+                                           config=self.build_config(psm, whitelist))
+
+    @traced("ocr.image_to_data")
+    def image_to_data(self, image, psm=7, whitelist=None):
+        return pytesseract.image_to_data(image, lang=self.lang,
+                                         config=self.build_config(psm, whitelist),
+                                         output_type=pytesseract.Output.DICT)
+
+    def image_to_symbols(self, image, psm=7, whitelist=None):
+        """Not available from the tesseract CLI"""
+        return None
+
+    def close(self):
+        pass
+
+
+def configure_tesseract(cmd=None):
+    """Point pytesseract and AsyncTesseract at the tesseract binary, returns its path.
+
+    Uses ``cmd``, else ``$TESSERACT_CMD``, else the Windows default install
+    when it exists, else ``tesseract`` from PATH. A given ``cmd`` is also
+    put in the environment so worker processes pick it up.
+    """
+    if cmd:
+        os.environ["TESSERACT_CMD"] = cmd
+    cmd = cmd or os.environ.get("TESSERACT_CMD")
+    if not cmd and os.path.exists(WINDOWS_TESSERACT):
+        cmd = WINDOWS_TESSERACT
+    pytesseract.pytesseract.tesseract_cmd = cmd or "tesseract"
+    return pytesseract.pytesseract.tesseract_cmd
+
+
+configure_tesseract()
+
+
+def parse_tsv(text):
+    """Tesseract's ``tsv`` output as an ``image_to_data`` dict"""
+    data = {key: [] for key in DATA_KEYS}
+    lines = text.splitlines()
+    if not lines:
+        return data
+    header = lines[0].split("\t")
+    for line in lines[1:]:
+        values = line.split("\t")
+        # The text column is dropped on rows without text
+        values += [""] * (len(header) - len(values))
+        row = dict(zip(header, values))
+        for key in DATA_KEYS:
+            value = row.get(key, "")
+            if key == "text":
+                data[key].append(value)
+            elif key == "conf":
+                data[key].append(float(value or -1))
+            else:
+                data[key].append(int(value or 0))
+    return data
+
+
+class AsyncTesseract:
+    """Tesseract CLI as asyncio subprocesses, one launch per call.
+
+    Takes the strip already encoded as PNG, so the event loop only pipes
+    bytes while the process starts up and recognises.
+    """
+    name = "tesseract-async"
+
+    def __init__(self, lang="eng", oem=3, cmd=None):
+        self.lang = lang
+        self.oem = oem
+        self.cmd = cmd
+
+    def build_args(self, psm, whitelist=None):
+        cmd = self.cmd or pytesseract.pytesseract.tesseract_cmd
+        args = [cmd, "stdin", "stdout", "-l", self.lang,
+                "--oem", str(self.oem), "--psm", str(psm)]
+        if whitelist:
+            args += ["-c", f"tessedit_char_whitelist={whitelist}"]
+        return args + ["tsv"]
+
+    async def image_to_data(self, png, psm=7, whitelist=None):
+        args = self.build_args(psm, whitelist)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args, stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            raise EngineUnavailable(f"cannot run {args[0]}: {e}") from e
+        out, err = await process.communicate(png)
+        if process.returncode != 0:
+            message = err.decode("utf-8", errors="replace").strip()
+            raise pytesseract.TesseractError(process.returncode, message)
+        return parse_tsv(out.decode("utf-8", errors="replace"))
+
+
+class TesserocrBackend:
+    """In-process backend, keeps a loaded TessBaseAPI per thread and reuses it"""
+    name = "tesserocr"
+
+    def __init__(self, lang="eng", oem=3, tessdata=None):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr is not installed")
+        self.lang = lang
+        self.oem = oem
+        self.tessdata = tessdata or os.environ.get("TESSDATA_PREFIX")
+        # TessBaseAPI is not thread-safe, so each thread gets its own engine
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+
+    def _api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            kwargs = {"lang": self.lang, "oem": self.oem}
+            if self.tessdata:
+                kwargs["path"] = self.tessdata
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            # Keep the LSTM's alternative characters for the NIK decoder
+            api.SetVariable("lstm_choice_mode", "2")
+            self._local.api = api
+            self._local.whitelist = None
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def _prepare(self, image, psm, whitelist):
+        api = self._api()
+        api.SetPageSegMode(psm)
+        if whitelist != self._local.whitelist:
+            api.SetVariable("tessedit_char_whitelist", whitelist or "")
+            self._local.whitelist = whitelist
+
+        if len(image.shape) == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            bpp = 3
+        else:
+            bpp = 1
+        height, width = image.shape[:2]
+        api.SetImageBytes(image.tobytes(), width, height, bpp, width * bpp)
+        return api
+
+    @traced("ocr.image_to_string")
+    def image_to_string(self, image, psm=7, whitelist=None):
+        api = self._prepare(image, psm, whitelist)
+        return api.GetUTF8Text()
+
+    @traced("ocr.image_to_data")
+    def image_to_data(self, image, psm=7, whitelist=None):
+        api = self._prepare(image, psm, whitelist)
+        api.Recognize()
+        data = {key: [] for key in DATA_KEYS}
+
+        iterator = api.GetIterator()
+        if iterator is None:
+            return data
+
+        RIL = tesserocr.RIL
+        block = par = line = word = 0
+        for r in tesserocr.iterate_level(iterator, RIL.WORD):
+            text = r.GetUTF8Text(RIL.WORD)
+            if text is None:
+                continue
+            if r.IsAtBeginningOf(RIL.BLOCK):
+                block += 1
+                par = line = 0
+            if r.IsAtBeginningOf(RIL.PARA):
+                par += 1
+                line = 0
+            if r.IsAtBeginningOf(RIL.TEXTLINE):
+                line += 1
+                word = 0
+            word += 1
+            bbox = r.BoundingBox(RIL.WORD)
+            if bbox is None:
+                continue
+            x1, y1, x2, y2 = bbox
+            row = (5, block, par, line, word, x1, y1, x2 - x1, y2 - y1,
+                   r.Confidence(RIL.WORD), text)
+            for key, value in zip(DATA_KEYS, row):
+                data[key].append(value)
+        return data
+
+    @traced("ocr.image_to_symbols")
+    def image_to_symbols(self, image, psm=7, whitelist=None):
+        """Per-character reads as ``[(text, conf, {alternative: conf})]``"""
+        api = self._prepare(image, psm, whitelist)
+        api.Recognize()
+        symbols = []
+
+        iterator = api.GetIterator()
+        if iterator is None:
+            return symbols
+
+        RIL = tesserocr.RIL
+        for r in tesserocr.iterate_level(iterator, RIL.SYMBOL):
+            text = r.GetUTF8Text(RIL.SYMBOL)
+            if not text:
+                continue
+            choices = {}
+            for choice in r.GetChoiceIterator():
+                alt = choice.GetUTF8Text()
+                if alt and alt != text:
+                    choices[alt] = max(choices.get(alt, 0.0), choice.Confidence())
+            symbols.append((text, r.Confidence(RIL.SYMBOL), choices))
+        return symbols
+
+    def close(self):
+        with self._lock:
+            for api in self._apis:
+                api.End()
+            self._apis = []
+        self._local = threading.local()
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name="auto", lang="eng"):
+    """Return the process-wide backend, created once and reused.
+
+    ``auto`` picks tesserocr when it is installed and falls back to
+    pytesseract otherwise. Can be forced with the ``NIK_OCR_BACKEND`` env var.
+    """
+    name = os.environ.get("NIK_OCR_BACKEND", name)
+    if name == "auto":
+        name = "tesserocr" if tesserocr is not None else "pytesseract"
+
+    key = (name, lang)
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            if name == "tesserocr":
+                backend = TesserocrBackend(lang=lang)
+            elif name == "pytesseract":
+                backend = PytesseractBackend(lang=lang)
+            else:
+                raise ValueError(f"Unknown OCR backend: {name}")
+            _backends[key] = backend
+    return backend
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+
+from dataset_store import DatasetStore
+from digit_classifier import load_folder_dataset
+
+
+def crop(value):
+    image = np.full((40, 24), 255, np.uint8)
+    image[8:32, 8:16] = value
+    return image
+
+
+def test_same_crop_and_label_is_stored_once(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    assert store.add(crop(0), "8") is not None
+    assert store.add(crop(0), "8") is None
+    assert store.total == 1
+
+
+def test_corrected_label_replaces_the_stored_one(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    store.add(crop(0), "8")
+    store.add(crop(60), "1")
+    assert store.add(crop(0), "3")["label"] == "3"
+    assert store.total == 2
+    assert (store.counts["8"], store.counts["3"]) == (0, 1)
+    assert [r["label"] for r in store.iter_records()] == ["3", "1"]
+
+    # Same after reopening, and after recounting from the manifest
+    assert DatasetStore(str(tmp_path)).counts == store.counts
+    os.remove(store.state_path)
+    rebuilt = DatasetStore(str(tmp_path))
+    assert rebuilt.counts == store.counts
+    assert [r["label"] for r in rebuilt.iter_records()] == ["3", "1"]
+
+
+def test_relabel_moves_the_png_to_the_new_label(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    store.add(crop(0), "8")
+    record = store.add(crop(0), "3")
+    assert record["file"].startswith("3/")
+    assert os.path.exists(os.path.join(str(tmp_path), record["file"]))
+    assert [r["file"] for r in store.iter_records()] == [record["file"]]
+    _, labels = load_folder_dataset(str(tmp_path))
+    assert labels.tolist() == [3]
+
+
+def test_relabel_updates_packed_shard(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    store.add(crop(0), "8")
+    store.pack()
+    store.add(crop(0), "3")
+    _, labels = store.load_arrays()
+    assert labels.tolist() == [3]
+
+
+def test_add_does_not_read_the_manifest(tmp_path):
+    DatasetStore(str(tmp_path)).add(crop(0), "8")
+    store = DatasetStore(str(tmp_path))
+
+    def fail():
+        raise AssertionError("manifest read")
+
+    store._iter_lines = fail
+    assert store.add(crop(0), "8") is None
+    assert store.add(crop(60), "1") is not None
+
+
+def test_state_does_not_grow_with_the_dataset(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    store.add(crop(0), "8")
+    store.add(crop(1), "1")
+    size = os.path.getsize(store.state_path)
+    for value in range(2, 50):
+        store.add(crop(value), "1")
+    assert os.path.getsize(store.state_path) <= size + 8
+
+
+def test_lost_index_is_rebuilt_from_the_manifest(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    store.add(crop(0), "8")
+    store.add(crop(0), "3")
+    store._conn.close()
+    os.remove(os.path.join(str(tmp_path), "index.db"))
+
+    reopened = DatasetStore(str(tmp_path))
+    assert reopened.add(crop(0), "3") is None
+    assert (reopened.total, reopened.counts["3"]) == (1, 1)
@@ -0,0 +1,42 @@
+import random
+
+import cv2
+
+from image_loader import extract_loaded, open_image
+from nik_engine import NikExtractor, NikSettings
+from nik_synth import distort, render_card
+
+
+class NoDigits:
+    def image_to_symbols(self, image, psm=7, whitelist=None):
+        return None
+
+    def image_to_data(self, image, psm=7, whitelist=None):
+        return {"text": [], "conf": []}
+
+
+def test_full_resolution_reread_stays_rectified(tmp_path):
+    rng = random.Random(3)
+    image, _ = distort(render_card("3201014501900001", rng), rng,
+                       {"rotation": 8.0, "blur": 0.0, "noise": 0.0, "jpeg": 95})
+    path = str(tmp_path / "ktp.jpg")
+    cv2.imwrite(path, cv2.resize(image, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC))
+    loaded = open_image(path)
+    assert loaded.reduction > 1
+
+    extractor = NikExtractor(NikSettings(method="adaptive"), backend=NoDigits())
+    strips = []
+    extract = extractor.extract
+
+    def spy(image, **kwargs):
+        result = extract(image, **kwargs)
+        strips.append(result.roi.shape[:2])
+        return result
+
+    extractor.extract = spy
+    result = extract_loaded(extractor, loaded)
+    assert result.card_rectified
+    # Working read, then the full-resolution re-read of the same flat strip
+    (h, w), (full_h, full_w) = strips
+    assert full_w > w
+    assert abs(full_w / full_h - w / h) < 0.05 * (w / h)
@@ -0,0 +1,27 @@
+import asyncio
+import random
+
+import cv2
+import pytest
+
+from nik_async import AsyncPipeline
+from nik_engine import NikSettings
+from nik_synth import render_card
+from ocr_backend import AsyncTesseract, EngineUnavailable
+
+
+@pytest.mark.parametrize("method", ["adaptive", "auto"])
+def test_missing_tesseract_stops_the_run(tmp_path, method):
+    paths = []
+    for i in range(3):
+        paths.append(str(tmp_path / f"card{i}.png"))
+        cv2.imwrite(paths[-1], render_card("3201014501900001", random.Random(i)))
+    pipeline = AsyncPipeline(NikSettings(method=method),
+                             tesseract=AsyncTesseract(cmd=str(tmp_path / "tesseract")))
+    rows = []
+    try:
+        with pytest.raises(EngineUnavailable):
+            asyncio.run(pipeline.run(paths, rows.append))
+    finally:
+        pipeline.close()
+    assert rows == []
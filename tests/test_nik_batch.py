@@ -0,0 +1,46 @@
+import random
+
+import cv2
+import pytesseract
+import pytest
+
+import nik_batch
+from nik_engine import NikExtractor, NikSettings
+from nik_synth import render_card
+from ocr_backend import EngineUnavailable
+
+
+class MissingTesseract:
+    def image_to_symbols(self, image, psm=7, whitelist=None):
+        return None
+
+    def image_to_data(self, image, psm=7, whitelist=None):
+        raise pytesseract.TesseractNotFoundError()
+
+
+@pytest.mark.parametrize("name", ["out.jsonl", "out.csv"])
+def test_resume_retries_rows_with_an_error(tmp_path, name):
+    writer = nik_batch.ResultWriter(str(tmp_path / name))
+    writer.open()
+    writer.write({"path": "a.jpg", "nik": "3201014501900001"})
+    writer.write({"path": "b.jpg", "error": "failed to load image"})
+    writer.close()
+    assert writer.completed_paths() == {"a.jpg"}
+
+
+def test_missing_engine_stops_the_batch(tmp_path, monkeypatch):
+    paths = []
+    for i in range(2):
+        paths.append(str(tmp_path / f"card{i}.png"))
+        cv2.imwrite(paths[-1], render_card("3201014501900001", random.Random(i)))
+
+    def init_worker(settings):
+        nik_batch._extractor = NikExtractor(NikSettings(**settings), backend=MissingTesseract())
+
+    monkeypatch.setattr(nik_batch, "_init_worker", init_worker)
+    output = tmp_path / "out.jsonl"
+    writer = nik_batch.ResultWriter(str(output))
+    with pytest.raises(EngineUnavailable):
+        nik_batch.run_batch(paths, writer, NikSettings(), workers=1, progress=False)
+    assert output.read_text() == ""
+    assert writer.completed_paths() == set()
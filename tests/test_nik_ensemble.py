@@ -0,0 +1,33 @@
+from nik_ensemble import vote_reads
+
+VALID = "3201014501900001"
+OTHER = "3201014501900007"
+
+
+def test_two_agreeing_reads_beat_one():
+    digits, _, _ = vote_reads([(VALID, [90.0] * 16), (VALID, [85.0] * 16),
+                               (OTHER, [95.0] * 16)])
+    assert digits == VALID
+
+
+def test_minority_read_does_not_win():
+    digits, confs, _ = vote_reads([(VALID, [90.0] * 16), (OTHER, [40.0] * 16)])
+    assert digits == VALID
+    assert confs[15] < 90.0
+
+
+def test_agreement_keeps_the_best_confidence():
+    _, confs, _ = vote_reads([(VALID, [90.0] * 16), (VALID, [40.0] * 16)])
+    assert confs == [90.0] * 16
+
+
+def test_without_full_reads_the_longest_wins():
+    assert vote_reads([("3201", [90.0] * 4), ("320101", [50.0] * 6)])[0] == "320101"
+    assert vote_reads([]) == ("", [], "")
+
+
+def test_agreed_digits_are_not_rewritten():
+    # Every method read the same invalid number with high confidence
+    read = "5716476167788960"
+    digits, _, plurality = vote_reads([(read, [95.0] * 16), (read, [90.0] * 16)])
+    assert digits == plurality == read
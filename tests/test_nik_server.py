@@ -0,0 +1,59 @@
+import json
+import random
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import pytesseract
+import pytest
+
+import nik_server
+from nik_engine import NikExtractor, NikSettings
+from nik_synth import render_card
+from ocr_backend import EngineUnavailable
+
+
+class MissingTesseract:
+    def image_to_symbols(self, image, psm=7, whitelist=None):
+        return None
+
+    def image_to_data(self, image, psm=7, whitelist=None):
+        raise pytesseract.TesseractNotFoundError()
+
+
+@pytest.fixture
+def missing_engine(monkeypatch):
+    monkeypatch.setattr(nik_server, "_extractor",
+                        NikExtractor(NikSettings(), backend=MissingTesseract()))
+
+
+def card_png():
+    return cv2.imencode(".png", render_card("3201014501900001", random.Random(0)))[1].tobytes()
+
+
+def test_missing_engine_fails_the_batch(missing_engine):
+    with pytest.raises(EngineUnavailable):
+        nik_server.process_batch([{"image": card_png()}])
+
+
+def test_missing_engine_returns_503(missing_engine):
+    metrics = nik_server.Metrics()
+    pool = ThreadPoolExecutor(1)
+    batcher = nik_server.MicroBatcher(pool, 1, metrics, window=0.0)
+    server = nik_server.NikServer(("127.0.0.1", 0), batcher, metrics, 1, timeout=30.0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        request = urllib.request.Request(f"http://127.0.0.1:{server.server_port}/extract",
+                                         data=card_png(), headers={"Content-Type": "image/png"})
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request, timeout=30)
+        assert error.value.code == 503
+        assert json.loads(error.value.read())["error"].startswith("OCR engine unavailable")
+    finally:
+        server.shutdown()
+        server.server_close()
+        batcher.close()
+        pool.shutdown()
@@ -0,0 +1,40 @@
+from nik_validator import decode_nik, is_trusted_decode, is_valid_nik
+
+VALID = "3201014501900001"
+
+
+def test_valid_read_is_kept():
+    digits, confs = decode_nik(VALID, [95] * 16)
+    assert digits == VALID
+    assert confs == [95.0] * 16
+
+
+def test_low_confidence_alternative_does_not_beat_read():
+    alternatives = [{}] * 15 + [{"7": 2.0}]
+    digits, _ = decode_nik(VALID, [95] * 15 + [45], alternatives)
+    assert digits == VALID
+
+
+def test_confident_alternative_fixes_invalid_read():
+    # Month 91 is impossible, the OCR's second choice "0" makes it valid
+    read = "3201014591900001"
+    alternatives = [{}] * 8 + [{"0": 80.0}] + [{}] * 7
+    digits, _ = decode_nik(read, [95] * 8 + [40] + [95] * 7, alternatives)
+    assert digits == VALID
+
+
+def test_reads_that_are_not_16_digits_are_rejected():
+    assert decode_nik(VALID[:15], [99] * 15) is None
+    assert decode_nik(VALID[:15] + "?", [99] * 16) is None
+    assert not is_valid_nik("0000000000000000")
+
+
+def test_trusted_decode_allows_one_low_confidence_rewrite():
+    confs = [95] * 8 + [40] + [95] * 7
+    assert is_trusted_decode(VALID, confs, VALID, 60)
+    assert is_trusted_decode("3201014591900001", confs, VALID, 60)
+
+
+def test_trusted_decode_rejects_confident_or_many_rewrites():
+    assert not is_trusted_decode("3201014591900001", [95] * 16, VALID, 60)
+    assert not is_trusted_decode("3201014591900007", [40] * 16, VALID, 60)
@@ -0,0 +1,53 @@
+import os
+from concurrent.futures import Future
+
+from nik_engine import NikSettings
+from nik_watch import FolderIngest
+
+
+class ListWriter:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+
+def process(ingest, row):
+    """One pass through the writer stage for every queued path"""
+    while not ingest.incoming.empty():
+        path = ingest.incoming.get()
+        future = Future()
+        future.set_result(dict(row, path=path))
+        ingest.finished.put((path, future))
+    ingest.finished.put(None)
+    ingest._write()
+
+
+def test_unmoved_file_is_not_processed_again(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    image = inbox / "ktp.jpg"
+    image.write_bytes(b"scan")
+    # A file where the done folder should be, so the move fails
+    blocked = tmp_path / "done"
+    blocked.write_bytes(b"")
+    writer = ListWriter()
+    ingest = FolderIngest(str(inbox), writer, NikSettings(), str(blocked),
+                          str(tmp_path / "failed"), workers=1, poll=True, progress=False)
+
+    row = {"nik": "3201014501900001", "digit_count": 16}
+    ingest._enqueue([str(image)])
+    process(ingest, row)
+    assert len(writer.rows) == 1
+    assert writer.rows[0]["error"].startswith("move failed")
+
+    ingest._enqueue([str(image)])
+    assert ingest.incoming.empty()
+
+    # A new scan saved under the same name is picked up again
+    image.write_bytes(b"new scan")
+    os.utime(image, (1, 1))
+    ingest._enqueue([str(image)])
+    process(ingest, row)
+    assert len(writer.rows) == 2
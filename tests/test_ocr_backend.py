@@ -0,0 +1,21 @@
+import pytesseract
+
+import ocr_backend
+from ocr_backend import AsyncTesseract, configure_tesseract
+
+
+def test_tesseract_comes_from_path_without_configuration(monkeypatch, tmp_path):
+    monkeypatch.setattr(pytesseract.pytesseract, "tesseract_cmd", "unset")
+    monkeypatch.setattr(ocr_backend, "WINDOWS_TESSERACT", str(tmp_path / "missing.exe"))
+    monkeypatch.delenv("TESSERACT_CMD", raising=False)
+    assert configure_tesseract() == "tesseract"
+    assert AsyncTesseract().build_args(7)[0] == "tesseract"
+
+
+def test_tesseract_from_environment_and_flag(monkeypatch):
+    monkeypatch.setattr(pytesseract.pytesseract, "tesseract_cmd", "unset")
+    monkeypatch.setenv("TESSERACT_CMD", "/opt/tesseract")
+    assert configure_tesseract() == "/opt/tesseract"
+    # A flag wins and reaches worker processes through the environment
+    assert configure_tesseract("/usr/local/bin/tesseract") == "/usr/local/bin/tesseract"
+    assert ocr_backend.os.environ["TESSERACT_CMD"] == "/usr/local/bin/tesseract"
@@ -0,0 +1,40 @@
+from nik_engine import NikSettings, PsmCascade
+
+VALID = "3201014501900001"
+
+
+def test_cascade_stops_on_valid_confident_read():
+    cascade = PsmCascade(NikSettings(min_confidence=60))
+    assert cascade.offer(7, VALID, [90.0] * 16)
+    digits, _, psm, passes, _ = cascade.result()
+    assert (digits, psm, passes) == (VALID, 7, 1)
+
+
+def test_cascade_does_not_stop_on_heavily_rewritten_read():
+    # Decodable, but only by rewriting several confidently read digits
+    read = "3201014519900000"
+    cascade = PsmCascade(NikSettings(min_confidence=60))
+    assert not cascade.offer(7, read, [90.0] * 16)
+    assert cascade.offer(8, VALID, [80.0] * 16)
+    digits, _, psm, _, _ = cascade.result()
+    assert (digits, psm) == (VALID, 8)
+
+
+def test_untrusted_decode_keeps_the_raw_read():
+    # Decodes to 5116476107788960, but only by rewriting two 95% digits
+    read = "5716476167788960"
+    cascade = PsmCascade(NikSettings(min_confidence=60))
+    assert not cascade.offer(7, read, [95.0] * 16)
+    digits, confs, _, _, ocr_raw = cascade.result()
+    assert digits == ocr_raw == read
+    assert confs == [95.0] * 16
+
+
+def test_trusted_decode_keeps_the_ocr_read():
+    read = "3201014591900001"
+    confs = [90.0] * 16
+    confs[8] = 30.0
+    cascade = PsmCascade(NikSettings(min_confidence=60))
+    cascade.offer(7, read, confs)
+    digits, _, _, _, ocr_raw = cascade.result()
+    assert (digits, ocr_raw) == (VALID, read)
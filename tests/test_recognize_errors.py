@@ -0,0 +1,47 @@
+import numpy as np
+import pytesseract
+import pytest
+
+from nik_engine import NikExtractor, NikSettings
+
+VALID = "3201014501900001"
+
+
+class FlakyBackend:
+    """Raises ``errors`` one per call, then reads VALID"""
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def image_to_symbols(self, image, psm=7, whitelist=None):
+        return None
+
+    def image_to_data(self, image, psm=7, whitelist=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"text": [VALID], "conf": [90.0]}
+
+
+def recognize(backend):
+    extractor = NikExtractor(NikSettings(min_confidence=60), backend=backend)
+    return extractor.recognize(np.full((40, 400), 255, np.uint8))
+
+
+def test_failed_pass_moves_on_to_next_psm():
+    backend = FlakyBackend(pytesseract.TesseractError(1, "bad image"))
+    digits, _, _, passes, _ = recognize(backend)
+    assert (digits, passes, backend.calls) == (VALID, 1, 2)
+
+
+def test_missing_tesseract_propagates():
+    backend = FlakyBackend(pytesseract.TesseractNotFoundError())
+    with pytest.raises(pytesseract.TesseractNotFoundError):
+        recognize(backend)
+    assert backend.calls == 1
+
+
+def test_every_pass_failing_is_reported():
+    backend = FlakyBackend(*[pytesseract.TesseractError(1, "no eng.traineddata")] * 20)
+    with pytest.raises(pytesseract.TesseractError):
+        recognize(backend)